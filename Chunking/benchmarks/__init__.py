@@ -0,0 +1 @@
+"""Benchmark offline della pipeline di chunking (esclusi dal deploy tramite .funcignore)."""
@@ -0,0 +1,150 @@
+"""Confronto tra le modalità di calcolo degli embeddings dei chunk: nuova codifica contro media delle unità.
+
+Per ogni PDF vengono generate unità, embeddings delle unità e chunk con la pipeline di
+`function_app`; gli embeddings dei chunk sono poi calcolati in ciascuna modalità
+(`encode`, `mean`, `weighted`) misurandone il tempo. La qualità di recupero è valutata con una
+ricerca esatta (coseno) sull'insieme dei chunk di tutti i PDF:
+
+- con `--queries FILE` (JSON Lines con campi `query`, `source` e `page`) un risultato è rilevante
+  se appartiene al PDF indicato e ne copre la pagina;
+- altrimenti le query sono frasi estratte a caso dai chunk e il chunk di origine è l'unico
+  rilevante. Le frasi fanno parte delle unità mediate, quindi questa stima è ottimistica per
+  `mean`/`weighted`: per decisioni definitive usare query etichettate.
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.chunk_embeddings ../Scraping/WindowsServer/documentsWinServer --limit 20 --k 5
+"""
+import argparse
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+from function_app import (calculate_distance, create_chunks_based_on_distances, encode_texts, generate_embeddings,
+                          generate_embeddings_for_chunks, get_embedding_model, get_nlp, logger, normalize_embeddings,
+                          pool_chunk_embeddings, process_single_pdf)
+
+MODES = ["encode", "mean", "weighted"]
+
+def chunk_document(pdf_path):
+    """Unità, embeddings normalizzati delle unità e chunk di un PDF."""
+    units = process_single_pdf(pdf_path, get_nlp())
+    if not units:
+        return None
+    unit_embeddings = generate_embeddings(units, get_embedding_model())
+    distances = calculate_distance(unit_embeddings)
+    if len(distances) == 0:
+        return None # Una sola unità: la pipeline scarta il documento
+    chunks = create_chunks_based_on_distances(units, distances, pdf_path, logger)
+    return units, unit_embeddings, chunks
+
+def embed_chunks(mode, units, unit_embeddings, chunks):
+    """Embeddings normalizzati dei chunk nella modalità indicata."""
+    if mode == "encode":
+        return normalize_embeddings(generate_embeddings_for_chunks(chunks, get_embedding_model()))
+    return pool_chunk_embeddings(unit_embeddings, units, chunks, mode)
+
+def sample_sentence_queries(units, chunks, offset, rng, per_pdf):
+    """Frasi estratte a caso da chunk distinti, con l'indice globale del chunk di origine."""
+    queries = []
+    for i in rng.permutation(len(chunks))[:per_pdf]:
+        start, end = chunks[i]["units"]
+        sentence = rng.integers(units.unit_starts[start], units.unit_ends[end - 1])
+        text = units.text[units.sentence_starts[sentence]:units.sentence_ends[sentence]]
+        if text.strip():
+            queries.append((text, {offset + int(i)}))
+    return queries
+
+def labeled_queries(path, metadata):
+    """Query etichettate: rilevanti i chunk del PDF indicato che coprono la pagina."""
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            relevant = {i for i, (source, first, last) in enumerate(metadata)
+                        if source == item["source"] and first <= item["page"] <= last}
+            if relevant:
+                queries.append((item["query"], relevant))
+    return queries
+
+def evaluate(chunk_embeddings, query_embeddings, relevant, k):
+    """Recall@k (almeno un chunk rilevante tra i primi k) e MRR sui primi k risultati."""
+    scores = query_embeddings @ chunk_embeddings.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    hits = 0
+    reciprocal_ranks = 0.0
+    for row, expected in zip(top, relevant):
+        for rank, index in enumerate(row.tolist(), start=1):
+            if index in expected:
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+    return hits / len(relevant), reciprocal_ranks / len(relevant)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Cartella contenente i PDF")
+    parser.add_argument("--limit", type=int, default=None, help="Numero massimo di PDF da elaborare")
+    parser.add_argument("--queries", default=None, help="File JSON Lines di query etichettate")
+    parser.add_argument("--queries-per-pdf", type=int, default=20, help="Frasi campionate per PDF senza --queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    pdf_files = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory) if f.endswith('.pdf'))[:args.limit]
+
+    embeddings = {mode: [] for mode in MODES}
+    seconds = {mode: 0.0 for mode in MODES}
+    metadata = []  # (PDF, prima pagina, ultima pagina) per chunk
+    sampled = []
+    for pdf_path in pdf_files:
+        document = chunk_document(pdf_path)
+        if document is None:
+            continue
+        units, unit_embeddings, chunks = document
+        for mode in MODES:
+            start = perf_counter()
+            embeddings[mode].append(embed_chunks(mode, units, unit_embeddings, chunks))
+            seconds[mode] += perf_counter() - start
+        sampled.extend(sample_sentence_queries(units, chunks, len(metadata), rng, args.queries_per_pdf))
+        metadata.extend((os.path.basename(pdf_path), *chunk["pages"]) for chunk in chunks)
+
+    queries = labeled_queries(args.queries, metadata) if args.queries else sampled
+    if not metadata or not queries:
+        print("Nessun chunk o nessuna query da valutare")
+        return
+    query_embeddings = normalize_embeddings(encode_texts([text for text, _ in queries], get_embedding_model(), 256))
+    relevant = [expected for _, expected in queries]
+
+    encoded = np.concatenate(embeddings["encode"])
+    results = []
+    for mode in MODES:
+        matrix = np.concatenate(embeddings[mode])
+        recall, mrr = evaluate(matrix, query_embeddings, relevant, args.k)
+        results.append({
+            "mode": mode,
+            "chunks": len(matrix),
+            "queries": len(queries),
+            "seconds": seconds[mode],
+            "chunks_per_second": len(matrix) / seconds[mode] if seconds[mode] else float("inf"),
+            "recall_at_k": recall,
+            "mrr": mrr,
+            "cosine_to_encode": float(np.mean(np.einsum("ij,ij->i", matrix, encoded)))
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'modalità':>9} {'chunk':>7} {'query':>6} {'tempo (s)':>10} {'chunk/s':>10} {f'recall@{args.k}':>9} {'MRR':>6} {'cos. encode':>11}")
+    for r in results:
+        print(f"{r['mode']:>9} {r['chunks']:>7} {r['queries']:>6} {r['seconds']:>10.3f} {r['chunks_per_second']:>10.0f} "
+              f"{r['recall_at_k']:>9.3f} {r['mrr']:>6.3f} {r['cosine_to_encode']:>11.3f}")
+
+if __name__ == "__main__":
+    main()
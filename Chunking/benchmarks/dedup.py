@@ -0,0 +1,127 @@
+"""Chunk duplicati tra documenti e collezioni (`dedup.DedupIndex`) e risparmio di codifica e di indice.
+
+Ogni cartella indicata con `--collection NOME=CARTELLA` è una collezione; i chunk dei suoi PDF sono
+generati in memoria con la pipeline di `function_app` e assegnati, nell'ordine dei documenti, a un
+indice di deduplicazione per ciascuna soglia di `--thresholds` (Jaccard stimata dei quasi duplicati).
+Per ogni soglia si riportano:
+- chunk, duplicati esatti e quasi duplicati, quelli il cui canonico è in un'altra collezione e il
+  rapporto di deduplicazione (duplicati / chunk);
+- il tempo dello stadio di deduplicazione (impronte e ricerca LSH);
+- il tempo di codifica dei soli chunk unici, confrontato con quello di tutti i chunk;
+- la memoria risparmiata nell'indice: vettore (nel formato di `VECTOR_STORAGE`) e archi del grafo
+  HNSW (circa 2 * `HNSW_M` id da 4 byte al livello 0) per chunk duplicato, più il testo non
+  indicizzato dal full-text (salvato solo nel campo `ref_text` del riferimento).
+
+I risultati dipendono dai confini dei chunk, quindi dal modello: eseguire con quello di produzione.
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.dedup --collection RHEL8=../Scraping/RedHat8/src/functions/documentsRelH8 \\
+        --collection RHEL9=../Scraping/RedHat9/src/functions/documentsRelH9 --limit 50
+"""
+import argparse
+import json
+import os
+from time import perf_counter
+
+from benchmarks.chunk_embeddings import chunk_document
+from chunk_store import HNSW_M, VECTOR_STORAGE, chunk_keys
+from dedup import DedupIndex
+from function_app import calculate_sha256, document_cache_key, generate_embeddings_for_chunks, get_embedding_model
+
+def load_collections(specs, limit):
+    """Chunk dei PDF delle collezioni (NOME=CARTELLA), con la chiave di cache del documento."""
+    documents = []
+    for spec in specs:
+        collection, directory = spec.split("=", 1)
+        pdf_files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.pdf'))[:limit]
+        for pdf_path in pdf_files:
+            document = chunk_document(pdf_path)
+            if document is None:
+                continue
+            documents.append({
+                "key": document_cache_key(calculate_sha256(pdf_path)),
+                "collection": collection,
+                "chunks": document[2]
+            })
+    return documents
+
+def vector_bytes(dim, storage=VECTOR_STORAGE):
+    """Byte del vettore di un chunk nel formato della prima fase della ricerca."""
+    if storage == 'int8':
+        return dim
+    if storage == 'binary':
+        return (dim + 7) // 8
+    return dim * 4
+
+def timed_encode(chunks):
+    start = perf_counter()
+    generate_embeddings_for_chunks(chunks, get_embedding_model())
+    return perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", action="append", required=True, help="Collezione come NOME=CARTELLA (ripetibile)")
+    parser.add_argument("--limit", type=int, default=None, help="Numero massimo di PDF per collezione")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[1.0, 0.95, 0.9, 0.8])
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    documents = load_collections(args.collection, args.limit)
+    all_chunks = [chunk for document in documents for chunk in document["chunks"]]
+    if not all_chunks:
+        print("Nessun chunk da valutare")
+        return
+    collection_of = {key: document["collection"] for document in documents
+                     for key in chunk_keys(document["key"], len(document["chunks"]))}
+    baseline_seconds = timed_encode(all_chunks)
+    per_vector = vector_bytes(get_embedding_model().get_sentence_embedding_dimension()) + (2 * HNSW_M * 4 if VECTOR_STORAGE != 'binary' else 0)
+
+    results = []
+    for threshold in args.thresholds:
+        index = DedupIndex(threshold=threshold)
+        start = perf_counter()
+        assigned = []
+        for document in documents:
+            assigned.append((document, index.assign(document["key"], document["chunks"])[0]))
+            index.commit(document["key"]) # Come dopo la scrittura del documento
+        dedup_seconds = perf_counter() - start
+
+        unique, cross_collection, text_bytes = [], 0, 0
+        for document, references in assigned:
+            for chunk, canonical in zip(document["chunks"], references):
+                if canonical is None:
+                    unique.append(chunk)
+                    continue
+                cross_collection += collection_of[canonical] != document["collection"]
+                text_bytes += len(chunk["text"].encode('utf-8'))
+        duplicates = len(all_chunks) - len(unique)
+        encode_seconds = timed_encode(unique)
+        results.append({
+            "threshold": threshold,
+            "documents": len(documents),
+            "chunks": len(all_chunks),
+            "exact": index.stats["exact"],
+            "near": index.stats["near"],
+            "cross_collection": cross_collection,
+            "dedup_ratio": duplicates / len(all_chunks),
+            "dedup_seconds": dedup_seconds,
+            "encode_seconds": encode_seconds,
+            "encode_seconds_saved": baseline_seconds - encode_seconds,
+            "index_bytes_saved": duplicates * per_vector,
+            "text_bytes_unindexed": text_bytes
+        })
+
+    if args.json:
+        print(json.dumps({"storage": VECTOR_STORAGE, "encode_seconds_all": baseline_seconds, "results": results}, indent=4))
+        return
+
+    print(f"Codifica di tutti i {len(all_chunks)} chunk: {baseline_seconds:.2f} secondi (memorizzazione {VECTOR_STORAGE})")
+    print(f"{'soglia':>6} {'chunk':>7} {'esatti':>7} {'quasi':>6} {'tra coll.':>9} {'rapporto':>8} {'dedup (s)':>9} "
+          f"{'codifica (s)':>12} {'risparmio (s)':>13} {'indice (KiB)':>12} {'testo n.i. (KiB)':>16}")
+    for r in results:
+        print(f"{r['threshold']:>6.2f} {r['chunks']:>7} {r['exact']:>7} {r['near']:>6} {r['cross_collection']:>9} {r['dedup_ratio']:>8.3f} "
+              f"{r['dedup_seconds']:>9.3f} {r['encode_seconds']:>12.2f} {r['encode_seconds_saved']:>13.2f} "
+              f"{r['index_bytes_saved'] / 1024:>12.1f} {r['text_bytes_unindexed'] / 1024:>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Confronto di memoria e payload Redis per PDF: embeddings come liste/JSON contro matrici float32/byte.
+
+Per ogni PDF vengono generate unità, embeddings delle unità e dei chunk con la pipeline di
+`function_app`; si riportano la memoria occupata dagli embeddings nel vecchio formato (liste di
+float Python prodotte da `.tolist()`) e nel nuovo (ndarray float32), e la dimensione del valore
+salvato in Redis (`json.dumps` contro byte float32 little-endian).
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.embeddings_payload ../Scraping/WindowsServer/documentsWinServer --limit 10
+"""
+import argparse
+import json
+import os
+import sys
+
+from chunk_store import serialize_embeddings
+from function_app import (calculate_distance, create_chunks_based_on_distances, generate_embeddings, generate_embeddings_for_chunks,
+                          get_embedding_model, get_nlp, logger, process_single_pdf)
+
+def list_memory(rows):
+    """Memoria (byte) di una lista di liste di float Python, oggetti float inclusi."""
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(x) for x in row) for row in rows)
+
+def measure_pdf(pdf_path):
+    """Generazione degli embeddings di un PDF e misura dei due formati."""
+    units = process_single_pdf(pdf_path, get_nlp())
+    if not units:
+        return None
+    unit_embeddings = generate_embeddings(units, get_embedding_model())
+    unit_list_bytes = list_memory(unit_embeddings.tolist())
+    unit_array_bytes = unit_embeddings.nbytes
+    chunks = create_chunks_based_on_distances(units, calculate_distance(unit_embeddings), pdf_path, logger)
+    chunk_embeddings = generate_embeddings_for_chunks(chunks, get_embedding_model())
+    return {
+        "pdf": os.path.basename(pdf_path),
+        "units": len(units),
+        "chunks": len(chunks),
+        "unit_memory_list_bytes": unit_list_bytes,
+        "unit_memory_array_bytes": unit_array_bytes,
+        "chunk_memory_list_bytes": list_memory(chunk_embeddings.tolist()),
+        "chunk_memory_array_bytes": chunk_embeddings.nbytes,
+        "payload_json_bytes": len(json.dumps(chunk_embeddings.tolist())),
+        "payload_binary_bytes": len(serialize_embeddings(chunk_embeddings)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Cartella contenente i PDF")
+    parser.add_argument("--limit", type=int, default=None, help="Numero massimo di PDF da elaborare")
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    pdf_files = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory) if f.endswith('.pdf'))[:args.limit]
+    results = [r for r in (measure_pdf(pdf) for pdf in pdf_files) if r is not None]
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    kib = 1024
+    print(f"{'PDF':<32} {'unità':>6} {'chunk':>6} {'mem. unità list/array (KiB)':>28} {'mem. chunk list/array (KiB)':>28} {'payload JSON/bin (KiB)':>24}")
+    for r in results:
+        print(f"{r['pdf'][:32]:<32} {r['units']:>6} {r['chunks']:>6} "
+              f"{r['unit_memory_list_bytes'] / kib:>13.1f} / {r['unit_memory_array_bytes'] / kib:>10.1f} "
+              f"{r['chunk_memory_list_bytes'] / kib:>13.1f} / {r['chunk_memory_array_bytes'] / kib:>10.1f} "
+              f"{r['payload_json_bytes'] / kib:>11.1f} / {r['payload_binary_bytes'] / kib:>8.1f}")
+
+if __name__ == "__main__":
+    main()
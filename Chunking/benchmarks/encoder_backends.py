@@ -0,0 +1,150 @@
+"""Confronto dei backend dell'encoder (PyTorch, ONNX Runtime, ONNX Runtime int8): cold start, velocità e deriva.
+
+Ogni backend è misurato in un processo Python nuovo, come un cold start della Function App:
+tempo di import di `function_app`, di caricamento del modello e della prima codifica, poi frasi
+al secondo su un campione di unità estratte dai PDF (o frasi sintetiche con `--synthetic`).
+La deriva rispetto a PyTorch è riportata come similarità coseno per testo (media e minima) e come
+sovrapposizione dei 10 vicini più prossimi di ciascun testo all'interno del campione.
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.encoder_backends ../Scraping/WindowsServer/documentsWinServer --texts 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+NEIGHBORS = 10
+
+def sample_texts(directory, n_texts, seed):
+    """Campione di testi delle unità dei PDF della cartella (in ordine di file, fino a `n_texts`)."""
+    from function_app import get_nlp, process_single_pdf
+    texts = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.pdf'):
+            units = process_single_pdf(os.path.join(directory, name), get_nlp())
+            texts.extend(units[:])
+        if len(texts) >= n_texts:
+            break
+    rng = np.random.default_rng(seed)
+    return [texts[i] for i in sorted(rng.permutation(len(texts))[:n_texts])]
+
+def synthetic_texts(n_texts, seed):
+    """Frasi sintetiche di lunghezza variabile con un vocabolario tecnico."""
+    words = ("server windows role feature install configure network storage cluster hyper-v container update "
+             "security policy domain controller active directory powershell command service failover replica").split()
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(words, rng.integers(8, 60))) + "." for _ in range(n_texts)]
+
+def run_worker(backend, texts_file, output_file, batch_size):
+    """Misure nel processo figlio: import, caricamento, prima codifica e throughput; embeddings salvati su file."""
+    start = perf_counter()
+    import function_app
+    import_seconds = perf_counter() - start
+
+    start = perf_counter()
+    model = function_app.load_encoder(backend=backend)
+    load_seconds = perf_counter() - start
+
+    with open(texts_file, 'r', encoding='utf-8') as f:
+        texts = json.load(f)
+
+    start = perf_counter()
+    model.encode(texts[:1], convert_to_numpy=True)
+    first_encode_seconds = perf_counter() - start
+
+    start = perf_counter()
+    embeddings = function_app.encode_texts(texts, model, batch_size)
+    encode_seconds = perf_counter() - start
+    np.save(output_file, embeddings)
+
+    print(json.dumps({
+        "import_seconds": import_seconds,
+        "load_seconds": load_seconds,
+        "first_encode_seconds": first_encode_seconds,
+        "cold_start_seconds": import_seconds + load_seconds + first_encode_seconds,
+        "sentences_per_second": len(texts) / encode_seconds
+    }))
+
+def neighbors(embeddings):
+    """Indici dei vicini più prossimi (coseno) di ogni riga, escludendo la riga stessa."""
+    scores = embeddings @ embeddings.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argpartition(-scores, NEIGHBORS, axis=1)[:, :NEIGHBORS]
+
+def normalized(embeddings):
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="Cartella contenente i PDF")
+    parser.add_argument("--synthetic", action="store_true", help="Frasi sintetiche invece delle unità dei PDF")
+    parser.add_argument("--texts", type=int, default=2000, help="Numero di testi da codificare")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "OUTPUT"), help=argparse.SUPPRESS)
+    parser.add_argument("--texts-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.texts_file, args.worker[1], args.batch_size)
+        return
+    if not args.synthetic and not args.directory:
+        parser.error("indicare la cartella dei PDF oppure --synthetic")
+
+    texts = synthetic_texts(args.texts, args.seed) if args.synthetic else sample_texts(args.directory, args.texts, args.seed)
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"] # PyTorch è il riferimento
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_directory:
+        texts_file = os.path.join(work_directory, "texts.json")
+        with open(texts_file, 'w', encoding='utf-8') as f:
+            json.dump(texts, f)
+
+        embeddings = {}
+        env = dict(os.environ, EMBEDDING_CACHE_ENABLED="false")
+        for backend in backends:
+            output_file = os.path.join(work_directory, f"{backend}.npy")
+            completed = subprocess.run(
+                [sys.executable, "-m", "benchmarks.encoder_backends", "--worker", backend, output_file,
+                 "--texts-file", texts_file, "--batch-size", str(args.batch_size)],
+                capture_output=True, text=True, env=env
+            )
+            if completed.returncode != 0:
+                print(f"Backend {backend} non disponibile: {completed.stderr.strip().splitlines()[-1:]}", file=sys.stderr)
+                continue
+            stats = json.loads(completed.stdout.strip().splitlines()[-1])
+            embeddings[backend] = normalized(np.load(output_file))
+            results.append(dict(stats, backend=backend, texts=len(texts)))
+
+    if "torch" in embeddings:
+        reference = embeddings["torch"]
+        reference_neighbors = neighbors(reference)
+        for result in results:
+            current = embeddings[result["backend"]]
+            cosines = np.einsum("ij,ij->i", reference, current)
+            current_neighbors = neighbors(current)
+            overlap = np.mean([len(set(a) & set(b)) / NEIGHBORS for a, b in zip(reference_neighbors.tolist(), current_neighbors.tolist())])
+            result.update({"cosine_mean": float(cosines.mean()), "cosine_min": float(cosines.min()), f"neighbors_at_{NEIGHBORS}": float(overlap)})
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'backend':>10} {'testi':>6} {'import (s)':>10} {'modello (s)':>11} {'1a cod. (s)':>11} {'cold start (s)':>14} "
+          f"{'frasi/s':>9} {'cos. medio':>10} {'cos. min':>9} {f'vicini@{NEIGHBORS}':>10}")
+    for r in results:
+        print(f"{r['backend']:>10} {r['texts']:>6} {r['import_seconds']:>10.2f} {r['load_seconds']:>11.2f} {r['first_encode_seconds']:>11.3f} "
+              f"{r['cold_start_seconds']:>14.2f} {r['sentences_per_second']:>9.0f} {r.get('cosine_mean', float('nan')):>10.4f} "
+              f"{r.get('cosine_min', float('nan')):>9.4f} {r.get(f'neighbors_at_{NEIGHBORS}', float('nan')):>10.3f}")
+
+if __name__ == "__main__":
+    main()
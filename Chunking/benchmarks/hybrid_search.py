@@ -0,0 +1,154 @@
+"""Qualità e latenza della ricerca ibrida (BM25 + vettoriale con RRF) rispetto alla sola ricerca vettoriale.
+
+I chunk dei PDF sono generati in memoria con la pipeline di `function_app`; l'indice lessicale è
+costruito con `lexical_index.LexicalIndex` e la ricerca vettoriale è esatta (coseno con NumPy),
+per isolare l'effetto della fusione dall'approssimazione di HNSW (misurata in
+`benchmarks.vector_search`). Nella modalità ibrida BM25 e KNN sono eseguiti in parallelo con il
+pool di `retrieval` e fusi con `retrieval.reciprocal_rank_fusion`, come nella Function App.
+
+Query:
+- con `--queries FILE` (JSON Lines con campi `query`, `source` e `page`) un risultato è rilevante
+  se appartiene al PDF indicato e ne copre la pagina;
+- altrimenti le query sono da 3 a 6 parole di una frase estratta a caso da un chunk, che è l'unico
+  rilevante. Le parole provengono dal chunk stesso, quindi la stima favorisce BM25: per decisioni
+  definitive usare query etichettate (ad es. con comandi, nomi di file e numeri KB).
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.hybrid_search ../Scraping/WindowsServer/documentsWinServer --limit 20 --k 5
+"""
+import argparse
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.chunk_embeddings import chunk_document, labeled_queries
+from function_app import generate_chunk_embeddings, get_embedding_model, normalize_embeddings
+from lexical_index import TOKEN_PATTERN, LexicalIndex
+from retrieval import HYBRID_DEPTH, RRF_K, _executor, reciprocal_rank_fusion
+
+MODES = ["vector", "lexical", "hybrid"]
+
+def keyword_queries(texts, rng, n_queries):
+    """Query di poche parole prese in ordine da una frase casuale di un chunk casuale, con l'indice del chunk."""
+    queries = []
+    for i in rng.integers(0, len(texts), n_queries * 2):
+        sentences = [s for s in texts[i].split(". ") if len(TOKEN_PATTERN.findall(s.lower())) >= 3]
+        if not sentences:
+            continue
+        words = sentences[rng.integers(len(sentences))].split()
+        n_words = min(len(words), int(rng.integers(3, 7)))
+        start = int(rng.integers(0, len(words) - n_words + 1))
+        queries.append((" ".join(words[start:start + n_words]), {int(i)}))
+        if len(queries) == n_queries:
+            break
+    return queries
+
+def vector_ranking(query, embeddings, model, depth):
+    """Indici dei `depth` chunk più simili alla query (ricerca esatta)."""
+    query_vector = normalize_embeddings(model.encode([query], convert_to_numpy=True))[0]
+    scores = embeddings @ query_vector
+    depth = min(depth, len(scores))
+    top = np.argpartition(-scores, depth - 1)[:depth]
+    return top[np.argsort(-scores[top])].tolist()
+
+def lexical_ranking(query, index, key_index, depth):
+    return [key_index[key] for key, _ in index.search(query, depth)]
+
+def hybrid_ranking(query, embeddings, model, index, key_index, depth, rrf_k):
+    """BM25 nel pool di `retrieval` mentre il thread corrente esegue la ricerca vettoriale, poi fusione RRF."""
+    lexical = _executor.submit(lexical_ranking, query, index, key_index, depth)
+    vector = vector_ranking(query, embeddings, model, depth)
+    return [key for key, _ in reciprocal_rank_fusion([vector, lexical.result()], rrf_k)]
+
+def first_hit_rank(ranking, expected, k):
+    """Rank (da 1) del primo risultato rilevante tra i primi k, None se assente."""
+    for rank, index in enumerate(ranking[:k], start=1):
+        if index in expected:
+            return rank
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Cartella contenente i PDF")
+    parser.add_argument("--limit", type=int, default=None, help="Numero massimo di PDF da elaborare")
+    parser.add_argument("--queries", default=None, help="File JSON Lines di query etichettate")
+    parser.add_argument("--n-queries", type=int, default=200, help="Query di parole chiave campionate senza --queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=HYBRID_DEPTH, help="Risultati di ciascun retriever fusi con RRF")
+    parser.add_argument("--rrf-k", type=int, default=RRF_K)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    pdf_files = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory) if f.endswith('.pdf'))[:args.limit]
+
+    model = get_embedding_model()
+    embeddings, texts, metadata = [], [], []  # metadata: (PDF, prima pagina, ultima pagina) per chunk
+    for pdf_path in pdf_files:
+        document = chunk_document(pdf_path)
+        if document is None:
+            continue
+        units, unit_embeddings, chunks = document
+        embeddings.append(normalize_embeddings(generate_chunk_embeddings(chunks, units, unit_embeddings, model)))
+        texts.extend(chunk["text"] for chunk in chunks)
+        metadata.extend((os.path.basename(pdf_path), *chunk["pages"]) for chunk in chunks)
+    if not metadata:
+        print("Nessun chunk da valutare")
+        return
+    embeddings = np.concatenate(embeddings)
+
+    keys = [f"{source}:{i}" for i, (source, _, _) in enumerate(metadata)]
+    key_index = {key: i for i, key in enumerate(keys)}
+    start = perf_counter()
+    index = LexicalIndex.build(keys, texts, ["bench"] * len(keys))
+    build_seconds = perf_counter() - start
+    index_bytes = sum(array.nbytes for array in (index.offsets, index.doc_ids, index.term_freqs, index.doc_lengths))
+
+    queries = labeled_queries(args.queries, metadata) if args.queries else keyword_queries(texts, rng, args.n_queries)
+    if not queries:
+        print("Nessuna query da valutare")
+        return
+    model.encode([queries[0][0]], convert_to_numpy=True) # Riscaldamento dell'encoder
+
+    rankers = {
+        "vector": lambda query: vector_ranking(query, embeddings, model, args.depth),
+        "lexical": lambda query: lexical_ranking(query, index, key_index, args.depth),
+        "hybrid": lambda query: hybrid_ranking(query, embeddings, model, index, key_index, args.depth, args.rrf_k)
+    }
+    results = []
+    for mode in MODES:
+        latencies, ranks = [], []
+        for query, expected in queries:
+            start = perf_counter()
+            ranking = rankers[mode](query)
+            latencies.append(perf_counter() - start)
+            ranks.append(first_hit_rank(ranking, expected, args.k))
+        latencies_ms = np.array(latencies) * 1000
+        results.append({
+            "mode": mode,
+            "chunks": len(keys),
+            "queries": len(queries),
+            "recall_at_k": sum(rank is not None for rank in ranks) / len(ranks),
+            "mrr": sum(1.0 / rank for rank in ranks if rank is not None) / len(ranks),
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p95_ms": float(np.percentile(latencies_ms, 95)),
+            "index_build_seconds": build_seconds if mode != "vector" else None,
+            "postings_bytes": index_bytes if mode != "vector" else None
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"Indice lessicale: {len(index.terms)} termini, {len(index.doc_ids)} posting, "
+          f"{index_bytes / 2**20:.2f} MiB, costruito in {build_seconds:.2f} secondi")
+    print(f"{'modalità':>9} {'chunk':>7} {'query':>6} {f'recall@{args.k}':>9} {'MRR':>6} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for r in results:
+        print(f"{r['mode']:>9} {r['chunks']:>7} {r['queries']:>6} {r['recall_at_k']:>9.3f} {r['mrr']:>6.3f} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Benchmark riproducibile della pipeline di chunking sul corpus Windows Server, con confronto tra commit.
+
+Ogni modalità è eseguita in un processo Python nuovo, con la configurazione passata tramite le
+stesse variabili d'ambiente della Function App (dimensione delle unità, batch dell'encoder,
+percentile dei breakpoint, ...), così la memoria di picco e i modelli caricati non si influenzano:
+- `stages`: un PDF alla volta, con il tempo di ogni stadio (estrazione e segmentazione, codifica
+  delle unità, distanze e chunk, embeddings dei chunk, scrittura su Redis) e la distribuzione delle
+  dimensioni dei chunk;
+- `staged` e `sequential`: la pipeline completa (`run_chunking_pipeline` oppure
+  `process_documentation`) misurata da fuori.
+Il caricamento dei modelli è misurato a parte ed escluso dai tempi degli stadi.
+
+Redis: `--redis memory` usa fakeredis (`pip install fakeredis`), `--redis local` il database
+`--redis-db` dell'istanza locale, svuotato prima di ogni esecuzione. La cache degli embeddings è
+disattivata (salvo `--embedding-cache`) per misurare sempre la codifica completa.
+
+I risultati (con configurazione, commit e ambiente) sono salvati in JSON con `--output`; con
+`--baseline` vengono confrontati con quelli di un'esecuzione precedente e il processo termina con
+codice 1 se una metrica peggiora oltre `--tolerance`.
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.pipeline --limit 20 --output before.json
+    python -m benchmarks.pipeline --limit 20 --unit-batch-size 256 --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from time import perf_counter
+
+import numpy as np
+
+DEFAULT_DIRECTORY = os.path.join("..", "Scraping", "WindowsServer", "documentsWinServer")
+MODES = ["stages", "staged", "sequential"]
+STAGES = ["extraction", "unit_encoding", "chunking", "chunk_encoding", "redis_write"]
+
+# Opzioni della riga di comando -> variabili d'ambiente lette da `function_app` all'import
+CONFIG_ENV = {
+    "unit_size": "CHUNKING_UNIT_SIZE",
+    "unit_stride": "CHUNKING_UNIT_STRIDE",
+    "unit_batch_size": "CHUNKING_UNIT_BATCH_SIZE",
+    "chunk_batch_size": "CHUNKING_CHUNK_BATCH_SIZE",
+    "percentile": "CHUNKING_BREAKPOINT_PERCENTILE",
+    "extraction_mode": "CHUNKING_EXTRACTION_MODE",
+    "page_batch_size": "CHUNKING_PAGE_BATCH_SIZE",
+    "chunk_embedding_mode": "CHUNK_EMBEDDING_MODE",
+    "extract_workers": "CHUNKING_EXTRACT_WORKERS",
+    "encoder_backend": "ENCODER_BACKEND"
+}
+
+# Metriche confrontate con la baseline: (modalità, percorso, True se un valore più alto è migliore)
+COMPARED_METRICS = [("stages", ("stage_seconds", stage), False) for stage in STAGES] + [
+    (mode, (metric,), higher)
+    for mode in MODES
+    for metric, higher in (("total_seconds", False), ("pages_per_second", True), ("peak_rss_bytes", False))
+]
+
+def peak_rss():
+    """Memoria residente di picco (byte) del processo e dei processi figli terminati; None se non misurabile."""
+    try:
+        import resource
+    except ImportError: # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset, None
+        except ImportError:
+            return None, None
+    scale = 1 if sys.platform == "darwin" else 1024 # ru_maxrss è in KiB su Linux, in byte su macOS
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+def distribution(values):
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return None
+    return {
+        "mean": float(values.mean()),
+        "p5": float(np.percentile(values, 5)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max())
+    }
+
+def connect(backend, db):
+    """Redis di prova vuoto: fakeredis in memoria oppure un database dedicato dell'istanza locale."""
+    if backend == "memory":
+        import fakeredis
+        return fakeredis.FakeRedis()
+    import redis
+    client = redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', 6379)),
+                         password=os.getenv('REDIS_PASSWORD') or None, ssl=os.getenv('REDIS_SSL', 'false').lower() == 'true', db=db)
+    client.flushdb()
+    return client
+
+def count_pages(pdf_files):
+    import fitz
+    pages = 0
+    for pdf in pdf_files:
+        with fitz.open(pdf) as document:
+            pages += document.page_count
+    return pages
+
+def run_stages(function_app, client, pdf_files):
+    """Pipeline un PDF alla volta, con il tempo di ciascuno stadio."""
+    from chunk_store import BulkWriter
+    seconds = dict.fromkeys(STAGES, 0.0)
+    n_units = 0
+    chunk_chars, chunk_units = [], []
+    writer = BulkWriter(client)
+    for pdf in pdf_files:
+        start = perf_counter()
+        units = function_app.process_single_pdf(pdf, function_app.get_nlp())
+        seconds["extraction"] += perf_counter() - start
+        if not units:
+            continue
+        n_units += len(units)
+
+        start = perf_counter()
+        unit_embeddings = function_app.generate_embeddings(units, function_app.get_embedding_model())
+        seconds["unit_encoding"] += perf_counter() - start
+
+        start = perf_counter()
+        chunks = function_app.create_chunks_based_on_distances(units, function_app.calculate_distance(unit_embeddings), pdf, function_app.logger)
+        seconds["chunking"] += perf_counter() - start
+
+        start = perf_counter()
+        chunk_embeddings = function_app.generate_chunk_embeddings(chunks, units, unit_embeddings, function_app.get_embedding_model())
+        seconds["chunk_encoding"] += perf_counter() - start
+
+        cache_key = function_app.document_cache_key(function_app.calculate_sha256(pdf))
+        start = perf_counter()
+        writer.add_document(cache_key, chunks, chunk_embeddings, os.path.basename(pdf), "WindowsServer")
+        seconds["redis_write"] += perf_counter() - start
+
+        chunk_chars.extend(len(chunk["text"]) for chunk in chunks)
+        chunk_units.extend(chunk["units"][1] - chunk["units"][0] for chunk in chunks)
+
+    start = perf_counter()
+    writer.flush()
+    seconds["redis_write"] += perf_counter() - start
+    return {
+        "units": n_units,
+        "chunks": len(chunk_chars),
+        "stage_seconds": seconds,
+        "total_seconds": sum(seconds.values()),
+        "chunk_chars": distribution(chunk_chars),
+        "chunk_units": distribution(chunk_units)
+    }
+
+def run_end_to_end(function_app, client, pdf_files, mode):
+    """Pipeline completa come nella Function App (chiavi di cache, pipeline a stadi o sequenziale)."""
+    documentation = [("Windows Server", [(pdf, function_app.document_cache_key(function_app.calculate_sha256(pdf))) for pdf in pdf_files])]
+    start = perf_counter()
+    if mode == "staged":
+        function_app.run_chunking_pipeline(documentation, client, function_app.logger)
+    else:
+        function_app.process_documentation(documentation[0][1], client, function_app.get_nlp(), function_app.logger, "Windows Server")
+    elapsed = perf_counter() - start
+    counts = [client.hget(cache_key, "count") for _, cache_key in documentation[0][1]]
+    return {"chunks": sum(int(count) for count in counts if count is not None), "total_seconds": elapsed}
+
+def run_worker(mode, pdf_files, redis_backend, redis_db):
+    """Esecuzione di una modalità nel processo figlio; risultato in JSON sull'ultima riga dello standard output."""
+    import function_app
+    client = connect(redis_backend, redis_db)
+
+    start = perf_counter()
+    function_app.get_nlp()
+    function_app.get_embedding_model().encode(["riscaldamento"], convert_to_numpy=True)
+    model_load_seconds = perf_counter() - start
+
+    pages = count_pages(pdf_files)
+    result = run_stages(function_app, client, pdf_files) if mode == "stages" else run_end_to_end(function_app, client, pdf_files, mode)
+    rss, rss_children = peak_rss()
+    result.update({
+        "mode": mode,
+        "documents": len(pdf_files),
+        "pages": pages,
+        "model_load_seconds": model_load_seconds,
+        "pages_per_second": pages / result["total_seconds"] if result["total_seconds"] else None,
+        "peak_rss_bytes": rss,
+        "peak_rss_children_bytes": rss_children
+    })
+    if "units" in result:
+        result["units_per_second"] = result["units"] / result["total_seconds"] if result["total_seconds"] else None
+    print(json.dumps(result))
+
+def median_result(runs):
+    """Mediana delle metriche numeriche di più ripetizioni (le altre voci dalla prima)."""
+    def merge(values):
+        if all(isinstance(value, dict) for value in values):
+            return {key: merge([value[key] for value in values]) for key in values[0]}
+        if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            return float(np.median(values))
+        return values[0]
+    return merge(runs)
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": revision, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+def lookup(results, mode, path):
+    value = next((r for r in results if r["mode"] == mode), None)
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+def compare(baseline, current, tolerance):
+    """Righe del confronto con la baseline e numero di metriche peggiorate oltre la tolleranza."""
+    rows = []
+    regressions = 0
+    for mode, path, higher_is_better in COMPARED_METRICS:
+        before, after = lookup(baseline["results"], mode, path), lookup(current["results"], mode, path)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        regressed = worse > tolerance
+        regressions += regressed
+        rows.append((f"{mode}.{'.'.join(path)}", before, after, change, regressed))
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DIRECTORY, help="Cartella contenente i PDF")
+    parser.add_argument("--limit", type=int, default=None, help="Numero massimo di PDF (in ordine di nome)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--repeat", type=int, default=1, help="Ripetizioni per modalità (si riporta la mediana)")
+    parser.add_argument("--redis", choices=["memory", "local"], default="memory")
+    parser.add_argument("--redis-db", type=int, default=15, help="Database dell'istanza locale (svuotato a ogni esecuzione)")
+    parser.add_argument("--embedding-cache", action="store_true", help="Mantiene attiva la cache degli embeddings")
+    parser.add_argument("--unit-size", type=int)
+    parser.add_argument("--unit-stride", type=int)
+    parser.add_argument("--unit-batch-size", type=int)
+    parser.add_argument("--chunk-batch-size", type=int)
+    parser.add_argument("--percentile", type=float, help="Percentile delle distanze per i breakpoint")
+    parser.add_argument("--extraction-mode", choices=["streaming", "document"])
+    parser.add_argument("--page-batch-size", type=int)
+    parser.add_argument("--chunk-embedding-mode", choices=["encode", "mean", "weighted"])
+    parser.add_argument("--extract-workers", type=int)
+    parser.add_argument("--encoder-backend", choices=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--output", help="File JSON in cui salvare i risultati")
+    parser.add_argument("--baseline", help="Risultati JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Peggioramento relativo tollerato nel confronto")
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pdf_files = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory) if f.endswith('.pdf'))[:args.limit]
+    if args.worker:
+        run_worker(args.worker, pdf_files, args.redis, args.redis_db)
+        return
+
+    env = dict(os.environ, EMBEDDING_CACHE_ENABLED="true" if args.embedding_cache else "false")
+    config = {}
+    for option, variable in CONFIG_ENV.items():
+        if getattr(args, option) is not None:
+            env[variable] = str(getattr(args, option))
+        config[option] = env.get(variable) # None = default di function_app
+
+    results = []
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            command = [sys.executable, "-m", "benchmarks.pipeline", args.directory, "--worker", mode,
+                       "--redis", args.redis, "--redis-db", str(args.redis_db)]
+            if args.limit is not None:
+                command += ["--limit", str(args.limit)]
+            completed = subprocess.run(command, capture_output=True, text=True, env=env)
+            if completed.returncode != 0:
+                print(f"Modalità {mode} non riuscita: {completed.stderr.strip().splitlines()[-1:]}", file=sys.stderr)
+                break
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        if runs:
+            results.append(median_result(runs))
+
+    stages = next((r for r in results if r["mode"] == "stages"), None)
+    for result in results:
+        if stages and "units_per_second" not in result:
+            result["units_per_second"] = stages["units"] / result["total_seconds"] if result["total_seconds"] else None
+
+    report = {
+        "config": config,
+        "repeat": args.repeat,
+        "redis": args.redis,
+        "embedding_cache": args.embedding_cache,
+        "revision": git_revision(),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+
+    regressions = 0
+    rows = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            rows, regressions = compare(json.load(f), report, args.tolerance)
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{'modalità':>10} {'PDF':>5} {'pagine':>7} {'unità':>8} {'chunk':>7} {'modelli (s)':>11} {'totale (s)':>10} "
+              f"{'pagine/s':>9} {'unità/s':>9} {'RSS (MiB)':>10}")
+        for r in results:
+            units = r.get("units", stages["units"] if stages else float("nan"))
+            print(f"{r['mode']:>10} {r['documents']:>5.0f} {r['pages']:>7.0f} {units:>8.0f} {r['chunks']:>7.0f} {r['model_load_seconds']:>11.2f} "
+                  f"{r['total_seconds']:>10.2f} {r['pages_per_second'] or 0:>9.1f} {r.get('units_per_second') or 0:>9.1f} "
+                  f"{(r['peak_rss_bytes'] or 0) / 2**20:>10.1f}")
+        if stages:
+            print("\nTempo per stadio (s): " + ", ".join(f"{stage} {stages['stage_seconds'][stage]:.2f}" for stage in STAGES))
+            for name, label in (("chunk_chars", "caratteri"), ("chunk_units", "unità")):
+                d = stages[name]
+                if d:
+                    print(f"Dimensione dei chunk ({label}): media {d['mean']:.1f}, p5 {d['p5']:.0f}, p50 {d['p50']:.0f}, "
+                          f"p95 {d['p95']:.0f}, max {d['max']:.0f}")
+        if rows:
+            print(f"\n{'metrica':>36} {'baseline':>12} {'attuale':>12} {'variazione':>10}")
+            for name, before, after, change, regressed in rows:
+                print(f"{name:>36} {before:>12.3f} {after:>12.3f} {change:>+10.1%}{'  PEGGIORATA' if regressed else ''}")
+
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Recall@k e memoria dei formati di memorizzazione dei vettori (float32, int8, binario) con ricalcolo a piena precisione.
+
+Sugli embeddings dei chunk già salvati (o su vettori sintetici con `--synthetic N`) si simula la
+ricerca in due fasi di `chunk_store.knn_search`: prima fase esatta sul formato compresso (coseno
+sui vettori int8, distanza di Hamming sui codici binari) con `k * fattore` candidati, poi
+ricalcolo dello score con i vettori float32. Il fattore 1 corrisponde alla sola prima fase.
+La ground truth è la ricerca esatta float32; la memoria riportata è quella dei vettori nel livello
+di ricerca (Redis) e nel livello a piena precisione, senza l'overhead del grafo HNSW.
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.quantization --k 10 --factors 1 2 4 8
+    python -m benchmarks.quantization --synthetic 100000
+"""
+import argparse
+import json
+
+import numpy as np
+
+from benchmarks.vector_search import connect
+from chunk_store import (CHUNK_KEY_PREFIX, EMBEDDING_DTYPE, FULL_PRECISION_KEY_PREFIX, hamming_distances, quantize_binary,
+                         quantize_int8)
+
+FORMATS = ["float32", "int8", "binary"]
+
+def load_vectors(client):
+    """Embeddings float32 dei chunk salvati: dal livello a piena precisione o, se assente, dal campo `embedding`."""
+    pipe = client.pipeline(transaction=False)
+    keys = list(client.scan_iter(match=f"{FULL_PRECISION_KEY_PREFIX}:*", count=1000))
+    if keys:
+        for key in keys:
+            pipe.get(key)
+    else:
+        for key in client.scan_iter(match=f"{CHUNK_KEY_PREFIX}:*", count=1000):
+            pipe.hget(key, "embedding")
+    vectors = [np.frombuffer(raw, dtype=EMBEDDING_DTYPE) for raw in pipe.execute() if raw is not None]
+    if not vectors:
+        raise SystemExit("Nessun embedding trovato in Redis: usare --synthetic")
+    return np.stack(vectors)
+
+def synthetic_vectors(n_vectors, dim, seed):
+    """Vettori sintetici raggruppati in cluster, come in `benchmarks.vector_search`."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n_vectors // 100), dim), dtype=np.float32)
+    return centers[rng.integers(0, len(centers), n_vectors)] + 0.5 * rng.standard_normal((n_vectors, dim), dtype=np.float32)
+
+def normalized(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+
+def top_n(scores, n):
+    """Indici dei punteggi più alti in ordine decrescente."""
+    n = min(n, len(scores))
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top])]
+
+def first_stage_scores(storage, vectors, encoded, query):
+    """Punteggi della prima fase nel formato compresso (maggiore = più simile)."""
+    if storage == "int8":
+        return encoded.astype(np.float32) @ quantize_int8(query)[0].astype(np.float32)
+    if storage == "binary":
+        return -hamming_distances(encoded, quantize_binary(query)[0]).astype(np.float32)
+    return vectors @ query
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Numero di vettori sintetici (0 = chunk già salvati)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 2, 4, 8], help="Fattori di ricalcolo da provare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic, args.dim, args.seed) if args.synthetic else load_vectors(connect())
+    vectors = normalized(vectors.astype(np.float32))
+    n_vectors, dim = vectors.shape
+
+    rng = np.random.default_rng(args.seed + 1)
+    sample = vectors[rng.integers(0, n_vectors, args.queries)]
+    queries = normalized(sample + 0.1 / np.sqrt(dim) * rng.standard_normal(sample.shape, dtype=np.float32))
+    truth = [set(top_n(vectors @ query, args.k).tolist()) for query in queries]
+
+    encodings = {"float32": vectors, "int8": quantize_int8(vectors), "binary": quantize_binary(vectors)}
+    results = []
+    for storage in FORMATS:
+        encoded = encodings[storage]
+        search_bytes = encoded.nbytes
+        full_precision_bytes = 0 if storage == "float32" else vectors.astype(EMBEDDING_DTYPE).nbytes
+        for factor in (args.factors if storage != "float32" else [1]):
+            recalls = []
+            for query, expected in zip(queries, truth):
+                candidates = top_n(first_stage_scores(storage, vectors, encoded, query), args.k * factor)
+                if factor > 1:
+                    candidates = candidates[np.argsort(-(vectors[candidates] @ query))][:args.k] # Ricalcolo a piena precisione
+                recalls.append(len(set(candidates[:args.k].tolist()) & expected) / args.k)
+            results.append({
+                "storage": storage,
+                "vectors": n_vectors,
+                "rescore_factor": factor,
+                "recall_at_k": float(np.mean(recalls)),
+                "search_tier_bytes": int(search_bytes),
+                "full_precision_tier_bytes": int(full_precision_bytes),
+                "bytes_per_vector_search_tier": search_bytes / n_vectors
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'formato':>8} {'vettori':>8} {'fattore':>7} {f'recall@{args.k}':>10} {'byte/vettore':>12} "
+          f"{'ricerca (MiB)':>13} {'piena prec. (MiB)':>17}")
+    for r in results:
+        print(f"{r['storage']:>8} {r['vectors']:>8} {r['rescore_factor']:>7} {r['recall_at_k']:>10.3f} "
+              f"{r['bytes_per_vector_search_tier']:>12.0f} {r['search_tier_bytes'] / 2**20:>13.2f} {r['full_precision_tier_bytes'] / 2**20:>17.2f}")
+
+if __name__ == "__main__":
+    main()
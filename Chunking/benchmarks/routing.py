@@ -0,0 +1,131 @@
+"""Accuratezza e latenza dell'instradamento a centroidi (`routing.RoutingIndex`) al variare del codebook.
+
+Ogni cartella indicata con `--collection NOME=CARTELLA` è una collezione; i chunk dei suoi PDF sono
+generati in memoria con la pipeline di `function_app` e i codebook dei documenti calcolati con
+`chunk_store.document_centroids` per ciascuna dimensione di `--codebook-sizes`. Per ogni query
+si misurano:
+- l'accuratezza della collezione scelta per prima;
+- la recall dei documenti: la query è instradata correttamente se il suo documento è tra i primi N
+  scelti (nelle ROUTING_TOP_COLLECTIONS collezioni migliori), per ciascun N di `--top-documents`;
+- la latenza di `RoutingIndex.route` (codifica della query esclusa).
+
+Query:
+- con `--queries FILE` (JSON Lines con campi `query`, `collection` e `source`, il nome del PDF);
+- altrimenti frasi estratte a caso dai chunk, con il documento e la collezione di origine (stima
+  ottimistica: la frase fa parte del documento atteso).
+
+Utilizzo (dalla cartella Chunking):
+    python -m benchmarks.routing --collection RHEL9=../Scraping/RedHat9/src/functions/documentsRelH9 \\
+        --collection WindowsServer=../Scraping/WindowsServer/documentsWinServer --limit 50
+"""
+import argparse
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.chunk_embeddings import chunk_document, sample_sentence_queries
+from chunk_store import document_centroids
+from function_app import encode_texts, generate_chunk_embeddings, get_embedding_model
+from routing import ROUTING_TOP_COLLECTIONS, RoutingIndex
+
+def load_collections(specs, limit):
+    """Chunk, embeddings dei chunk e frasi campionate di ogni PDF delle collezioni (NOME=CARTELLA)."""
+    documents = []
+    for spec in specs:
+        collection, directory = spec.split("=", 1)
+        pdf_files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.pdf'))[:limit]
+        for pdf_path in pdf_files:
+            document = chunk_document(pdf_path)
+            if document is None:
+                continue
+            units, unit_embeddings, chunks = document
+            documents.append({
+                "key": f"{collection}:{os.path.basename(pdf_path)}",
+                "collection": collection,
+                "source": os.path.basename(pdf_path),
+                "units": units,
+                "chunks": chunks,
+                "embeddings": generate_chunk_embeddings(chunks, units, unit_embeddings, get_embedding_model())
+            })
+    return documents
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", action="append", required=True, help="Collezione come NOME=CARTELLA (ripetibile)")
+    parser.add_argument("--limit", type=int, default=None, help="Numero massimo di PDF per collezione")
+    parser.add_argument("--queries", default=None, help="File JSON Lines di query etichettate")
+    parser.add_argument("--queries-per-pdf", type=int, default=5, help="Frasi campionate per PDF senza --queries")
+    parser.add_argument("--codebook-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--top-documents", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--top-collections", type=int, default=ROUTING_TOP_COLLECTIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    documents = load_collections(args.collection, args.limit)
+    if not documents:
+        print("Nessun documento da valutare")
+        return
+
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        queries = [(item["query"], f"{item['collection']}:{item['source']}") for item in items]
+    else:
+        rng = np.random.default_rng(args.seed)
+        queries = []
+        for document in documents:
+            sampled = sample_sentence_queries(document["units"], document["chunks"], 0, rng, args.queries_per_pdf)
+            queries.extend((text, document["key"]) for text, _ in sampled)
+    collection_of = {document["key"]: document["collection"] for document in documents}
+    query_vectors = encode_texts([text for text, _ in queries], get_embedding_model(), 256)
+
+    results = []
+    for size in args.codebook_sizes:
+        index = RoutingIndex()
+        for document in documents:
+            centroids, counts = document_centroids(document["embeddings"], size)
+            index.add_document(document["key"], document["collection"], document["source"], centroids, counts)
+        index.rebuild()
+
+        latencies = []
+        collection_hits = 0
+        document_hits = {n: 0 for n in args.top_documents}
+        for query_vector, (_, expected) in zip(query_vectors, queries):
+            start = perf_counter()
+            routed = index.route(query_vector, args.top_collections, max(args.top_documents))
+            latencies.append(perf_counter() - start)
+            collection_hits += bool(routed["collections"]) and routed["collections"][0]["collection"] == collection_of.get(expected)
+            keys = [document["key"] for document in routed["documents"]]
+            for n in args.top_documents:
+                document_hits[n] += expected in keys[:n]
+
+        latencies_ms = np.array(latencies) * 1000
+        result = {
+            "codebook_size": size,
+            "documents": len(documents),
+            "centroids": int(index.state["matrix"].shape[0]),
+            "queries": len(queries),
+            "collection_accuracy": collection_hits / len(queries),
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p95_ms": float(np.percentile(latencies_ms, 95))
+        }
+        result.update({f"document_recall_at_{n}": document_hits[n] / len(queries) for n in args.top_documents})
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    header = f"{'codebook':>8} {'documenti':>9} {'centroidi':>9} {'query':>6} {'collezione':>10} " + \
+             " ".join(f"{f'doc@{n}':>7}" for n in args.top_documents) + f" {'p50 (ms)':>9} {'p95 (ms)':>9}"
+    print(header)
+    for r in results:
+        print(f"{r['codebook_size']:>8} {r['documents']:>9} {r['centroids']:>9} {r['queries']:>6} {r['collection_accuracy']:>10.3f} " +
+              " ".join(f"{r[f'document_recall_at_{n}']:>7.3f}" for n in args.top_documents) +
+              f" {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
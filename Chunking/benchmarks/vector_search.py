@@ -0,0 +1,137 @@
+"""Benchmark di latenza e recall della ricerca KNN su RediSearch.
+
+La ground truth è la ricerca esatta (prodotto scalare su vettori normalizzati) calcolata con
+NumPy; per ciascun valore di EF_RUNTIME si misurano recall@k e latenze (p50/p95/p99) di
+`chunk_store.knn_search`. Le query sono vettori dell'indice perturbati con rumore gaussiano.
+
+Senza `--synthetic` vengono usati i chunk già salvati dalla pipeline (prefisso `chunk:`);
+con `--synthetic N` viene creato un indice temporaneo di N vettori sintetici, eliminato a fine run.
+
+Utilizzo (dalla cartella Chunking, con redis-stack in locale):
+    python -m benchmarks.vector_search --synthetic 100000 --algorithm HNSW --m 16 --ef 10 50 200
+"""
+import argparse
+import json
+import os
+from time import perf_counter, sleep
+
+import numpy as np
+import redis
+
+from chunk_store import (CHUNK_KEY_PREFIX, EMBEDDING_DTYPE, VECTOR_INDEX_NAME, create_vector_index, knn_search,
+                         serialize_embeddings)
+
+BENCH_INDEX_NAME = "idx:bench"
+BENCH_KEY_PREFIX = "bench"
+
+def connect():
+    """Connessione a Redis con le stesse variabili d'ambiente della Function App (default: istanza locale)."""
+    return redis.Redis(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        password=os.getenv('REDIS_PASSWORD') or None,
+        ssl=os.getenv('REDIS_SSL', 'false').lower() == 'true'
+    )
+
+def load_stored_vectors(client):
+    """Lettura delle chiavi e degli embeddings dei chunk salvati dalla pipeline."""
+    keys = [key.decode('utf-8') for key in client.scan_iter(match=f"{CHUNK_KEY_PREFIX}:*", count=1000)]
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hget(key, "embedding")
+    vectors = np.stack([np.frombuffer(raw, dtype=EMBEDDING_DTYPE) for raw in pipe.execute()])
+    return keys, vectors
+
+def populate_synthetic(client, n_vectors, dim, seed, args):
+    """Creazione di un indice temporaneo con vettori sintetici raggruppati in cluster (come i chunk reali)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n_vectors // 100), dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), n_vectors)] + 0.5 * rng.standard_normal((n_vectors, dim), dtype=np.float32)
+    keys = [f"{BENCH_KEY_PREFIX}:{i}" for i in range(n_vectors)]
+
+    create_vector_index(client, dim, index_name=BENCH_INDEX_NAME, prefix=BENCH_KEY_PREFIX,
+                        algorithm=args.algorithm, m=args.m, ef_construction=args.ef_construction)
+    pipe = client.pipeline(transaction=False)
+    for i, (key, vector) in enumerate(zip(keys, vectors)):
+        pipe.hset(key, mapping={"text": "", "embedding": serialize_embeddings(vector), "source": "bench",
+                                "collection": "bench", "page_start": 0, "page_end": 0})
+        if i % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+
+    # Attesa del completamento dell'indicizzazione in background
+    while int(client.ft(BENCH_INDEX_NAME).info().get("indexing", 0)):
+        sleep(0.1)
+    return keys, vectors
+
+def exact_top_k(vectors, queries, k):
+    """Ground truth: indici dei k vettori più simili (coseno) per ciascuna query."""
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="Numero di vettori sintetici (0 = chunk già salvati)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--algorithm", choices=["HNSW", "FLAT"], default="HNSW")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[10, 50, 100], help="Valori di EF_RUNTIME da provare")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    client = connect()
+    if args.synthetic:
+        keys, vectors = populate_synthetic(client, args.synthetic, args.dim, args.seed, args)
+        index_name = BENCH_INDEX_NAME
+    else:
+        keys, vectors = load_stored_vectors(client)
+        index_name = VECTOR_INDEX_NAME
+
+    try:
+        rng = np.random.default_rng(args.seed + 1)
+        sample = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = sample + 0.1 * np.linalg.norm(sample, axis=1, keepdims=True) / np.sqrt(vectors.shape[1]) * rng.standard_normal(sample.shape, dtype=np.float32)
+        truth = exact_top_k(vectors, queries, args.k)
+        key_index = {key: i for i, key in enumerate(keys)}
+
+        results = []
+        for ef in (args.ef if args.algorithm == "HNSW" else [None]):
+            latencies = []
+            recalls = []
+            for query, expected in zip(queries, truth):
+                start = perf_counter()
+                hits = knn_search(client, query, args.k, index_name=index_name, ef_runtime=ef)
+                latencies.append(perf_counter() - start)
+                recalls.append(len({key_index[hit["key"]] for hit in hits} & expected) / args.k)
+            latencies_ms = np.array(latencies) * 1000
+            results.append({
+                "algorithm": args.algorithm,
+                "vectors": len(vectors),
+                "ef_runtime": ef,
+                "recall_at_k": float(np.mean(recalls)),
+                "p50_ms": float(np.percentile(latencies_ms, 50)),
+                "p95_ms": float(np.percentile(latencies_ms, 95)),
+                "p99_ms": float(np.percentile(latencies_ms, 99)),
+                "qps": len(latencies) / float(np.sum(latencies))
+            })
+    finally:
+        if args.synthetic:
+            client.ft(BENCH_INDEX_NAME).dropindex(delete_documents=True)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'algoritmo':>9} {'vettori':>8} {'ef':>5} {f'recall@{args.k}':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'QPS':>8}")
+    for r in results:
+        print(f"{r['algorithm']:>9} {r['vectors']:>8} {str(r['ef_runtime'] or '-'):>5} {r['recall_at_k']:>10.3f} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['qps']:>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,755 @@
+"""Archiviazione dei chunk in Redis e ricerca vettoriale (KNN) mediante RediSearch.
+
+Ogni chunk è salvato come hash `chunk:<checksum>:<versione>:<modello>:<i>` con testo, vettore
+float32 little-endian, PDF di origine, intervallo di pagine e collezione; l'hash del documento
+(`chunks:<checksum>:<versione>:<modello>`) registra il numero di chunk ed è scritto per ultimo,
+così la sua presenza indica che il documento è stato salvato per intero. L'hash del documento
+contiene anche i centroidi k-means dei suoi chunk (`centroids`, `centroid_counts`) usati da `routing`.
+
+Con `VECTOR_STORAGE` diverso da 'float32' il vettore usato dalla ricerca è compresso e quello a
+piena precisione è salvato a parte (`chunkfp:<...>:<i>`, eventualmente su un'altra istanza Redis
+più economica indicata da `FULL_PRECISION_REDIS_URL`) per il ricalcolo dello score dei candidati:
+- 'int8': vettore normalizzato e scalato a [-127, 127], indicizzato da RediSearch (TYPE INT8,
+  richiede RediSearch 2.10 o successivo), 4 volte più piccolo;
+- 'binary': solo il segno delle componenti (48 byte a dim 384), salvato per documento nel campo
+  `bits` del suo hash; RediSearch non indicizza vettori binari, per cui la prima fase (distanza di
+  Hamming) è eseguita in memoria nel processo sui codici letti da Redis.
+Cambiando `VECTOR_STORAGE` va usato un nuovo `VECTOR_INDEX_NAME` (o eliminato l'indice esistente).
+
+Con la deduplicazione (`dedup`) un chunk duplicato di un altro è un hash di riferimento con il
+campo `ref` (chiave del chunk canonico), la sorgente, la collezione, le pagine e il proprio testo
+nel campo `ref_text`, non indicizzato, ma senza vettore: le letture (`load_chunks`, `fetch_chunks`)
+restituiscono il suo testo con il vettore del canonico, che non viene eliminato finché è
+referenziato da altri documenti.
+
+Per i test in locale è sufficiente un container redis-stack:
+    docker run -p 6379:6379 redis/redis-stack-server
+con REDIS_HOST=localhost, REDIS_PORT=6379, REDIS_SSL=false e REDIS_PASSWORD vuota.
+"""
+import logging
+import os
+from time import sleep, time
+
+import numpy as np
+from redis.commands.search.field import NumericField, TagField, TextField, VectorField
+from redis.commands.search.index_definition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+import redis
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from metrics import redis_roundtrip
+
+logger = logging.getLogger("Chunking")
+
+# Formato binario degli embeddings in Redis: float32 little-endian, righe contigue
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+# Prefissi delle chiavi: documento (numero di chunk, sorgente) e singoli chunk indicizzati
+CACHE_KEY_PREFIX = "chunks"
+CHUNK_KEY_PREFIX = "chunk"
+FULL_PRECISION_KEY_PREFIX = "chunkfp"
+
+# Formato dei vettori per la prima fase della ricerca: 'float32', 'int8' oppure 'binary'
+VECTOR_STORAGE = os.getenv('VECTOR_STORAGE', 'float32')
+RESCORE_FACTOR = int(os.getenv('RESCORE_FACTOR', 4))  # Candidati della prima fase per risultato, ricalcolati a piena precisione
+FULL_PRECISION_REDIS_URL = os.getenv('FULL_PRECISION_REDIS_URL')  # Istanza per i vettori float32 (default: la stessa dei chunk)
+BINARY_INDEX_TTL = float(os.getenv('BINARY_INDEX_TTL', 300))  # Secondi di validità dei codici binari caricati in memoria
+
+# Centroidi per l'instradamento delle query (vedi `routing`), salvati nell'hash di ogni documento
+ROUTING_CODEBOOK_SIZE = int(os.getenv('ROUTING_CODEBOOK_SIZE', 4))  # Centroidi k-means per documento (1 = solo la media)
+ROUTING_KMEANS_ITERATIONS = 10
+
+# Configurazione dell'indice vettoriale RediSearch
+VECTOR_INDEX_NAME = os.getenv('VECTOR_INDEX_NAME', 'idx:chunks')
+VECTOR_INDEX_ALGORITHM = os.getenv('VECTOR_INDEX_ALGORITHM', 'HNSW').upper()  # 'HNSW' oppure 'FLAT'
+HNSW_M = int(os.getenv('HNSW_M', 16))  # Archi per nodo del grafo HNSW
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', 200))  # Candidati esaminati in costruzione
+HNSW_EF_RUNTIME = int(os.getenv('HNSW_EF_RUNTIME', 10))  # Candidati esaminati in ricerca (default di RediSearch)
+
+# Deduplicazione dei chunk (vedi `dedup`)
+DEDUP_EXACT_KEY = "dedup:exact"  # Hash impronta esatta -> chiave del chunk canonico
+DEDUP_SIGNATURES_KEY = "dedup:signatures"  # Hash chiave del chunk canonico -> firma MinHash
+DEDUP_REFS_PREFIX = "dedup:refs"  # Set per chunk canonico delle chiavi dei chunk che lo referenziano
+
+# Registro delle modifiche ai documenti (scritture ed eliminazioni), letto dalla cache delle query
+DOCUMENT_VERSION_KEY = "changes:version"  # Contatore incrementato a ogni modifica
+DOCUMENT_CHANGES_KEY = "changes:documents"  # ZSET chiave del documento -> versione dell'ultima modifica
+DOCUMENT_CHANGES_RETAINED = 10000  # Documenti mantenuti nel registro
+
+# Configurazione delle scritture in blocco
+REDIS_WRITE_BATCH_SIZE = int(os.getenv('REDIS_WRITE_BATCH_SIZE', 500))  # Comandi per pipeline
+REDIS_MAX_RETRIES = int(os.getenv('REDIS_MAX_RETRIES', 3))  # Tentativi aggiuntivi su errori di connessione transitori
+REDIS_RETRY_BACKOFF = float(os.getenv('REDIS_RETRY_BACKOFF', 0.5))  # Attesa iniziale (secondi), raddoppiata a ogni tentativo
+
+def serialize_embeddings(embeddings):
+    """Serializzazione di una matrice (o di un vettore) di embeddings in byte grezzi float32 little-endian."""
+    return np.ascontiguousarray(embeddings, dtype=EMBEDDING_DTYPE).tobytes()
+
+def deserialize_embeddings(raw, dim):
+    """Deserializzazione zero-copy (vista in sola lettura sul buffer) di una matrice di embeddings."""
+    return np.frombuffer(raw, dtype=EMBEDDING_DTYPE).reshape(-1, dim)
+
+def quantize_int8(embeddings):
+    """Quantizzazione scalare: vettori normalizzati scalati a [-127, 127] (la similarità coseno è preservata)."""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+    return np.clip(np.rint(embeddings / norms * 127), -127, 127).astype(np.int8)
+
+def quantize_binary(embeddings):
+    """Quantizzazione binaria: un bit per componente (segno), 8 componenti per byte."""
+    return np.packbits(np.atleast_2d(np.asarray(embeddings)) > 0, axis=1)
+
+def hamming_distances(codes, query_code):
+    """Distanza di Hamming tra ciascuna riga di `codes` e il codice della query."""
+    return np.unpackbits(np.bitwise_xor(codes, query_code), axis=1).sum(axis=1, dtype=np.int32)
+
+def serialize_search_vectors(embeddings, storage=VECTOR_STORAGE):
+    """Byte dei vettori salvati nel campo `embedding` dei chunk, nel formato della prima fase."""
+    if storage == 'int8':
+        return [row.tobytes() for row in quantize_int8(embeddings)]
+    return [serialize_embeddings(row) for row in np.atleast_2d(embeddings)]
+
+def chunk_keys(cache_key, count, prefix=CHUNK_KEY_PREFIX):
+    """Chiavi dei singoli chunk di un documento (o dei loro vettori a piena precisione) a partire dalla chiave di cache."""
+    document_id = cache_key[len(CACHE_KEY_PREFIX) + 1:]
+    return [f"{prefix}:{document_id}:{i}" for i in range(count)]
+
+def document_key(key):
+    """Chiave di cache del documento a cui appartiene un chunk."""
+    return CACHE_KEY_PREFIX + key[len(CHUNK_KEY_PREFIX):].rsplit(":", 1)[0]
+
+def document_centroids(embeddings, size=ROUTING_CODEBOOK_SIZE, iterations=ROUTING_KMEANS_ITERATIONS):
+    """Codebook k-means sferico degli embeddings dei chunk di un documento.
+
+    Restituisce le medie (non normalizzate) dei vettori normalizzati di ciascun cluster e il numero
+    di chunk per cluster: la media del documento e quella di una collezione si ottengono sommando
+    medie pesate, senza rileggere i chunk. L'inizializzazione su chunk equidistanti nel documento
+    rende il risultato deterministico (coerente con la cache per contenuto).
+    """
+    vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+    size = max(1, min(size, len(vectors)))
+    centers = vectors[np.linspace(0, len(vectors) - 1, size).astype(int)]
+    assignment = np.zeros(len(vectors), dtype=np.int64)
+    for iteration in range(iterations if size > 1 else 0):
+        new_assignment = np.argmax(vectors @ centers.T, axis=1)
+        if iteration and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centers = np.where(norms > 0, sums / np.maximum(norms, np.finfo(np.float32).tiny), centers) # I cluster vuoti restano fermi
+
+    counts = np.bincount(assignment, minlength=size)
+    sums = np.zeros_like(centers)
+    np.add.at(sums, assignment, vectors)
+    nonempty = counts > 0
+    return (sums[nonempty] / counts[nonempty, None]).astype(EMBEDDING_DTYPE), counts[nonempty].astype(np.uint32)
+
+def full_precision_key(key):
+    """Chiave del vettore a piena precisione di un chunk."""
+    return FULL_PRECISION_KEY_PREFIX + key[len(CHUNK_KEY_PREFIX):]
+
+def references_key(key):
+    """Chiave del set dei chunk che referenziano un chunk canonico."""
+    return f"{DEDUP_REFS_PREFIX}:{key}"
+
+_full_precision_client = None
+
+def get_full_precision_client(client):
+    """Client del livello a piena precisione: istanza dedicata se configurata, altrimenti quella dei chunk."""
+    global _full_precision_client
+    if not FULL_PRECISION_REDIS_URL:
+        return client
+    if _full_precision_client is None:
+        _full_precision_client = redis.Redis.from_url(FULL_PRECISION_REDIS_URL)
+    return _full_precision_client
+
+class BulkWriter:
+    """Scrittura in blocco dei chunk tramite pipeline non transazionali (senza MULTI/EXEC) di dimensione fissa.
+
+    I comandi di più documenti vengono accumulati e inviati a blocchi di `batch_size`; un blocco
+    fallito per un errore di connessione transitorio viene reinviato (le HSET sono idempotenti)
+    con attesa esponenziale. L'hash del documento segue sempre i suoi chunk.
+    """
+
+    def __init__(self, client, batch_size=REDIS_WRITE_BATCH_SIZE, max_retries=REDIS_MAX_RETRIES, backoff=REDIS_RETRY_BACKOFF,
+                 storage=VECTOR_STORAGE):
+        self.client = client
+        self.full_precision_client = get_full_precision_client(client)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.storage = storage
+        self.commands = []  # Coppie (chiave, campi) da scrivere con HSET
+        self.full_precision = []  # Coppie (chiave, vettore float32) del livello a piena precisione
+        self.documents = []  # Documenti il cui hash è tra i comandi in attesa
+        self.document_keys = []  # Chiavi di cache degli stessi documenti
+        self.references = []  # (chunk canonico, chunk che lo referenzia, sorgente, collezione) da registrare dopo gli hash
+
+    def add_document(self, cache_key, chunks, embeddings, source, collection, references=None, fingerprints=None):
+        """Accodamento dei chunk di un documento; restituisce i documenti scritti per intero da un eventuale flush.
+
+        Con la deduplicazione `references` indica per ogni chunk la chiave del canonico (None per i
+        chunk unici) e `fingerprints` le impronte (esatta, firma MinHash) dei chunk unici da registrare.
+        """
+        keys = chunk_keys(cache_key, len(chunks))
+        references = references or [None] * len(chunks)
+        search_vectors = serialize_search_vectors(embeddings, self.storage) if self.storage != 'binary' else None
+        for i, (key, chunk, canonical) in enumerate(zip(keys, chunks, references)):
+            fields = {
+                "source": source,
+                "collection": collection,
+                "page_start": chunk["pages"][0],
+                "page_end": chunk["pages"][1]
+            }
+            if canonical is not None:
+                # Riferimento: testo in un campo non indicizzato e nessun vettore, quindi fuori dagli indici vettoriale e full-text
+                fields["ref"] = canonical
+                fields["ref_text"] = chunk["text"]
+                self.references.append((canonical, key, source, collection))
+            else:
+                fields["text"] = chunk["text"]
+                if search_vectors is not None:
+                    fields["embedding"] = search_vectors[i]
+                if fingerprints is not None and fingerprints[i] is not None:
+                    fingerprint, signature = fingerprints[i]
+                    fields["fingerprint"] = fingerprint
+                    self.commands.append((DEDUP_EXACT_KEY, {fingerprint: key}))
+                    if signature is not None:
+                        self.commands.append((DEDUP_SIGNATURES_KEY, {key: signature}))
+            self.commands.append((key, fields))
+
+        document = {
+            "count": len(chunks),
+            "dim": embeddings.shape[1],
+            "storage": self.storage,
+            "source": source,
+            "collection": collection
+        }
+        if self.storage == 'binary':
+            document["bits"] = quantize_binary(embeddings).tobytes() # Codici di tutti i chunk, in ordine
+        centroids, counts = document_centroids(embeddings)
+        document["centroids"] = serialize_embeddings(centroids)
+        document["centroid_counts"] = counts.astype('<u4').tobytes()
+        if self.storage != 'float32':
+            self.full_precision.extend((full_precision_key(key), serialize_embeddings(embedding))
+                                       for key, embedding, canonical in zip(keys, embeddings, references) if canonical is None)
+        self.commands.append((cache_key, document))
+        self.documents.append(source)
+        self.document_keys.append(cache_key)
+
+        if len(self.commands) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Invio di tutti i comandi in attesa; restituisce le sorgenti dei documenti scritti per intero."""
+        commands, self.commands = self.commands, []
+        full_precision, self.full_precision = self.full_precision, []
+        documents, self.documents = self.documents, []
+        document_keys, self.document_keys = self.document_keys, []
+        references, self.references = self.references, []
+        try:
+            # I vettori a piena precisione precedono gli hash dei documenti che li rendono visibili
+            for i in range(0, len(full_precision), self.batch_size):
+                self._execute(self.full_precision_client, full_precision[i:i + self.batch_size], "set")
+            for i in range(0, len(commands), self.batch_size):
+                self._execute(self.client, commands[i:i + self.batch_size], "hset")
+            if references:
+                for i in range(0, len(references), self.batch_size):
+                    self._execute(self.client, [(references_key(canonical), key) for canonical, key, _, _ in references[i:i + self.batch_size]], "sadd")
+                add_references(self.client, references)
+            record_document_changes(self.client, document_keys)
+        except Exception:
+            logger.error(f"Scrittura su Redis non completata per i documenti: {', '.join(documents)}")
+            raise
+        return documents
+
+    def _execute(self, client, commands, command):
+        for attempt in range(self.max_retries + 1):
+            try:
+                pipe = client.pipeline(transaction=False)
+                for key, value in commands:
+                    if command == "hset":
+                        pipe.hset(key, mapping=value)
+                    elif command == "sadd":
+                        pipe.sadd(key, value)
+                    else:
+                        pipe.set(key, value)
+                with redis_roundtrip(f"write_{command}"):
+                    pipe.execute()
+                return
+            except (ConnectionError, TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Errore di connessione a Redis durante la scrittura di {len(commands)} comandi, nuovo tentativo tra {delay} secondi: {e}")
+                sleep(delay)
+
+def store_chunks(client, cache_key, chunks, embeddings, source, collection, references=None, fingerprints=None):
+    """Salvataggio dei chunk di un documento (un hash per chunk) e, per ultimo, dell'hash del documento."""
+    writer = BulkWriter(client)
+    writer.add_document(cache_key, chunks, embeddings, source, collection, references, fingerprints)
+    writer.flush()
+
+def cached_documents(client, cache_keys, batch_size=REDIS_WRITE_BATCH_SIZE):
+    """Verifica in blocco (una pipeline ogni `batch_size` chiavi) dei documenti già salvati con `store_chunks`."""
+    cache_keys = list(cache_keys)
+    cached = set()
+    for i in range(0, len(cache_keys), batch_size):
+        batch = cache_keys[i:i + batch_size]
+        pipe = client.pipeline(transaction=False)
+        for cache_key in batch:
+            pipe.hexists(cache_key, "count")
+        # Le chiavi in un formato precedente (non hash) risultano assenti e verranno rigenerate
+        with redis_roundtrip("cached_documents"):
+            replies = pipe.execute(raise_on_error=False)
+        for cache_key, exists in zip(batch, replies):
+            if exists is True or exists == 1:
+                cached.add(cache_key)
+    return cached
+
+def load_chunks(client, cache_key):
+    """Lettura dei chunk di un documento (embedding float32 come vista zero-copy sul buffer); None se assente."""
+    try:
+        count, dim, storage = client.hmget(cache_key, "count", "dim", "storage")
+    except ResponseError:
+        return None
+    if count is None:
+        return None
+
+    keys = chunk_keys(cache_key, int(count))
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hmget(key, "text", "embedding", "page_start", "page_end", "ref", "ref_text")
+    with redis_roundtrip("load_chunks"):
+        rows = [list(row) for row in pipe.execute()]
+
+    # Chunk deduplicati: il proprio testo e il vettore del chunk canonico
+    referenced = [i for i, row in enumerate(rows) if row[4] is not None]
+    if referenced:
+        pipe = client.pipeline(transaction=False)
+        for i in referenced:
+            pipe.hget(rows[i][4], "embedding")
+        with redis_roundtrip("load_chunks"):
+            for i, raw in zip(referenced, pipe.execute()):
+                rows[i][0], rows[i][1] = rows[i][5], raw
+
+    if storage not in (None, b"float32"):
+        # Vettori compressi: gli embeddings a piena precisione sono nel livello dedicato
+        vectors = get_full_precision_client(client).mget([full_precision_key(row[4].decode('utf-8') if row[4] is not None else key)
+                                                          for key, row in zip(keys, rows)])
+        for row, raw in zip(rows, vectors):
+            row[1] = raw
+
+    chunks = []
+    for text, raw, page_start, page_end, _, _ in rows:
+        if text is None or raw is None:
+            return None # Documento salvato solo in parte
+        chunks.append({
+            "text": text.decode('utf-8'),
+            "pages": (int(page_start), int(page_end)),
+            "embedding": deserialize_embeddings(raw, int(dim))[0]
+        })
+    return chunks
+
+def delete_documents(client, cache_keys):
+    """Eliminazione degli hash dei documenti indicati e di tutti i loro chunk.
+
+    I chunk canonici ancora referenziati da chunk di altri documenti sono mantenuti (con sorgente e
+    collezione aggiornate) ed eliminati quando l'ultimo riferimento viene rimosso.
+    """
+    cache_keys = list(cache_keys)
+    if not cache_keys:
+        return
+
+    pipe = client.pipeline(transaction=False)
+    for cache_key in cache_keys:
+        pipe.hmget(cache_key, "count", "storage")
+    documents = []
+    for document in pipe.execute(raise_on_error=False):
+        count, storage = (None, None) if isinstance(document, Exception) else document # Chiavi in un formato precedente: solo l'hash del documento
+        documents.append((int(count or 0), storage))
+
+    # Riferimenti dei chunk eliminati e chunk canonici ancora referenziati
+    keys = [key for cache_key, (count, _) in zip(cache_keys, documents) for key in chunk_keys(cache_key, count)]
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hmget(key, "ref", "fingerprint")
+        pipe.scard(references_key(key))
+    replies = pipe.execute() if keys else []
+    canonicals, kept = [], set()
+    for key, (ref, fingerprint), referenced in zip(keys, replies[::2], replies[1::2]):
+        if ref is not None:
+            canonicals.append(ref.decode('utf-8'))
+            pipe.srem(references_key(canonicals[-1]), key)
+        elif referenced:
+            canonicals.append(key)
+            kept.add(key)
+        elif fingerprint is not None:
+            pipe.hdel(DEDUP_EXACT_KEY, fingerprint)
+            pipe.hdel(DEDUP_SIGNATURES_KEY, key)
+
+    full_precision_pipe = get_full_precision_client(client).pipeline(transaction=False)
+    for cache_key, (count, storage) in zip(cache_keys, documents):
+        keys = [key for key in chunk_keys(cache_key, count) if key not in kept]
+        pipe.delete(cache_key, *keys)
+        if keys and storage not in (None, b"float32"):
+            full_precision_pipe.delete(*(full_precision_key(key) for key in keys))
+    pipe.execute()
+    full_precision_pipe.execute()
+    refresh_references(client, canonicals)
+    record_document_changes(client, cache_keys)
+
+def add_references(client, references):
+    """Aggiunta della sorgente e della collezione di nuovi riferimenti (canonico, chunk, sorgente, collezione) ai TAG dei canonici.
+
+    `source` e `collection` (TAG multivalore separati da virgola) sono riscritti solo se cambiano:
+    ogni HSET fa reindicizzare il chunk a RediSearch.
+    """
+    additions = {}  # Canonico -> (sorgenti, collezioni) dei nuovi riferimenti
+    for canonical, _, source, collection in references:
+        sources, collections = additions.setdefault(canonical, ([], []))
+        sources.append(source)
+        collections.append(collection)
+    canonical_keys = list(additions)
+    pipe = client.pipeline(transaction=False)
+    for key in canonical_keys:
+        pipe.hmget(key, "source", "collection")
+    replies = pipe.execute()
+
+    pipe = client.pipeline(transaction=False)
+    for key, (source, collection) in zip(canonical_keys, replies):
+        if source is None:
+            continue # Canonico eliminato nel frattempo
+        sources, collections = source.decode('utf-8').split(","), collection.decode('utf-8').split(",")
+        new_sources = [value for value in dict.fromkeys(additions[key][0]) if value not in sources]
+        new_collections = [value for value in dict.fromkeys(additions[key][1]) if value not in collections]
+        if new_sources or new_collections:
+            pipe.hset(key, mapping={"source": ",".join(sources + new_sources), "collection": ",".join(collections + new_collections)})
+    pipe.execute()
+
+def refresh_references(client, canonical_keys):
+    """Aggiornamento dei chunk canonici dopo la rimozione di riferimenti (eliminazione dei documenti che li contengono).
+
+    `source` e `collection` tornano l'unione di quelli del documento proprietario e dei chunk che
+    li referenziano ancora; i canonici senza riferimenti il cui documento è stato eliminato vengono
+    eliminati con le loro impronte.
+    """
+    canonical_keys = list(dict.fromkeys(canonical_keys))
+    if not canonical_keys:
+        return
+    pipe = client.pipeline(transaction=False)
+    for key in canonical_keys:
+        pipe.hmget(key, "page_start", "fingerprint")
+        pipe.hmget(document_key(key), "source", "collection")
+        pipe.smembers(references_key(key))
+    replies = pipe.execute()
+    members = sorted({member for refs in replies[2::3] for member in refs})
+    pipe = client.pipeline(transaction=False)
+    for member in members:
+        pipe.hmget(member, "source", "collection")
+    tags = dict(zip(members, pipe.execute()))
+
+    orphans = []
+    pipe = client.pipeline(transaction=False)
+    for key, (exists, fingerprint), owner, refs in zip(canonical_keys, replies[::3], replies[1::3], replies[2::3]):
+        if exists is None:
+            pipe.delete(references_key(key)) # Canonico già eliminato
+            continue
+        if owner[0] is None and not refs:
+            orphans.append(key)
+            pipe.delete(key, references_key(key))
+            pipe.hdel(DEDUP_SIGNATURES_KEY, key)
+            if fingerprint is not None:
+                pipe.hdel(DEDUP_EXACT_KEY, fingerprint)
+            continue
+        sources, collections = [], []
+        for source, collection in [owner] + [tags[member] for member in sorted(refs)]:
+            if source is not None and source.decode('utf-8') not in sources:
+                sources.append(source.decode('utf-8'))
+            if collection is not None and collection.decode('utf-8') not in collections:
+                collections.append(collection.decode('utf-8'))
+        pipe.hset(key, mapping={"source": ",".join(sources), "collection": ",".join(collections)})
+    pipe.execute()
+    if orphans:
+        get_full_precision_client(client).delete(*(full_precision_key(key) for key in orphans))
+    record_document_changes(client, [document_key(key) for key in canonical_keys])
+
+def load_chunk_vectors(client, keys, storage=VECTOR_STORAGE):
+    """Embeddings a piena precisione dei chunk indicati (chiave -> vettore); i chunk assenti sono omessi."""
+    keys = list(keys)
+    if storage == 'float32':
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hget(key, "embedding")
+        with redis_roundtrip("load_chunks"):
+            raws = pipe.execute()
+    else:
+        with redis_roundtrip("load_chunks"):
+            raws = get_full_precision_client(client).mget([full_precision_key(key) for key in keys])
+    return {key: np.frombuffer(raw, dtype=EMBEDDING_DTYPE) for key, raw in zip(keys, raws) if raw is not None}
+
+def record_document_changes(client, cache_keys):
+    """Registrazione di documenti scritti o eliminati con una nuova versione (invalida i risultati in cache che li usano)."""
+    if not cache_keys:
+        return
+    version = client.incr(DOCUMENT_VERSION_KEY)
+    pipe = client.pipeline(transaction=False)
+    pipe.zadd(DOCUMENT_CHANGES_KEY, {cache_key: version for cache_key in cache_keys})
+    pipe.zremrangebyrank(DOCUMENT_CHANGES_KEY, 0, -DOCUMENT_CHANGES_RETAINED - 1)
+    pipe.execute()
+
+def document_changes_since(client, version):
+    """Versione corrente e documenti modificati dopo `version`.
+
+    Al posto dei documenti restituisce None se il registro non copre tutte le modifiche successive a
+    `version` (documenti meno recenti rimossi dal registro, oppure contatore azzerato).
+    """
+    pipe = client.pipeline(transaction=False)
+    pipe.get(DOCUMENT_VERSION_KEY)
+    if version is not None:
+        pipe.zrangebyscore(DOCUMENT_CHANGES_KEY, f"({version}", "+inf")
+        pipe.zcard(DOCUMENT_CHANGES_KEY)
+        pipe.zrange(DOCUMENT_CHANGES_KEY, 0, 0, withscores=True)
+    with redis_roundtrip("document_changes"):
+        replies = pipe.execute()
+    current = int(replies[0] or 0)
+    if version is None or current == version:
+        return current, set()
+    changed, retained, oldest = replies[1:]
+    if current < version or (retained >= DOCUMENT_CHANGES_RETAINED and oldest and oldest[0][1] > version):
+        return current, None
+    return current, {key.decode('utf-8') for key in changed}
+
+def create_vector_index(client, dim, index_name=VECTOR_INDEX_NAME, prefix=CHUNK_KEY_PREFIX,
+                        algorithm=VECTOR_INDEX_ALGORITHM, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, storage=VECTOR_STORAGE):
+    """Creazione (se assente) dell'indice RediSearch sui chunk: vettore HNSW o FLAT (float32 o int8) e campi di filtro.
+
+    Con la memorizzazione binaria l'indice contiene solo i campi di testo e di filtro.
+    """
+    try:
+        client.ft(index_name).info()
+        return False # Indice già esistente
+    except ResponseError:
+        pass
+
+    fields = [
+        TextField("text"),
+        TagField("source"),
+        TagField("collection"),
+        NumericField("page_start"),
+        NumericField("page_end")
+    ]
+    if storage != 'binary':
+        attributes = {"TYPE": "INT8" if storage == 'int8' else "FLOAT32", "DIM": dim, "DISTANCE_METRIC": "COSINE"}
+        if algorithm == "HNSW":
+            attributes.update({"M": m, "EF_CONSTRUCTION": ef_construction})
+        fields.append(VectorField("embedding", algorithm, attributes))
+
+    client.ft(index_name).create_index(fields, definition=IndexDefinition(prefix=[f"{prefix}:"], index_type=IndexType.HASH))
+    logger.info(f"Creato l'indice vettoriale {index_name} ({algorithm}, {storage}, dim={dim})")
+    return True
+
+def escape_tag(value):
+    """Escape dei caratteri speciali nei valori dei campi TAG di RediSearch."""
+    return "".join(f"\\{c}" if not c.isalnum() and c != "_" else c for c in value)
+
+def document_filter(documents):
+    """Filtro RediSearch sui documenti indicati (dizionari con `collection` e `source`), raggruppati per collezione."""
+    groups = {}
+    for document in documents:
+        groups.setdefault(document["collection"], []).append(document["source"])
+    return "(" + " | ".join(
+        "(@collection:{" + escape_tag(collection) + "} @source:{" + "|".join(escape_tag(source) for source in sources) + "})"
+        for collection, sources in groups.items()
+    ) + ")"
+
+def rescore(client, candidates, query_vector, k):
+    """Ricalcolo della similarità coseno dei candidati con i vettori a piena precisione; restituisce i primi `k`."""
+    if not candidates:
+        return []
+    with redis_roundtrip("rescore"):
+        raws = get_full_precision_client(client).mget([full_precision_key(candidate.get("ref", candidate["key"])) for candidate in candidates])
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), np.finfo(np.float32).tiny)
+    for candidate, raw in zip(candidates, raws):
+        if raw is None:
+            continue # Vettore non disponibile: resta lo score approssimato
+        vector = np.frombuffer(raw, dtype=EMBEDDING_DTYPE)
+        candidate["score"] = float(vector @ query) / max(float(np.linalg.norm(vector)), np.finfo(np.float32).tiny)
+    return sorted(candidates, key=lambda candidate: candidate["score"], reverse=True)[:k]
+
+class BinaryIndex:
+    """Codici binari di tutti i chunk, letti dagli hash dei documenti e mantenuti in memoria per `ttl` secondi."""
+
+    def __init__(self, ttl=BINARY_INDEX_TTL):
+        self.ttl = ttl
+        self.loaded_at = None
+        self.codes = None  # Matrice (chunk, byte) dei codici
+        self.keys = []  # Chiave del chunk per riga
+        self.collections = np.empty(0, dtype=object)  # Collezione per riga
+        self.documents = np.empty(0, dtype=object)  # Chiave del documento per riga
+
+    def refresh(self, client):
+        if self.loaded_at is not None and time() - self.loaded_at < self.ttl:
+            return
+        cache_keys = [key.decode('utf-8') for key in client.scan_iter(match=f"{CACHE_KEY_PREFIX}:*", count=1000)]
+        pipe = client.pipeline(transaction=False)
+        for cache_key in cache_keys:
+            pipe.hmget(cache_key, "count", "dim", "collection", "bits")
+        codes, keys, collections, documents = [], [], [], []
+        for cache_key, (count, dim, collection, bits) in zip(cache_keys, pipe.execute(raise_on_error=False)):
+            if bits is None or count is None:
+                continue # Documento non binario o salvato solo in parte
+            count, dim = int(count), int(dim)
+            codes.append(np.frombuffer(bits, dtype=np.uint8).reshape(count, (dim + 7) // 8))
+            keys.extend(chunk_keys(cache_key, count))
+            collections.extend([collection.decode('utf-8')] * count)
+            documents.extend([cache_key] * count)
+        self.codes = np.concatenate(codes) if codes else np.empty((0, 0), dtype=np.uint8)
+        self.keys = keys
+        self.collections = np.array(collections, dtype=object)
+        self.documents = np.array(documents, dtype=object)
+        self.loaded_at = time()
+        logger.info(f"Caricati {len(keys)} codici binari da {len(codes)} documenti")
+
+    def search(self, client, query_vector, n, collections=None, documents=None):
+        """Chiavi degli `n` chunk con distanza di Hamming minima dalla query (con filtro per collezione o per documento)."""
+        self.refresh(client)
+        if len(self.keys) == 0:
+            return []
+        distances = hamming_distances(self.codes, quantize_binary(query_vector)[0])
+        if collections:
+            distances = np.where(np.isin(self.collections, list(collections)), distances, np.iinfo(np.int32).max)
+        if documents:
+            distances = np.where(np.isin(self.documents, [document["key"] for document in documents]), distances, np.iinfo(np.int32).max)
+        n = min(n, len(distances))
+        top = np.argpartition(distances, n - 1)[:n]
+        return [(self.keys[i], int(distances[i])) for i in top[np.argsort(distances[top])] if distances[i] != np.iinfo(np.int32).max]
+
+binary_index = BinaryIndex()
+
+def knn_search(client, query_vector, k=5, collections=None, index_name=VECTOR_INDEX_NAME, ef_runtime=None,
+               storage=VECTOR_STORAGE, rescore_factor=RESCORE_FACTOR, documents=None):
+    """Ricerca dei `k` chunk più vicini al vettore di query, con pre-filtro opzionale per collezione o per documento.
+
+    Lo score restituito è la similarità coseno (1 - distanza). Con vettori compressi la prima fase
+    seleziona `k * rescore_factor` candidati, il cui score è poi ricalcolato a piena precisione.
+    """
+    if storage == 'binary':
+        return binary_search(client, query_vector, k, collections, rescore_factor, documents)
+    n_candidates = k if storage == 'float32' else k * rescore_factor
+
+    query_filter = "*"
+    if documents:
+        query_filter = document_filter(documents)
+    elif collections:
+        query_filter = "(@collection:{" + "|".join(escape_tag(c) for c in collections) + "})"
+
+    params = {"vec": serialize_search_vectors(query_vector, storage)[0], "k": n_candidates}
+    knn = "KNN $k @embedding $vec"
+    if ef_runtime:
+        knn += " EF_RUNTIME $ef"
+        params["ef"] = ef_runtime
+
+    query = (
+        Query(f"{query_filter}=>[{knn} AS distance]")
+        .sort_by("distance")
+        .return_fields("text", "source", "collection", "page_start", "page_end", "distance")
+        .paging(0, n_candidates)
+        .dialect(2)
+    )
+
+    with redis_roundtrip("knn_search"):
+        results = client.ft(index_name).search(query, query_params=params)
+    candidates = [
+        {
+            "key": doc.id,
+            "text": doc.text,
+            "source": doc.source,
+            "collection": doc.collection,
+            "page_start": int(doc.page_start),
+            "page_end": int(doc.page_end),
+            "score": 1.0 - float(doc.distance)
+        }
+        for doc in results.docs
+    ]
+    if storage == 'float32':
+        return candidates
+    return rescore(client, candidates, query_vector, k)
+
+def fetch_chunks(client, hits):
+    """Campi dei chunk indicati da coppie (chiave, score), nell'ordine dato; i chunk non più presenti sono saltati.
+
+    I chunk deduplicati (presenti nei codici binari) hanno il proprio testo e in `ref` la chiave del
+    canonico, di cui condividono il vettore a piena precisione.
+    """
+    pipe = client.pipeline(transaction=False)
+    for key, _ in hits:
+        pipe.hmget(key, "text", "source", "collection", "page_start", "page_end", "ref", "ref_text")
+    with redis_roundtrip("fetch_chunks"):
+        rows = pipe.execute()
+
+    chunks = []
+    for (key, score), (text, source, collection, page_start, page_end, ref, ref_text) in zip(hits, rows):
+        if ref is not None:
+            text = ref_text
+        if text is None:
+            continue # Chunk eliminato dopo la costruzione dell'indice
+        chunk = {
+            "key": key,
+            "text": text.decode('utf-8'),
+            "source": source.decode('utf-8'),
+            "collection": collection.decode('utf-8'),
+            "page_start": int(page_start),
+            "page_end": int(page_end),
+            "score": score
+        }
+        if ref is not None:
+            chunk["ref"] = ref.decode('utf-8')
+        chunks.append(chunk)
+    return chunks
+
+def binary_search(client, query_vector, k=5, collections=None, rescore_factor=RESCORE_FACTOR, documents=None):
+    """Ricerca in due fasi sui codici binari: Hamming in memoria, poi ricalcolo a piena precisione."""
+    hits = binary_index.search(client, query_vector, k * rescore_factor, collections, documents)
+    dim = len(query_vector)
+    candidates = fetch_chunks(client, [(key, 1.0 - 2.0 * distance / dim) for key, distance in hits]) # Stima della similarità dall'angolo tra i codici
+    return rescore(client, candidates, query_vector, k)
+
+def text_search(client, terms, k=5, collections=None, index_name=VECTOR_INDEX_NAME, documents=None):
+    """Ricerca full-text BM25 di RediSearch sul campo `text` dei chunk (almeno uno dei termini, con filtro per collezione o documento)."""
+    terms = [escape_tag(term) for term in terms if term]
+    if not terms:
+        return []
+    query_filter = "(" + "|".join(terms) + ")"
+    if documents:
+        query_filter = document_filter(documents) + " " + query_filter
+    elif collections:
+        query_filter = "(@collection:{" + "|".join(escape_tag(c) for c in collections) + "}) " + query_filter
+
+    query = (
+        Query(query_filter)
+        .scorer("BM25")
+        .with_scores()
+        .return_fields("text", "source", "collection", "page_start", "page_end")
+        .paging(0, k)
+        .dialect(2)
+    )
+    with redis_roundtrip("text_search"):
+        results = client.ft(index_name).search(query)
+    return [
+        {
+            "key": doc.id,
+            "text": doc.text,
+            "source": doc.source,
+            "collection": doc.collection,
+            "page_start": int(doc.page_start),
+            "page_end": int(doc.page_end),
+            "score": float(doc.score)
+        }
+        for doc in results.docs
+    ]
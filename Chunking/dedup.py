@@ -0,0 +1,248 @@
+"""Deduplicazione dei chunk tra documenti e collezioni: impronta esatta e MinHash/LSH per i quasi duplicati.
+
+Le guide di RHEL 8 e RHEL 9 (e le varie edizioni di Windows Server) ripetono interi paragrafi
+identici o quasi. Dopo `create_chunks_based_on_distances` ogni chunk riceve due impronte:
+- esatta: hash del testo normalizzato (minuscole, solo parole), per le ripetizioni letterali;
+- MinHash: `DEDUP_NUM_PERM` minimi delle permutazioni degli shingle di `DEDUP_SHINGLE_SIZE`
+  parole, raggruppati in `DEDUP_BANDS` bande per la ricerca LSH dei candidati; un candidato è un
+  quasi duplicato se la Jaccard stimata (componenti uguali delle firme) è almeno `DEDUP_THRESHOLD`.
+
+Il primo chunk con una data impronta è il canonico: è l'unico codificato e indicizzato. I
+duplicati sono salvati come riferimenti (campo `ref`, con il proprio testo nel campo non
+indicizzato `ref_text` e senza vettore, quindi fuori dall'indice HNSW e dal full-text) e i campi
+TAG `source` e `collection` del canonico diventano l'unione di quelli dei documenti che lo
+contengono, così i filtri per collezione e per documento continuano a trovarlo (vedi
+`chunk_store.add_references` e `chunk_store.refresh_references`). Chiavi usate:
+- `dedup:exact` (hash): impronta esatta -> chiave del chunk canonico;
+- `dedup:signatures` (hash): chiave del chunk canonico -> firma MinHash (uint32);
+- `dedup:refs:<chiave del canonico>` (set): chiavi dei chunk che lo referenziano.
+
+Le firme dipendono da `DEDUP_SEED`: cambiandolo le firme salvate non sono più confrontabili e
+vanno eliminate le chiavi `dedup:*` (i documenti già scritti restano validi). Con la memorizzazione
+'binary' i codici dei duplicati restano nella matrice in memoria di `BinaryIndex`, che filtra per
+la sola collezione del documento proprietario.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from chunk_store import DEDUP_EXACT_KEY, DEDUP_SIGNATURES_KEY, chunk_keys, load_chunk_vectors
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione della deduplicazione dei chunk
+DEDUP_ENABLED = os.getenv('CHUNK_DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_THRESHOLD = float(os.getenv('CHUNK_DEDUP_THRESHOLD', 0.9))  # Jaccard stimata minima tra gli shingle di due quasi duplicati
+DEDUP_SHINGLE_SIZE = int(os.getenv('CHUNK_DEDUP_SHINGLE_SIZE', 5))  # Parole per shingle
+DEDUP_VECTOR_ITEMS = int(os.getenv('CHUNK_DEDUP_VECTOR_ITEMS', 20000))  # Vettori dei canonici tenuti in memoria (LRU)
+DEDUP_NUM_PERM = 64  # Componenti della firma MinHash
+DEDUP_BANDS = 8  # Bande LSH (DEDUP_NUM_PERM / DEDUP_BANDS righe ciascuna): soglia di candidatura circa (1/8)^(1/8) = 0.77
+DEDUP_SEED = 1  # Seme delle permutazioni: deve restare lo stesso delle firme salvate
+
+# Permutazioni universali (a * x + b) mod p sugli hash a 32 bit degli shingle
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(DEDUP_SEED)
+_PERM_A = _rng.integers(1, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.uint64)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def normalize_text(text):
+    """Parole del testo in minuscolo: spazi, a capo e punteggiatura non distinguono due chunk."""
+    return WORD_PATTERN.findall(text.lower())
+
+def exact_fingerprint(words):
+    """Impronta esatta (128 bit, esadecimale) delle parole normalizzate."""
+    return hashlib.blake2b(" ".join(words).encode('utf-8'), digest_size=16).hexdigest()
+
+def minhash_signature(words, shingle_size=DEDUP_SHINGLE_SIZE):
+    """Firma MinHash degli shingle di parole; None per i testi più corti di uno shingle."""
+    if len(words) < shingle_size:
+        return None
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # a < 2^32 e x < 2^32: il prodotto sta in 64 bit; il modulo per il primo di Mersenne evita gli overflow della somma
+    permuted = (_PERM_A[:, None] * hashes[None, :] % _MERSENNE_PRIME + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return (permuted.min(axis=1) & 0xFFFFFFFF).astype(np.uint32)
+
+def band_keys(signature, bands=DEDUP_BANDS):
+    """Chiavi dei bucket LSH della firma, una per banda."""
+    rows = len(signature) // bands
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+class DedupIndex:
+    """Impronte dei chunk canonici (esatte e MinHash con bucket LSH) e vettori dei canonici usati di recente.
+
+    I nuovi canonici di un documento restano in attesa (visibili solo al documento stesso) finché
+    i suoi chunk non sono stati scritti (`commit`); se la scrittura fallisce vengono scartati
+    (`discard`), così nessun altro documento referenzia chunk mai salvati. Il lock permette di
+    confermare i documenti dal thread di scrittura mentre il thread principale assegna i successivi.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=DEDUP_BANDS, max_vectors=DEDUP_VECTOR_ITEMS):
+        self.threshold = threshold
+        self.bands = bands
+        self.max_vectors = max_vectors
+        self.exact = {}  # Impronta esatta -> chiave del canonico
+        self.signatures = {}  # Chiave del canonico -> firma MinHash
+        self.buckets = {}  # (banda, valori della banda) -> chiavi dei canonici
+        self.vectors = OrderedDict()  # Chiave del canonico -> embedding, dal meno al più usato di recente
+        self.pending = {}  # Chiave del documento -> impronte (exact, signatures, buckets) dei suoi nuovi canonici
+        self.lock = threading.Lock()
+        self.stats = {"chunks": 0, "exact": 0, "near": 0}
+
+    def load(self, client):
+        """Sostituzione delle impronte in memoria con quelle salvate in Redis (da eseguire dopo le eliminazioni dei documenti)."""
+        exact = {fingerprint.decode('utf-8'): key.decode('utf-8')
+                 for fingerprint, key in client.hscan_iter(DEDUP_EXACT_KEY, count=1000)}
+        signatures = [(key.decode('utf-8'), np.frombuffer(raw, dtype='<u4'))
+                      for key, raw in client.hscan_iter(DEDUP_SIGNATURES_KEY, count=1000)]
+        with self.lock:
+            self.exact = exact
+            self.signatures = {}
+            self.buckets = {}
+            self.vectors = OrderedDict()
+            self.pending = {}
+            self.stats = {"chunks": 0, "exact": 0, "near": 0}
+            for key, signature in signatures:
+                self._add_signature(key, signature, self.signatures, self.buckets)
+        logger.info(f"Impronte dei chunk caricate: {len(self.exact)} esatte, {len(self.signatures)} MinHash")
+
+    def _add_signature(self, key, signature, signatures, buckets):
+        signatures[key] = signature
+        for bucket in band_keys(signature, self.bands):
+            buckets.setdefault(bucket, []).append(key)
+
+    def _remember(self, key, vector):
+        # Copia: una vista terrebbe in memoria l'intera matrice degli embeddings del documento
+        self.vectors[key] = np.array(vector, dtype=np.float32)
+        self.vectors.move_to_end(key)
+        if len(self.vectors) > self.max_vectors:
+            self.vectors.popitem(last=False)
+
+    def match(self, signature, pending=None):
+        """Canonico quasi duplicato con la Jaccard stimata più alta (almeno `threshold`); None se assente.
+
+        Con `pending` sono considerati anche i nuovi canonici non ancora confermati di un documento.
+        """
+        if signature is None:
+            return None
+        bands = band_keys(signature, self.bands)
+        best, best_similarity = None, self.threshold
+        for signatures, buckets in [(self.signatures, self.buckets)] + ([(pending["signatures"], pending["buckets"])] if pending else []):
+            for key in {key for bucket in bands for key in buckets.get(bucket, ())}:
+                similarity = float(np.mean(signatures[key] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = key, similarity
+        return best
+
+    def assign(self, cache_key, chunks):
+        """Canonico di ogni chunk del documento (None per i chunk unici, nuovi canonici in attesa di `commit`).
+
+        Restituisce anche le impronte (esatta, firma in byte o None) da salvare per i chunk unici,
+        None per i duplicati.
+        """
+        pending = {"exact": {}, "signatures": {}, "buckets": {}}
+        references, fingerprints = [], []
+        with self.lock:
+            for key, chunk in zip(chunk_keys(cache_key, len(chunks)), chunks):
+                words = normalize_text(chunk["text"])
+                fingerprint = exact_fingerprint(words)
+                canonical = self.exact.get(fingerprint) or pending["exact"].get(fingerprint)
+                signature = None
+                if canonical is not None:
+                    self.stats["exact"] += 1
+                else:
+                    signature = minhash_signature(words)
+                    canonical = self.match(signature, pending)
+                    if canonical is not None:
+                        self.stats["near"] += 1
+                    else:
+                        pending["exact"][fingerprint] = key
+                        if signature is not None:
+                            self._add_signature(key, signature, pending["signatures"], pending["buckets"])
+                references.append(canonical)
+                fingerprints.append(None if canonical is not None else
+                                    (fingerprint, signature.astype('<u4').tobytes() if signature is not None else None))
+            self.stats["chunks"] += len(chunks)
+            self.pending[cache_key] = pending
+        return references, fingerprints
+
+    def commit(self, cache_key):
+        """Registrazione dei nuovi canonici di un documento i cui chunk sono stati scritti."""
+        with self.lock:
+            pending = self.pending.pop(cache_key, None)
+            if pending is None:
+                return
+            for fingerprint, key in pending["exact"].items():
+                self.exact.setdefault(fingerprint, key)
+            for key, signature in pending["signatures"].items():
+                self._add_signature(key, signature, self.signatures, self.buckets)
+
+    def discard(self, cache_key):
+        """Scarto dei nuovi canonici (impronte e vettori) di un documento la cui scrittura non è riuscita."""
+        with self.lock:
+            pending = self.pending.pop(cache_key, None)
+            if pending is None:
+                return
+            for key in pending["exact"].values():
+                self.vectors.pop(key, None)
+
+    def expand(self, client, cache_key, chunks, references, unique_embeddings, encode):
+        """Matrice degli embeddings di tutti i chunk: righe dei chunk unici da `unique_embeddings`, dei duplicati dal canonico.
+
+        I vettori dei canonici sono presi da quelli usati di recente (al più `max_vectors`) o letti da
+        Redis; un canonico non disponibile (documento eliminato nel frattempo, oppure vettore uscito
+        dalla memoria prima della scrittura) rende unico il duplicato, che viene codificato con
+        `encode(testi)` e aggiornato in `references`.
+        """
+        keys = chunk_keys(cache_key, len(chunks))
+        unique = [i for i, canonical in enumerate(references) if canonical is None]
+        embeddings = np.empty((len(chunks), unique_embeddings.shape[1]), dtype=np.float32)
+        embeddings[unique] = unique_embeddings
+        with self.lock:
+            for i in unique:
+                self._remember(keys[i], embeddings[i])
+            missing = list({canonical for canonical in references if canonical is not None and canonical not in self.vectors})
+
+        loaded = load_chunk_vectors(client, missing) if missing else {}
+        unresolved = []
+        with self.lock:
+            for i, canonical in enumerate(references):
+                if canonical is None:
+                    continue
+                vector = self.vectors.get(canonical)
+                if vector is None:
+                    vector = loaded.get(canonical)
+                if vector is None:
+                    unresolved.append(i)
+                    references[i] = None
+                else:
+                    self._remember(canonical, vector)
+                    embeddings[i] = vector
+        if unresolved:
+            logger.warning(f"Chunk canonici non disponibili per {len(unresolved)} chunk di {cache_key}: nuova codifica")
+            embeddings[unresolved] = encode([chunks[i]["text"] for i in unresolved])
+            with self.lock:
+                for i in unresolved:
+                    self._remember(keys[i], embeddings[i])
+        return embeddings
+
+    def log_stats(self, encode_seconds_per_chunk=None):
+        """Riepilogo nel log: chunk duplicati e stima del tempo di codifica risparmiato."""
+        duplicates = self.stats["exact"] + self.stats["near"]
+        if not self.stats["chunks"]:
+            return
+        message = (f"Deduplicazione dei chunk: {duplicates} duplicati su {self.stats['chunks']} "
+                   f"({duplicates / self.stats['chunks']:.1%}; {self.stats['exact']} esatti, {self.stats['near']} quasi duplicati)")
+        if encode_seconds_per_chunk:
+            message += f", circa {duplicates * encode_seconds_per_chunk:.2f} secondi di codifica risparmiati"
+        logger.info(message)
+
+dedup_index = DedupIndex()
@@ -0,0 +1,198 @@
+"""Cache degli embeddings davanti a `SentenceTransformer.encode`, indicizzata per hash del testo normalizzato.
+
+Le unità si sovrappongono (ogni frase compare in più unità consecutive) e gli stessi paragrafi
+ricorrono in centinaia di PDF (note legali, intestazioni degli articoli, "Providing feedback on
+Red Hat documentation"): i loro embeddings vengono calcolati una sola volta e riutilizzati.
+
+Due livelli:
+- LRU in memoria nel processo (`EMBEDDING_CACHE_MEMORY_ITEMS` vettori);
+- SQLite su disco locale (`EMBEDDING_CACHE_PATH`), limitato a `EMBEDDING_CACHE_DISK_ITEMS` vettori
+  con eliminazione dei meno usati di recente.
+
+La chiave è l'hash BLAKE2b del nome del modello e del testo con spazi normalizzati; i vettori
+sono salvati come byte float32 little-endian. Gli errori del livello su disco non interrompono
+la codifica: il livello viene disattivato e si prosegue con la sola memoria.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from time import time
+
+import numpy as np
+
+from chunk_store import EMBEDDING_DTYPE
+from metrics import record_cache
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione della cache degli embeddings
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv('EMBEDDING_CACHE_MEMORY_ITEMS', 20000))  # Vettori nel livello in memoria (~1.5 KiB l'uno a dim 384)
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'chunking_embeddings.sqlite'))  # Vuoto per disattivare il disco
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv('EMBEDDING_CACHE_DISK_ITEMS', 500000))  # Vettori massimi su disco
+EMBEDDING_CACHE_EVICT_RATIO = 0.9  # Frazione del limite mantenuta dopo un'eliminazione
+SQLITE_MAX_VARIABLES = 500  # Chiavi per singola query IN (...)
+
+def normalize_text(text):
+    """Normalizzazione del testo usata per la chiave: spazi consecutivi ridotti a uno, estremi rimossi."""
+    return " ".join(text.split())
+
+def text_key(text, model_name):
+    """Chiave binaria (16 byte) di un testo per un dato modello."""
+    return hashlib.blake2b(f"{model_name}\0{normalize_text(text)}".encode('utf-8'), digest_size=16).digest()
+
+class DiskTier:
+    """Livello su disco: tabella SQLite (chiave, vettore, ultimo utilizzo), aperta alla prima richiesta."""
+
+    def __init__(self, path, max_items):
+        self.path = path
+        self.max_items = max_items
+        self.connection = None
+        self.items = 0
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, used REAL NOT NULL) WITHOUT ROWID")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+            self.items = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self.connection
+
+    def get_many(self, keys):
+        """Vettori (byte) delle chiavi presenti; aggiorna l'ultimo utilizzo di quelle trovate."""
+        connection = self._connect()
+        found = {}
+        for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            batch = keys[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            found.update(connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch))
+        if found:
+            now = time()
+            with connection:
+                connection.executemany("UPDATE embeddings SET used = ? WHERE key = ?", ((now, key) for key in found))
+        return found
+
+    def put_many(self, items):
+        """Salvataggio di coppie (chiave, vettore in byte) ed eventuale eliminazione dei meno usati."""
+        connection = self._connect()
+        now = time()
+        with connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO embeddings (key, vector, used) VALUES (?, ?, ?)",
+                                   ((key, vector, now) for key, vector in items))
+            self.items += connection.total_changes - before
+            if self.items > self.max_items:
+                evict = self.items - int(self.max_items * EMBEDDING_CACHE_EVICT_RATIO)
+                connection.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used LIMIT ?)", (evict,))
+                self.items -= evict
+                logger.info(f"Cache degli embeddings su disco: eliminati {evict} vettori meno usati")
+
+class CachedEncoder:
+    """Encoder con cache: stessa interfaccia di `SentenceTransformer` per `encode` e la dimensione degli embeddings.
+
+    Per ogni chiamata i testi vengono cercati in memoria, poi su disco; quelli mancanti (senza
+    duplicati) sono codificati in un'unica chiamata al modello e salvati in entrambi i livelli. Il
+    lock protegge solo i due livelli: più thread possono codificare contemporaneamente.
+    """
+
+    def __init__(self, model, model_name, memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+                 path=EMBEDDING_CACHE_PATH, disk_items=EMBEDDING_CACHE_DISK_ITEMS):
+        self.model = model
+        self.model_name = model_name
+        self.dim = model.get_sentence_embedding_dimension()
+        self.memory = OrderedDict()  # Chiave -> vettore float32, dal meno al più usato di recente
+        self.memory_items = memory_items
+        self.disk = DiskTier(path, disk_items) if path else None
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, convert_to_numpy=True, **kwargs):
+        """Embeddings float32 dei testi (una riga per testo; un vettore per una singola stringa)."""
+        if isinstance(sentences, str):
+            return self.encode([sentences], **kwargs)[0]
+
+        texts = list(sentences)
+        keys = [text_key(text, self.model_name) for text in texts]
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        with self.lock:
+            missing = {}  # Chiave -> posizioni dei testi da cercare su disco o codificare
+            for i, key in enumerate(keys):
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    embeddings[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self.disk is not None:
+                for key, raw in self._disk_call(self.disk.get_many, list(missing)).items():
+                    vector = np.frombuffer(raw, dtype=EMBEDDING_DTYPE)
+                    if len(vector) != self.dim:
+                        continue # Vettore di un modello con dimensione diversa: ricalcolato
+                    positions = missing.pop(key)
+                    embeddings[positions] = vector
+                    self._remember(key, embeddings[positions[0]])
+                    self.disk_hits += len(positions)
+
+        record_cache("embeddings", hits=len(texts) - sum(len(positions) for positions in missing.values()),
+                     misses=sum(len(positions) for positions in missing.values()))
+        if not missing:
+            return embeddings
+
+        # Il modello è chiamato fuori dal lock: le query di ricerca non attendono i batch del chunking
+        encoded = self.model.encode([texts[positions[0]] for positions in missing.values()], convert_to_numpy=True, **kwargs)
+        encoded = np.asarray(encoded, dtype=np.float32)
+        for (key, positions), vector in zip(missing.items(), encoded):
+            embeddings[positions] = vector
+        with self.lock:
+            for (key, positions), vector in zip(missing.items(), encoded):
+                self._remember(key, vector)
+                self.misses += len(positions)
+            if self.disk is not None:
+                self._disk_call(self.disk.put_many, [(key, vector.astype(EMBEDDING_DTYPE).tobytes())
+                                                     for key, vector in zip(missing, encoded)])
+        return embeddings
+
+    def _remember(self, key, vector):
+        # Copia: una vista su una riga del batch codificato terrebbe in memoria l'intera matrice
+        self.memory[key] = np.array(vector, dtype=np.float32)
+        if len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _disk_call(self, method, argument):
+        try:
+            return method(argument)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache degli embeddings su disco disattivata per un errore di SQLite: {e}")
+            self.disk = None
+            return {}
+
+    def stats(self):
+        """Contatori di hit (memoria, disco) e miss dall'avvio del processo."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self.memory),
+            "disk_items": self.disk.items if self.disk is not None else 0
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"Cache degli embeddings: {stats['memory_hits']} hit in memoria, {stats['disk_hits']} hit su disco, "
+                    f"{stats['misses']} miss (hit rate {stats['hit_rate']:.1%}), "
+                    f"{stats['memory_items']} vettori in memoria, {stats['disk_items']} su disco")
@@ -2,31 +2,146 @@ import azure.functions as func
 import logging
 import os
 import json
+import hashlib
+import importlib.util
+import multiprocessing
+import bisect
 import redis
-import spacy
 import fitz # PyMuPDF
 import numpy as np
-from time import time
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import queue
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from time import perf_counter, time
+from chunk_store import (CACHE_KEY_PREFIX, VECTOR_STORAGE, BulkWriter, cached_documents, create_vector_index, delete_documents,
+                         load_chunks, store_chunks)
+from dedup import DEDUP_ENABLED, dedup_index
+from embedding_cache import EMBEDDING_CACHE_ENABLED, CachedEncoder
+from lexical_index import build_lexical_index
+from retrieval import LEXICAL_BACKEND, SEARCH_MODE, SEARCH_MODES, search_chunks
+from query_cache import QUERY_CACHE_ENABLED, query_cache
+from routing import ROUTING_ENABLED, ROUTING_TOP_COLLECTIONS, ROUTING_TOP_DOCUMENTS, route_query, update_document_centroids
+from jobs import (JOB_MAX_ATTEMPTS, JOB_SCHEDULE, JOB_TIME_BUDGET, checkpoint, claim_job, create_job, finish_run, job_status, list_jobs,
+                  pending_documents, record_attempt, release_job, resumable_jobs, set_documents, update_job)
+from metrics import (CONTENT_TYPE, ErrorCounter, log_summary, observe_request, observe_stage, push, record_cache, record_document,
+                     record_items, registry, timed)
 
 # Configurazione per connettersi a un'istanza di Azure Cache for Redis
 REDIS_HOST = os.getenv('REDIS_HOST', 'metis.redis.cache.windows.net')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6380))  # Porta SSL
-REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', 'S1DHsgrmOCZSCaGw5tW9Yh01bg64v9g7YAzCaFEbFsA=')  # Primary Key
+REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', 'S1DHsgrmOCZSCaGw5tW9Yh01bg64v9g7YAzCaFEbFsA=') or None  # Primary Key
+REDIS_SSL = os.getenv('REDIS_SSL', 'true').lower() == 'true'  # 'false' per un'istanza locale (es. redis-stack)
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 16))  # Connessioni massime del pool condiviso
 
-# Caricamento del sentencizer per l'italiano
-nlp_it = spacy.blank('it')
-nlp_it.add_pipe("sentencizer")
-nlp_it.max_length = 2000000
+# Pool di connessioni a livello di modulo, riutilizzato tra le invocazioni della Function App
+redis_pool = redis.ConnectionPool(
+    connection_class=redis.SSLConnection if REDIS_SSL else redis.Connection,
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    password=REDIS_PASSWORD,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_keepalive=True,
+    health_check_interval=30
+)
 
-# Caricamento del sentencizer per l'inglese
-nlp_en = spacy.blank('en')
-nlp_en.add_pipe("sentencizer")
-nlp_en.max_length = 2000000
+# Configurazione della pipeline di chunking a stadi (estrazione -> codifica -> scrittura)
+PIPELINE_MODE = os.getenv('CHUNKING_PIPELINE_MODE', 'staged')  # 'staged' oppure 'sequential'
+EXTRACT_WORKERS = int(os.getenv('CHUNKING_EXTRACT_WORKERS', os.cpu_count() or 1))  # Processi per estrazione PDF e sentencizer
+EXTRACT_QUEUE_SIZE = int(os.getenv('CHUNKING_EXTRACT_QUEUE_SIZE', 2 * EXTRACT_WORKERS))  # PDF in elaborazione contemporaneamente
+WRITE_QUEUE_SIZE = int(os.getenv('CHUNKING_WRITE_QUEUE_SIZE', 64))  # Documenti in attesa di scrittura su Redis
+UNIT_BATCH_SIZE = int(os.getenv('CHUNKING_UNIT_BATCH_SIZE', 2048))  # Dimensione dei batch di unità per l'encoder
+CHUNK_BATCH_SIZE = int(os.getenv('CHUNKING_CHUNK_BATCH_SIZE', 256))  # Dimensione dei batch di chunk per l'encoder
 
-# Caricamento del modello di SentenceTransformer
-embedding_model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+# Configurazione dell'estrazione del testo
+EXTRACTION_MODE = os.getenv('CHUNKING_EXTRACTION_MODE', 'streaming')  # 'streaming' (pagina per pagina) oppure 'document'
+PAGE_BATCH_SIZE = int(os.getenv('CHUNKING_PAGE_BATCH_SIZE', 16))  # Pagine segmentate insieme da `nlp.pipe` in streaming
+MAX_CARRY_LENGTH = 5000  # Lunghezza massima di una frase ricomposta tra più pagine
+
+# Configurazione delle unità di testo (finestra scorrevole di frasi)
+UNIT_SIZE = int(os.getenv('CHUNKING_UNIT_SIZE', 3))  # Frasi per unità
+UNIT_STRIDE = int(os.getenv('CHUNKING_UNIT_STRIDE', 1))  # Frasi tra l'inizio di un'unità e della successiva
+BREAKPOINT_PERCENTILE = float(os.getenv('CHUNKING_BREAKPOINT_PERCENTILE', 95))  # Percentile delle distanze oltre cui inizia un nuovo chunk
+
+# Calcolo degli embeddings dei chunk: 'encode' (nuova codifica del testo del chunk), 'mean' o 'weighted'
+# (media, semplice o pesata sulla lunghezza del testo, degli embeddings delle unità già calcolati)
+CHUNK_EMBEDDING_MODE = os.getenv('CHUNK_EMBEDDING_MODE', 'encode')
+
+# Versione della logica di chunking: da incrementare quando cambia il modo in cui unità e chunk vengono prodotti
+CHUNKER_VERSION = "4"
+EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL_NAME', 'paraphrase-MiniLM-L6-v2')
+
+# Backend dell'encoder: 'torch' (PyTorch fp32), 'onnx' (ONNX Runtime fp32) oppure 'onnx-int8' (ONNX Runtime quantizzato int8)
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'torch')
+ENCODER_ONNX_INT8_FILE = os.getenv('ENCODER_ONNX_INT8_FILE', 'onnx/model_qint8_avx2.onnx')  # File quantizzato nel repository del modello
+ONNX_MODULES = ("onnxruntime", "optimum")  # Installati da sentence-transformers[onnx], necessari ai backend ONNX
+# Identificativo dell'encoder: backend diversi producono vettori leggermente diversi (soprattutto int8)
+ENCODER_ID = EMBEDDING_MODEL_NAME if ENCODER_BACKEND == 'torch' else f"{EMBEDDING_MODEL_NAME}@{ENCODER_BACKEND}"
+# Identificativo degli embeddings salvati: i vettori ottenuti per media delle unità non sono intercambiabili con quelli codificati
+EMBEDDING_VERSION = ENCODER_ID if CHUNK_EMBEDDING_MODE == 'encode' else f"{ENCODER_ID}+{CHUNK_EMBEDDING_MODE}"
+
+# Lingua dei documenti (sentencizer di spaCy)
+DOCUMENT_LANGUAGE = os.getenv('CHUNKING_LANGUAGE', 'en')
+
+# Prefisso delle chiavi Redis del registro dei documenti per collezione
+DOCUMENT_REGISTRY_PREFIX = "documents"
+
+# Identificativi delle collezioni salvati nei chunk (campo TAG dell'indice vettoriale)
+COLLECTIONS = {
+    "Red Hat 8": "RHEL8",
+    "Red Hat 9": "RHEL9",
+    "Windows Server": "WindowsServer"
+}
+
+# Modelli caricati alla prima richiesta (non all'import, per ridurre il cold start della Function App)
+_nlp_models = {}
+_embedding_model = None
+_models_lock = threading.Lock()
+
+def get_nlp(language=DOCUMENT_LANGUAGE):
+    """Sentencizer di spaCy per la lingua indicata, creato al primo utilizzo (anche nei processi di estrazione)."""
+    with _models_lock:
+        if language not in _nlp_models:
+            import spacy # Import differito: non serve al processo principale nella pipeline a stadi
+            nlp = spacy.blank(language)
+            nlp.add_pipe("sentencizer")
+            nlp.max_length = 2000000
+            _nlp_models[language] = nlp
+        return _nlp_models[language]
+
+def load_encoder(model_name=EMBEDDING_MODEL_NAME, backend=ENCODER_BACKEND):
+    """Caricamento del modello di SentenceTransformer con il backend richiesto (PyTorch oppure ONNX Runtime su CPU)."""
+    if backend in ('onnx', 'onnx-int8'):
+        missing = [module for module in ONNX_MODULES if importlib.util.find_spec(module) is None]
+        if missing:
+            # Senza questo controllo l'errore compare solo alla prima codifica, con un messaggio di optimum poco chiaro
+            raise ImportError(f"Il backend '{backend}' dell'encoder richiede sentence-transformers[onnx] "
+                              f"(moduli mancanti: {', '.join(missing)}); installarlo o usare ENCODER_BACKEND=torch")
+    from sentence_transformers import SentenceTransformer # Import differito: PyTorch/ONNX Runtime solo quando serve codificare
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+    if backend == 'onnx':
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == 'onnx-int8':
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": ENCODER_ONNX_INT8_FILE})
+    raise ValueError(f"Backend dell'encoder non supportato: {backend}")
+
+def get_embedding_model():
+    """Encoder condiviso (con la cache degli embeddings, se abilitata), caricato alla prima richiesta."""
+    global _embedding_model
+    with _models_lock:
+        if _embedding_model is None:
+            start_time = time()
+            _embedding_model = load_encoder()
+            if EMBEDDING_CACHE_ENABLED:
+                _embedding_model = CachedEncoder(_embedding_model, ENCODER_ID) # Cache (memoria + disco) dei testi già codificati
+            logging.getLogger("Chunking").info(f"Encoder {ENCODER_ID} caricato in {time() - start_time} secondi")
+        return _embedding_model
+
+def get_redis_client():
+    """Client Redis che utilizza il pool di connessioni condiviso."""
+    return redis.StrictRedis(connection_pool=redis_pool)
 
 def configure_logger():
     """Configurazione del logger di sistema."""
@@ -53,151 +168,305 @@ def configure_logger():
         logger.addHandler(info_handler)
         logger.addHandler(error_handler)
         logger.addHandler(console_handler)
+        logger.addHandler(ErrorCounter())  # Conteggio degli errori nelle metriche
 
     return logger
 
 # Inizializzazione del logger
 logger = configure_logger()
 
-def extract_sentences_with_indices(text, nlp_model):
-    """Estrazione delle frasi con indice da un blocco di testo mediante il sentencizer spaCy."""
+def extract_sentences_with_indices(text, nlp_model, page_offsets=None):
+    """Estrazione delle frasi con indice e pagina (numerata da 1) da un blocco di testo mediante il sentencizer spaCy."""
     doc = nlp_model(text)
     sentences_with_indices = []
     for i, sentence in enumerate(doc.sents):
-        sentences_with_indices.append((i, sentence.text))
+        page = bisect.bisect_right(page_offsets, sentence.start_char) if page_offsets else 1 # Pagina in cui inizia la frase
+        sentences_with_indices.append((i, sentence.text, page))
     return sentences_with_indices
 
-def create_text_units_with_indices(sentences_with_indices, unit_size=3):
-    """Creazione delle unità di testo con indice e associazione di `unit_size` frasi contigue."""
-    units = []
-    buffer = []
-    for index, sentence in sentences_with_indices:
-        buffer.append((index, sentence))
-        if len(buffer) >= unit_size:
-            unit = " ".join([s for _, s in buffer[:unit_size]])
-            indices = [idx for idx, _ in buffer[:unit_size]]
-            units.append({"text": unit, "indices": indices})
-            buffer.pop(0)
-    return units
+class TextUnits:
+    """Rappresentazione compatta delle unità di testo.
+
+    Le frasi sono salvate una sola volta in un buffer di testo condiviso (separate da uno spazio) e
+    descritte da offset [inizio, fine) e pagina; ogni unità è un intervallo [inizio, fine) di frasi.
+    Il testo di un'unità viene materializzato solo quando richiesto (ad es. dall'encoder, a batch
+    tramite slicing); l'unità i ha come testo le sue frasi unite da uno spazio.
+    """
+
+    def __init__(self, text, sentence_starts, sentence_ends, sentence_pages, unit_starts, unit_ends):
+        self.text = text
+        self.sentence_starts = sentence_starts
+        self.sentence_ends = sentence_ends
+        self.sentence_pages = sentence_pages
+        self.unit_starts = unit_starts
+        self.unit_ends = unit_ends
+
+    @classmethod
+    def from_sentences(cls, sentences_with_indices, unit_size=UNIT_SIZE, stride=UNIT_STRIDE):
+        """Costruzione a partire da (indice, frase, pagina), anche prodotte in streaming.
+
+        L'ultima unità termina sempre sull'ultima frase (anche quando il passo non vi arriva esattamente);
+        un documento con meno di `unit_size` frasi ha un'unica unità più corta.
+        """
+        sentences = []
+        pages = []
+        for _, sentence, page in sentences_with_indices:
+            sentences.append(sentence)
+            pages.append(page)
+        
+        lengths = np.fromiter((len(sentence) for sentence in sentences), dtype=np.int64, count=len(sentences))
+        sentence_starts = np.zeros(len(sentences), dtype=np.int64)
+        np.cumsum(lengths[:-1] + 1, out=sentence_starts[1:]) # +1 per lo spazio separatore
+        last_start = max(len(sentences) - unit_size, 0)
+        unit_starts = np.arange(0, last_start + 1 if sentences else 0, stride, dtype=np.int64)
+        if len(unit_starts) and unit_starts[-1] != last_start:
+            unit_starts = np.append(unit_starts, last_start) # Coda esclusa dal passo
+        
+        return cls(
+            " ".join(sentences),
+            sentence_starts,
+            sentence_starts + lengths,
+            np.asarray(pages, dtype=np.int32),
+            unit_starts,
+            np.minimum(unit_starts + unit_size, len(sentences))
+        )
+
+    def __len__(self):
+        return len(self.unit_starts)
+
+    def __getitem__(self, index):
+        """Testo di un'unità o lista dei testi di un intervallo di unità (materializzati su richiesta)."""
+        if isinstance(index, slice):
+            return [self.span_text(i, i + 1) for i in range(*index.indices(len(self)))]
+        return self.span_text(index, index + 1)
+
+    def span_text(self, start, end):
+        """Testo delle frasi coperte dalle unità [start, end), senza ripetere le frasi condivise."""
+        first_sentence = self.unit_starts[start]
+        last_sentence = self.unit_ends[end - 1] - 1
+        return self.text[self.sentence_starts[first_sentence]:self.sentence_ends[last_sentence]]
+
+    def unit_lengths(self):
+        """Lunghezza (caratteri) del testo di ciascuna unità, senza materializzarlo."""
+        return self.sentence_ends[self.unit_ends - 1] - self.sentence_starts[self.unit_starts]
+
+    def span_pages(self, start, end):
+        """Intervallo di pagine (prima, ultima) coperto dalle unità [start, end)."""
+        return int(self.sentence_pages[self.unit_starts[start]]), int(self.sentence_pages[self.unit_ends[end - 1] - 1])
+
+def create_text_units_with_indices(sentences_with_indices, unit_size=UNIT_SIZE, stride=UNIT_STRIDE):
+    """Creazione delle unità di testo con indice e associazione di `unit_size` frasi contigue ogni `stride` frasi."""
+    return TextUnits.from_sentences(sentences_with_indices, unit_size, stride)
 
 def extract_text_from_pdf(pdf_path):
-    """Estrazione del testo da un PDF mediante PyMuPDF."""
+    """Estrazione del testo da un PDF mediante PyMuPDF, con l'offset di inizio di ciascuna pagina nel testo."""
     try:
         with fitz.open(pdf_path) as pdf_document:
-            text = ""
+            pages = []
+            page_offsets = []
+            length = 0
             for page_num in range(len(pdf_document)):
                 page = pdf_document.load_page(page_num) 
-                text += page.get_text()
-        return text
+                page_offsets.append(length)
+                pages.append(page.get_text())
+                length += len(pages[-1])
+        return "".join(pages), page_offsets # Un'unica concatenazione finale, senza copie ripetute
     except Exception as e:
         logger.error(f"Errore durante l'estrazione del testo dal PDF {os.path.basename(pdf_path)}: {e}")
-        return ""
+        return "", []
 
-def generate_embeddings(units, model, batch_size=2048):
-    """Generazione (e associazione) degli embeddings per ciascuna unità (a ciascuna unità)."""
-    texts = [unit['text'] for unit in units]
-    if len(texts) == 0:
-        return[]
-    
-    embeddings = []
-
-    # Elaborazione sequenziale per batch
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i + batch_size]
-        batch_embeddings = model.encode(batch_texts, convert_to_tensor=True).tolist()
-        embeddings.extend(batch_embeddings)
+def iter_pdf_pages(pdf_path, timings=None):
+    """Estrazione in streaming delle pagine di un PDF: coppie (testo, numero di pagina da 1).
 
-    if len(embeddings) != len(units):
-        logger.error("La lunghezza degli embeddings non corrisponde a quella delle unità di testo.")
-        return []
+    Con `timings` vi sono sommati i secondi di estrazione (chiave 'extract') e le pagine lette (chiave 'pages').
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        for page_num in range(len(pdf_document)):
+            start = perf_counter()
+            text = pdf_document.load_page(page_num).get_text()
+            if timings is not None:
+                timings['extract'] = timings.get('extract', 0.0) + perf_counter() - start
+                timings['pages'] = timings.get('pages', 0) + 1
+            yield text, page_num + 1
 
-    # Assegnazione degli embeddings alle unità
-    for i, unit in enumerate(units):
-        unit["combined_sentence_embedding"] = embeddings[i]
+def is_sentence_complete(sentence):
+    """Verifica se una frase termina con la punteggiatura di fine periodo (altrimenti può proseguire nella pagina successiva)."""
+    return sentence.rstrip().endswith(('.', '!', '?', ':', ';', '"', "'", ')'))
 
-    return units
+def iter_sentences_from_pages(pages, nlp_model, batch_size=PAGE_BATCH_SIZE):
+    """Segmentazione in frasi in streaming: le pagine passano da `nlp.pipe` a gruppi di `batch_size`.
 
-def generate_embeddings_for_chunks(chunks, model, batch_size=256):
-    """Generazione degli embeddings per ciascun chunk di testo."""
-    if len(chunks) == 0:
-        return []
-    
-    embeddings = []
-    
-    # Elaborazione sequenziale per batch
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i + batch_size]
-        
-        if len(batch_chunks) == 0:
+    Restituisce (indice, frase, pagina) come `extract_sentences_with_indices`. L'ultima frase di una
+    pagina senza punteggiatura finale viene ricomposta con la prima della pagina successiva e
+    attribuita alla pagina in cui inizia; in memoria restano solo le pagine del gruppo corrente.
+    """
+    index = 0
+    carry = None  # (testo, pagina) della frase interrotta a fine pagina
+    for doc, page in nlp_model.pipe(pages, as_tuples=True, batch_size=batch_size):
+        sentences = [sentence.text for sentence in doc.sents]
+        if not sentences:
             continue
         
-        batch_embeddings = model.encode(batch_chunks, convert_to_tensor=True).tolist()
+        first_page = page
+        if carry is not None:
+            sentences[0] = f"{carry[0].rstrip()} {sentences[0].lstrip()}"
+            first_page = carry[1]
+            carry = None
         
-        if len(batch_embeddings) != len(batch_chunks):
-            logger.error(f"Errore nella generazione degli embeddings: mismatch tra chunk ({len(batch_chunks)}) e embeddings ({len(batch_embeddings)}) nel batch {i}.")
-            continue
+        # L'ultima frase resta in sospeso se interrotta (e non già troppo lunga per essere ricomposta)
+        last = sentences[-1]
+        if not is_sentence_complete(last) and len(last) < MAX_CARRY_LENGTH:
+            carry = (last, first_page if len(sentences) == 1 else page)
+            sentences.pop()
         
-        embeddings.extend(batch_embeddings)
+        for i, sentence in enumerate(sentences):
+            yield index, sentence, first_page if i == 0 else page
+            index += 1
     
-    if len(embeddings) == 0:
-        return []
+    if carry is not None:
+        yield index, carry[0], carry[1]
+
+def encode_texts(texts, model, batch_size):
+    """Codifica dei testi (qualsiasi sequenza con slicing) per batch direttamente in una matrice float32 (una riga per testo)."""
+    embeddings = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    # Elaborazione sequenziale per batch
+    for i in range(0, len(texts), batch_size):
+        batch_texts = texts[i:i + batch_size]
+        batch_embeddings = model.encode(batch_texts, convert_to_numpy=True)
+        
+        if len(batch_embeddings) != len(batch_texts):
+            logger.error(f"Errore nella generazione degli embeddings: mismatch tra testi ({len(batch_texts)}) e embeddings ({len(batch_embeddings)}) nel batch {i}.")
+            return np.empty((0, embeddings.shape[1]), dtype=np.float32)
+        
+        embeddings[i:i + len(batch_texts)] = batch_embeddings
 
     return embeddings
+
+def generate_embeddings(units, model, batch_size=UNIT_BATCH_SIZE):
+    """Generazione degli embeddings delle unità: la riga i della matrice restituita corrisponde all'unità i."""
+    if len(units) == 0:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
     
+    return encode_texts(units, model, batch_size) # I testi delle unità sono materializzati un batch alla volta
+
+def generate_embeddings_for_chunks(chunks, model, batch_size=CHUNK_BATCH_SIZE):
+    """Generazione degli embeddings per ciascun chunk di testo: la riga i corrisponde a `chunks[i]`."""
+    texts = [chunk['text'] for chunk in chunks]
+    if len(texts) == 0:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
     
-def calculate_distance(units):
-    """Calcolo delle distanze tra embeddings consecutivi mediante la similarità del coseno"""
-    distances = []
+    return encode_texts(texts, model, batch_size)
+
+def pool_chunk_embeddings(unit_embeddings, units, chunks, mode=CHUNK_EMBEDDING_MODE):
+    """Embeddings dei chunk come media (semplice o pesata sulla lunghezza) degli embeddings delle loro unità.
+
+    I chunk coprono intervalli contigui e consecutivi di unità, quindi le somme per chunk si ottengono
+    con un'unica `np.add.reduceat`; il risultato è normalizzato, per cui non serve dividere per i pesi.
+    """
+    if len(chunks) == 0:
+        return np.empty((0, unit_embeddings.shape[1]), dtype=np.float32)
     
-    for i in range(len(units) - 1):
-        embedding_current = units[i]["combined_sentence_embedding"]
-        embedding_next = units[i + 1]["combined_sentence_embedding"]
-        
-        similarity = cosine_similarity([embedding_current], [embedding_next])[0][0]
-        distance = 1 - similarity
-        distances.append(distance)
-        
-        units[i]["distance_to_next"] = distance
+    starts = np.fromiter((chunk["units"][0] for chunk in chunks), dtype=np.intp, count=len(chunks))
+    if mode == 'weighted':
+        weights = units.unit_lengths().astype(np.float32)[:, np.newaxis]
+        pooled = np.add.reduceat(unit_embeddings * weights, starts, axis=0)
+    else:
+        pooled = np.add.reduceat(unit_embeddings, starts, axis=0)
+    return normalize_embeddings(pooled.astype(np.float32, copy=False))
+
+def generate_chunk_embeddings(chunks, units, unit_embeddings, model, mode=CHUNK_EMBEDDING_MODE):
+    """Embeddings dei chunk secondo la modalità configurata (nuova codifica oppure media delle unità)."""
+    if mode == 'encode':
+        return generate_embeddings_for_chunks(chunks, model)
+    return pool_chunk_embeddings(unit_embeddings, units, chunks, mode)
+    
+def normalize_embeddings(embeddings):
+    """Normalizzazione L2 (in place) delle righe di una matrice di embeddings float32."""
+    norms = np.sqrt(np.einsum("ij,ij->i", embeddings, embeddings))[:, np.newaxis] # Norme senza matrici temporanee
+    np.maximum(norms, np.finfo(np.float32).tiny, out=norms) # Protezione dai vettori nulli (similarità 0, distanza 1)
+    embeddings /= norms
+    return embeddings
+
+def consecutive_distances(embeddings):
+    """Calcolo in un'unica passata vettorizzata della distanza coseno tra righe consecutive di una matrice normalizzata."""
+    similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:]) # Prodotto scalare riga per riga, senza matrici intermedie
+    return 1.0 - similarities
+
+def calculate_distance(embeddings):
+    """Calcolo delle distanze tra embeddings consecutivi mediante la similarità del coseno (embeddings normalizzati in place)"""
+    if len(embeddings) < 2:
+        return np.empty(0, dtype=np.float32)
+    
+    return consecutive_distances(normalize_embeddings(np.asarray(embeddings, dtype=np.float32)))
 
-    return distances, units
+def find_breakpoints(distances, percentile=BREAKPOINT_PERCENTILE):
+    """Calcolo della soglia (percentile delle distanze) e degli indici di split al di sopra di essa."""
+    distances = np.asarray(distances, dtype=np.float32)
+    if len(distances) == 0:
+        return None, np.empty(0, dtype=np.int64) # Un'unica unità: un unico chunk
+    threshold = np.percentile(distances, percentile)
+    return threshold, np.flatnonzero(distances > threshold)
 
-def create_chunks_based_on_distances(units, distances, pdf_file, logger):
-    """Creazione dei chunk sualla base della distanza e del 95° percentile."""
-    breakpoint = np.percentile(distances, 95) # Calcolo del 95° percentile per determinel il breakpoint
-    indices_above_threshold = [i for i, d in enumerate(distances) if d > breakpoint] # Ricerca degli indici in cui le distanze sono al di sopra della soglia
+def create_chunks_based_on_distances(units, distances, pdf_file, logger, percentile=BREAKPOINT_PERCENTILE):
+    """Creazione dei chunk sulla base delle distanze tra unità consecutive e del loro percentile `percentile`
+    (`BREAKPOINT_PERCENTILE`, da CHUNKING_BREAKPOINT_PERCENTILE): un nuovo chunk inizia dove la distanza lo supera.
+
+    Ogni chunk è un dizionario con il testo (le frasi coperte dalle sue unità), l'intervallo
+    [inizio, fine) delle unità e l'intervallo di pagine.
+    """
+    _, indices_above_threshold = find_breakpoints(distances, percentile) # Calcolo del breakpoint e degli indici in cui le distanze sono al di sopra della soglia
     logger.info(f"Trovati {len(indices_above_threshold)} chunk per {os.path.basename(pdf_file)}")
     
     chunks = []
     start_index = 0
-    for x in indices_above_threshold:
-        end_index = x  # Fine del chunk
-        group = units[start_index:end_index + 1] # Raccolta delle frasi tra start_index ed end_index
-        combined_text = ' '.join([d["text"] for d in group]) # Unione del testo del chunk
-        chunks.append(combined_text.strip()) # Inserimento del chunk nella lista
-        start_index = x + 1 # Aggiornamento dello start_index per il prossimo chunk
+    for x in indices_above_threshold.tolist():
+        end_index = x + 1  # Fine (esclusa) del chunk
+        chunks.append({
+            "text": units.span_text(start_index, end_index).strip(), # Testo delle frasi tra start_index ed end_index
+            "units": (start_index, end_index),
+            "pages": units.span_pages(start_index, end_index)
+        }) # Inserimento del chunk nella lista
+        start_index = end_index # Aggiornamento dello start_index per il prossimo chunk
     
     if start_index < len(units):
-        combined_text = ' '.join([d["text"] for d in units[start_index:]])
-        chunks.append(combined_text.strip()) # Aggiunta dell'ultimo chunk nel momento in cui ci sono frasi rimanenti
+        chunks.append({
+            "text": units.span_text(start_index, len(units)).strip(),
+            "units": (start_index, len(units)),
+            "pages": units.span_pages(start_index, len(units))
+        }) # Aggiunta dell'ultimo chunk nel momento in cui ci sono frasi rimanenti
     
     logger.info(f"Numero totale di chunk creati: {len(chunks)}")
     
     return chunks
 
-def process_single_pdf(pdf_path, nlp_model):
-    """Elaborazione del PDF e rilascio della memoria non appena completata."""
-    text = extract_text_from_pdf(pdf_path) # Estrazione del testo dal PDF e restituzione di tutte le unità
+def process_single_pdf(pdf_path, nlp_model, timings=None):
+    """Elaborazione del PDF e rilascio della memoria non appena completata.
+
+    Con `timings` vi sono registrati i secondi di estrazione del testo ('extract') e di segmentazione
+    in frasi e unità ('sentencize'), oltre alle pagine lette ('pages').
+    """
+    timings = {} if timings is None else timings
+    if EXTRACTION_MODE == 'streaming':
+        return process_single_pdf_streaming(pdf_path, nlp_model, timings)
+    
+    start = perf_counter()
+    text, page_offsets = extract_text_from_pdf(pdf_path) # Estrazione del testo dal PDF e restituzione di tutte le unità
+    timings['extract'] = perf_counter() - start
+    timings['pages'] = len(page_offsets)
     if not text.strip():
         logger.error(f"Nessun testo trovato nel PDF {os.path.basename(pdf_path)}")
         return[]
     
-    sentences = extract_sentences_with_indices(text, nlp_model) # Segmentazione del testo in frasi con spaCy
+    start = perf_counter()
+    sentences = extract_sentences_with_indices(text, nlp_model, page_offsets) # Segmentazione del testo in frasi con spaCy
     if len(sentences) == 0:
         return []
     
     del text # Liberazione della memoria utilizzata dal testo appena processato
     
     all_units = create_text_units_with_indices(sentences) # Crazione delle unità di testo
+    timings['sentencize'] = perf_counter() - start
     if len(all_units) == 0:
         return []
     
@@ -205,65 +474,519 @@ def process_single_pdf(pdf_path, nlp_model):
     
     return all_units
 
-def process_units(pdf_path, client, nlp_model, logger):
+def process_single_pdf_streaming(pdf_path, nlp_model, timings=None):
+    """Elaborazione del PDF pagina per pagina: le unità vengono prodotte man mano che le frasi sono segmentate.
+
+    Estrazione e segmentazione sono alternate: in `timings` la segmentazione è il tempo totale meno quello di estrazione.
+    """
+    timings = {} if timings is None else timings
+    start = perf_counter()
+    try:
+        sentences = iter_sentences_from_pages(iter_pdf_pages(pdf_path, timings), nlp_model)
+        all_units = create_text_units_with_indices(sentences) # Creazione incrementale delle unità di testo
+    except Exception as e:
+        logger.error(f"Errore durante l'estrazione del testo dal PDF {os.path.basename(pdf_path)}: {e}")
+        return []
+    finally:
+        timings['sentencize'] = perf_counter() - start - timings.get('extract', 0.0)
+    
+    if len(all_units) == 0:
+        logger.error(f"Nessun testo trovato nel PDF {os.path.basename(pdf_path)}")
+        return []
+    
+    return all_units
+
+def calculate_sha256(file_path):
+    """Calcolo dell'hash SHA-256 di un file."""
+    sha256_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for byte_block in iter(lambda: f.read(65536), b""):
+            sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
+def document_cache_key(checksum):
+    """Chiave Redis di un documento: hash del contenuto, versione del chunker e modello di embedding."""
+    key = f"{CACHE_KEY_PREFIX}:{checksum}:{CHUNKER_VERSION}:{EMBEDDING_VERSION}"
+    return key if VECTOR_STORAGE == 'float32' else f"{key}:{VECTOR_STORAGE}" # Formato dei vettori salvati
+
+def load_checksum_manifest(directory):
+    """Lettura dei checksum SHA-256 calcolati dalle sonde (file `checksum_*.json` nella cartella padre dei PDF)."""
+    checksums = {}
+    parent_directory = os.path.dirname(os.path.normpath(directory))
+    if not os.path.isdir(parent_directory):
+        return checksums
+    
+    for file_name in os.listdir(parent_directory):
+        if not (file_name.startswith("checksum_") and file_name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(parent_directory, file_name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Errore nella lettura del manifest dei checksum {file_name}: {e}")
+            continue
+        
+        if isinstance(data.get("documents"), list):
+            # Formato della sonda di Windows Server: {"documents": [{"file_name": ..., "checksum": ...}]}
+            entries = [(d.get("file_name"), d.get("checksum")) for d in data["documents"]]
+        else:
+            # Formato delle sonde di Red Hat: {"counter": ..., "<file_name>": {"checksum": ...}}
+            entries = [(name, d.get("checksum")) for name, d in data.items() if isinstance(d, dict)]
+        checksums.update({name: checksum for name, checksum in entries if name and checksum})
+    
+    return checksums
+
+def resolve_documents(documentation, client, logger):
+    """Risoluzione della chiave di cache di ciascun PDF e rimozione da Redis delle voci obsolete.
+
+    Il checksum viene letto dal manifest della sonda (ricalcolato solo se assente); il registro
+    `documents:<collezione>` associa ogni file alla sua chiave, così i documenti modificati o
+    scomparsi non più referenziati vengono eliminati insieme ai loro chunk.
+    Restituisce una lista di coppie (nome della collezione, lista di (PDF, chiave)).
+    """
+    manifests = {}
+    resolved = []
+    current_keys = set()
+    
+    for doc_name, pdf_files in documentation:
+        documents = []
+        for pdf in pdf_files:
+            directory = os.path.dirname(pdf)
+            if directory not in manifests:
+                manifests[directory] = load_checksum_manifest(directory)
+            try:
+                checksum = manifests[directory].get(os.path.basename(pdf)) or calculate_sha256(pdf)
+            except OSError as e:
+                logger.error(f"Errore nel calcolo del checksum del PDF {pdf}: {e}")
+                continue
+            documents.append((pdf, document_cache_key(checksum)))
+        current_keys.update(key for _, key in documents)
+        resolved.append((doc_name, documents))
+    
+    # Lettura dei registri di tutte le collezioni in un'unica pipeline
+    pipe = client.pipeline(transaction=False)
+    for doc_name, _ in resolved:
+        pipe.hgetall(f"{DOCUMENT_REGISTRY_PREFIX}:{doc_name}")
+    previous_registries = pipe.execute()
+    
+    stale_keys = set()
+    pipe = client.pipeline() # Sostituzione atomica dei registri
+    for (doc_name, documents), previous in zip(resolved, previous_registries):
+        registry_key = f"{DOCUMENT_REGISTRY_PREFIX}:{doc_name}"
+        registry = {os.path.basename(pdf): key for pdf, key in documents}
+        previous = {name.decode('utf-8'): key.decode('utf-8') for name, key in previous.items()}
+        
+        collection_stale_keys = set(previous.values()) - current_keys
+        removed = [name for name in previous if name not in registry]
+        changed = [name for name, key in previous.items() if name in registry and registry[name] != key]
+        stale_keys |= collection_stale_keys
+        
+        pipe.delete(registry_key)
+        if registry:
+            pipe.hset(registry_key, mapping=registry)
+        
+        logger.info(f"{doc_name}: {len(registry)} documenti, {len(changed)} modificati, {len(removed)} rimossi, {len(collection_stale_keys)} chiavi obsolete eliminate")
+    
+    delete_documents(client, stale_keys)
+    pipe.execute()
+    
+    return resolved
+
+def deduplicate_chunks(cache_key, chunks, collection):
+    """Chunk canonico di ogni chunk (None se unico) e impronte dei chunk unici (vedi `dedup`); senza deduplicazione tutti i chunk sono unici."""
+    if not DEDUP_ENABLED:
+        return [None] * len(chunks), None
+    with timed("dedup", collection):
+        references, fingerprints = dedup_index.assign(cache_key, chunks)
+    duplicates = sum(canonical is not None for canonical in references)
+    record_cache("chunks", hits=duplicates, misses=len(chunks) - duplicates)
+    return references, fingerprints
+
+def settle_deduplication(cache_keys, written):
+    """Conferma (documenti scritti) o scarto (scrittura non riuscita) dei nuovi canonici assegnati da `deduplicate_chunks`."""
+    if not DEDUP_ENABLED:
+        return
+    for cache_key in cache_keys:
+        if written:
+            dedup_index.commit(cache_key)
+        else:
+            dedup_index.discard(cache_key)
+
+def unique_chunks(chunks, references):
+    """Chunk da codificare: quelli senza un canonico già noto."""
+    return [chunk for chunk, canonical in zip(chunks, references) if canonical is None]
+
+def resolve_chunk_embeddings(client, cache_key, chunks, references, unique_embeddings):
+    """Embeddings di tutti i chunk a partire da quelli dei chunk unici (i duplicati usano il vettore del canonico)."""
+    if not DEDUP_ENABLED:
+        return unique_embeddings
+    return dedup_index.expand(client, cache_key, chunks, references, unique_embeddings,
+                              lambda texts: encode_texts(texts, get_embedding_model(), CHUNK_BATCH_SIZE))
+
+def process_units(pdf_path, client, nlp_model, logger, cache_key=None, collection=None):
     """Elaborazione di un singolo PDF, generazione degli embeddings e creazione dei chunk."""
+    references = None
     try:
-        cached_result = client.get(pdf_path)
-        if cached_result:
+        start = perf_counter()
+        cache_key = cache_key or document_cache_key(calculate_sha256(pdf_path))
+        cached_chunks = load_chunks(client, cache_key)
+        record_cache("documents", hits=int(cached_chunks is not None), misses=int(cached_chunks is None))
+        if cached_chunks is not None:
             logger.info(f"Risultato recuperato da Redis per {os.path.basename(pdf_path)}")
-            return f"Recuperato da cache: {os.path.basename(pdf_path)}", json.loads(cached_result)
+            record_document(os.path.basename(pdf_path), collection, None, status="cached")
+            return f"Recuperato da cache: {os.path.basename(pdf_path)}", cached_chunks
         
         # Estrazione delle frasi dal PDF e generazione delle unità
-        units = process_single_pdf(pdf_path, nlp_model)
+        timings = {}
+        units = process_single_pdf(pdf_path, nlp_model, timings)
+        record_extraction(timings, units, collection)
         if not units or len(units) == 0:
+            record_document(os.path.basename(pdf_path), collection, None, status="failed")
             return f"Nessuna unità trovata nel PDF: {os.path.basename(pdf_path)}", []
         
-        # Generazione degli embeddings
-        units_with_embeddings = generate_embeddings(units, embedding_model)
-        if not units_with_embeddings or len(units_with_embeddings) == 0:
+        # Generazione degli embeddings (matrice float32, una riga per unità)
+        with timed("encode", collection):
+            unit_embeddings = generate_embeddings(units, get_embedding_model())
+        if len(unit_embeddings) == 0:
+            record_document(os.path.basename(pdf_path), collection, None, status="failed")
             return f"Nessun embedding generato per {os.path.basename(pdf_path)}", []
         
         # Calcolo delle distanze tra gli embeddings consecutivi
-        distances, units_with_distances = calculate_distance(units_with_embeddings)
-        if not distances or len(distances) == 0 or not units_with_distances or len(units_with_distances) == 0:
+        with timed("distance", collection):
+            distances = calculate_distance(unit_embeddings)
+        if len(distances) != len(units) - 1:
+            record_document(os.path.basename(pdf_path), collection, None, status="failed")
             return f"Errore nel calcolo delle distanze per {os.path.basename(pdf_path)}", []
         
         # Creazione dei chunk sulla base delle distanze ottenute
-        chunks = create_chunks_based_on_distances(units_with_distances, distances, pdf_path, logger)
+        with timed("chunk", collection):
+            chunks = create_chunks_based_on_distances(units, distances, pdf_path, logger)
         if not chunks or len(chunks) == 0:
+            record_document(os.path.basename(pdf_path), collection, None, status="failed")
             return f"Nessun chunk creato per {os.path.basename(pdf_path)}", []
         
-        # Ricalcolo degli embeddings per i chunk
-        chunk_embeddings = generate_embeddings_for_chunks(chunks, embedding_model)
-        if not chunk_embeddings or len(chunk_embeddings) == 0:
+        # Chunk già presenti in altri documenti (o collezioni): non vengono codificati né indicizzati di nuovo
+        references, fingerprints = deduplicate_chunks(cache_key, chunks, collection)
+        
+        # Embeddings dei chunk (matrice float32, una riga per chunk): nuova codifica o media delle unità
+        with timed("encode_chunks", collection):
+            if CHUNK_EMBEDDING_MODE == 'encode':
+                unique_embeddings = generate_embeddings_for_chunks(unique_chunks(chunks, references), get_embedding_model())
+            else:
+                unique_embeddings = pool_chunk_embeddings(unit_embeddings, units, chunks)[[canonical is None for canonical in references]]
+            chunk_embeddings = resolve_chunk_embeddings(client, cache_key, chunks, references, unique_embeddings)
+        if len(chunk_embeddings) == 0:
+            settle_deduplication([cache_key], written=False)
+            record_document(os.path.basename(pdf_path), collection, None, status="failed")
             return f"Nessun embedding generato per i chunk di {os.path.basename(pdf_path)}", []
         
-        # Caching dei chunk in Redis: `pdf_path` utilizzato come chiave per accedere ai chunk; `json.dumps(chunk_embeddings)` converte la lista di chunk in una stringa JSON 
-        client.set(pdf_path, json.dumps(chunk_embeddings))
+        # Salvataggio in Redis di un hash per chunk (testo, vettore float32, sorgente, pagine, collezione) sotto la chiave del contenuto
+        with timed("store", collection):
+            store_chunks(client, cache_key, chunks, chunk_embeddings, os.path.basename(pdf_path), collection, references, fingerprints)
+        settle_deduplication([cache_key], written=True)
+        record_items("chunks", len(chunks), collection)
+        record_document(os.path.basename(pdf_path), collection, perf_counter() - start)
         
         return f"Elaborazione completata per il PDF: {pdf_path}", chunks
     
+    except redis.ConnectionError:
+        if references is not None:
+            settle_deduplication([cache_key], written=False)
+        raise # Documento non concluso: `process_documentation` non lo notifica, così un job lo rielabora
     except Exception as e:
         logger.error(f"Errore nell'elaborazione del PDF {pdf_path}: {e}")
+        if references is not None:
+            settle_deduplication([cache_key], written=False)
+        record_document(os.path.basename(pdf_path), collection, None, status="failed")
         return f"Errore per {pdf_path}: {e}", []
 
-def process_documentation(pdf_files, client, nlp_model, logger, doc_name):
-    """Funzione per processare la documentazione passata come parametro."""
+def process_documentation(documents, client, nlp_model, logger, doc_name, on_done=None, should_stop=None):
+    """Funzione per processare la documentazione (coppie PDF, chiave di cache) passata come parametro.
+
+    Restituisce i chunk di tutti i documenti. `on_done(chiave, esito, numero di chunk)` è chiamata al
+    termine di ogni documento ('processed', 'cached' o 'failed'; non per gli errori di connessione a
+    Redis, così un job rielabora il documento alla ripresa); con `should_stop` l'elaborazione si
+    interrompe prima del documento successivo quando restituisce True.
+    """
     start_time = time()  # Inizio del timer
     all_chunks = []
+    cached = cached_documents(client, [cache_key for _, cache_key in documents]) if on_done is not None else set()
 
-    for pdf in pdf_files:
+    for pdf, cache_key in documents:
+        if should_stop is not None and should_stop():
+            logger.info(f"Elaborazione di {doc_name} sospesa: tempo a disposizione esaurito")
+            break
+        chunks = []
         try:
-            chunks = process_units(pdf, client, nlp_model, logger)
+            _, chunks = process_units(pdf, client, nlp_model, logger, cache_key, COLLECTIONS.get(doc_name, doc_name))
             all_chunks.extend(chunks)
         except redis.ConnectionError as conn_err:
             logger.error(f"Errore di connessione a Redis per il PDF {pdf}: {conn_err}")
+            continue
         except fitz.FileDataError as file_err:
             logger.error(f"Errore durante la lettura del PDF {pdf}: {file_err}")
         except Exception as e:
             logger.error(f"Errore sconosciuto durante l'elaborazione del PDF {pdf}: {e}")
+        if on_done is not None:
+            on_done(cache_key, "cached" if cache_key in cached else "processed" if chunks else "failed", len(chunks))
     
     logger.info(f"Elaborazione completata per {doc_name} in {time() - start_time} secondi")
+    return all_chunks
+
+def record_extraction(timings, units, collection):
+    """Metriche degli stadi di estrazione e segmentazione di un PDF (`timings` di `process_single_pdf`)."""
+    for stage in ('extract', 'sentencize'):
+        if stage in timings:
+            observe_stage(stage, timings[stage], collection)
+    record_items("pages", timings.get('pages', 0), collection)
+    record_items("units", len(units) if units else 0, collection)
+
+def extract_units_worker(pdf_path):
+    """Stadio di estrazione (eseguito nel pool di processi): testo del PDF, frasi e unità.
+
+    Restituisce anche i tempi degli stadi e le metriche raccolte nel processo (ad es. errori di log), da sommare nel processo principale.
+    """
+    timings = {}
+    units = process_single_pdf(pdf_path, get_nlp(), timings)
+    return units, timings, registry.drain()
+
+class BatchEncoder:
+    """Stadio di codifica: accoda i testi di più documenti e li passa al modello solo a batch pieni."""
+
+    def __init__(self, model, batch_size, stage="encode"):
+        self.model = model
+        self.batch_size = batch_size
+        self.stage = stage  # Nome dello stadio nelle metriche (i batch mescolano documenti di più collezioni)
+        self.dim = model.get_sentence_embedding_dimension()
+        self.entries = deque()  # [chiave, testi, matrice degli embeddings, testi già accodati] in ordine di arrivo
+        self.pending = 0  # Testi non ancora codificati
+        self.encoded = 0  # Testi codificati e relativo tempo del modello, per stimare il costo per testo
+        self.seconds = 0.0
+
+    def add(self, key, texts):
+        """Accodamento dei testi di un documento; restituisce i documenti completamente codificati."""
+        self.entries.append([key, texts, np.empty((len(texts), self.dim), dtype=np.float32), 0])
+        self.pending += len(texts)
+        return self._encode(final=False)
+
+    def flush(self):
+        """Codifica dei testi residui (ultimo batch parziale) a fine pipeline."""
+        return self._encode(final=True)
+
+    def _encode(self, final):
+        while self.pending >= self.batch_size or (final and self.pending > 0):
+            batch_texts = []
+            targets = []
+            for entry in self.entries:
+                take = min(self.batch_size - len(batch_texts), len(entry[1]) - entry[3])
+                if take > 0:
+                    targets.append((entry, entry[3], take))
+                    batch_texts.extend(entry[1][entry[3]:entry[3] + take])
+                    entry[3] += take
+                if len(batch_texts) == self.batch_size:
+                    break
+
+            start = perf_counter()
+            with timed(self.stage):
+                batch_embeddings = self.model.encode(batch_texts, convert_to_numpy=True)
+            self.seconds += perf_counter() - start
+            self.encoded += len(batch_texts)
+            offset = 0
+            for entry, start, take in targets:
+                entry[2][start:start + take] = batch_embeddings[offset:offset + take]
+                offset += take
+            self.pending -= len(batch_texts)
+
+        completed = []
+        while self.entries and self.entries[0][3] == len(self.entries[0][1]): # I batch si riempiono in ordine di arrivo
+            key, _, embeddings, _ = self.entries.popleft()
+            completed.append((key, embeddings))
+        return completed
+
+def redis_writer(client, write_queue, logger, on_done=None):
+    """Stadio di scrittura: salvataggio su Redis, in blocco, dei chunk (e dei loro embeddings) prodotti dall'encoder.
+
+    `on_done(chiave, esito, numero di chunk)` è chiamata per ogni documento solo dopo che il blocco che lo contiene è stato scritto;
+    i documenti di un blocco non scritto non vengono notificati, così un job li rielabora alla ripresa.
+    """
+    writer = BulkWriter(client)
+    pending = []  # (chiave, numero di chunk) dei documenti accodati nel writer e non ancora scritti
+    
+    def log_written(documents):
+        for source in documents:
+            logger.info(f"Elaborazione completata per il PDF: {source}")
+        if documents:
+            settle_deduplication([cache_key for cache_key, _ in pending], written=True)
+            notify(pending, "processed") # Un flush invia tutti i comandi in attesa
+    
+    def notify(documents, status):
+        if on_done is not None:
+            for cache_key, count in documents:
+                try:
+                    on_done(cache_key, status, count)
+                except Exception as e:
+                    # Il thread non deve terminare: il produttore resterebbe bloccato su una coda piena
+                    logger.error(f"Errore nella notifica del documento {cache_key}: {e}")
+        documents.clear()
+    
+    while True:
+        item = write_queue.get()
+        try:
+            if item is None:
+                with timed("store"):
+                    log_written(writer.flush())
+                break
+            (pdf_path, cache_key, collection), chunks, chunk_embeddings, references, fingerprints = item
+            pending.append((cache_key, len(chunks)))
+            with timed("store", collection):
+                log_written(writer.add_document(cache_key, chunks, chunk_embeddings, os.path.basename(pdf_path), collection,
+                                                references, fingerprints))
+            record_items("chunks", len(chunks), collection)
+            if write_queue.empty():
+                with timed("store"):
+                    log_written(writer.flush()) # Nessun altro documento in arrivo: invio del blocco parziale
+        except redis.ConnectionError as conn_err:
+            logger.error(f"Errore di connessione a Redis durante la scrittura dei chunk: {conn_err}")
+            settle_deduplication([cache_key for cache_key, _ in pending], written=False)
+            pending.clear()
+        except Exception as e:
+            logger.error(f"Errore nel salvataggio su Redis dei chunk: {e}")
+            settle_deduplication([cache_key for cache_key, _ in pending], written=False)
+            pending.clear()
+
+def run_chunking_pipeline(documentation, client, logger, on_done=None, should_stop=None):
+    """Pipeline a stadi su più collezioni: estrazione parallela, codifica a batch condivisi e scrittura asincrona.
+
+    `documentation` è una lista di coppie (nome della collezione, lista di (PDF, chiave di cache)).
+    `on_done(chiave, esito, numero di chunk)` è chiamata per ogni documento terminato ('cached',
+    'failed' oppure 'processed', dopo la scrittura su Redis); quando `should_stop` restituisce True
+    non vengono avviate nuove estrazioni e la pipeline termina dopo aver scritto i documenti già avviati.
+    """
+    start_time = time()
+    units_by_pdf = {}
+    chunks_by_pdf = {}
+    references_by_pdf = {}  # PDF -> (canonici, impronte) dei chunk in attesa dell'encoder
+    started = {}  # PDF -> istante di invio all'estrazione, per il tempo di elaborazione del documento
+    unit_encoder = BatchEncoder(get_embedding_model(), UNIT_BATCH_SIZE)
+    chunk_encoder = BatchEncoder(get_embedding_model(), CHUNK_BATCH_SIZE, stage="encode_chunks")
+    write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    writer = threading.Thread(target=redis_writer, args=(client, write_queue, logger, on_done), daemon=True)
+    writer.start()
+
+    # Verifica in blocco della cache per l'intera lista dei documenti
+    cached = cached_documents(client, [cache_key for _, documents in documentation for _, cache_key in documents])
+    pdf_files = []
+    for doc_name, documents in documentation:
+        for pdf, cache_key in documents:
+            if cache_key in cached:
+                logger.info(f"Risultato recuperato da Redis per {os.path.basename(pdf)}")
+                record_document(os.path.basename(pdf), COLLECTIONS.get(doc_name, doc_name), None, status="cached")
+                if on_done is not None:
+                    on_done(cache_key, "cached", 0)
+            else:
+                pdf_files.append((pdf, cache_key, COLLECTIONS.get(doc_name, doc_name)))
+    record_cache("documents", hits=len(cached), misses=len(pdf_files))
+    logger.info(f"PDF da elaborare: {len(pdf_files)} ({EXTRACT_WORKERS} processi di estrazione)")
+    if DEDUP_ENABLED and pdf_files:
+        dedup_index.load(client)
+
+    def fail(document):
+        pdf, cache_key, collection = document
+        started.pop(pdf, None)
+        record_document(os.path.basename(pdf), collection, None, status="failed")
+        if on_done is not None:
+            on_done(cache_key, "failed", 0)
+
+    def chunk_documents(encoded_units):
+        """Calcolo delle distanze e dei chunk per i documenti le cui unità sono state codificate."""
+        for document, unit_embeddings in encoded_units:
+            pdf, cache_key, collection = document
+            units = units_by_pdf.pop(pdf)
+            try:
+                with timed("distance", collection):
+                    distances = calculate_distance(unit_embeddings)
+                if len(distances) != len(units) - 1:
+                    logger.error(f"Errore nel calcolo delle distanze per {os.path.basename(pdf)}")
+                    fail(document)
+                    continue
+                with timed("chunk", collection):
+                    chunks = create_chunks_based_on_distances(units, distances, pdf, logger)
+            except Exception as e:
+                logger.error(f"Errore nella creazione dei chunk del PDF {pdf}: {e}")
+                fail(document)
+                continue
+            references, fingerprints = deduplicate_chunks(cache_key, chunks, collection)
+            if CHUNK_EMBEDDING_MODE == 'encode':
+                # Solo i chunk unici passano dall'encoder
+                chunks_by_pdf[pdf] = chunks
+                references_by_pdf[pdf] = (references, fingerprints)
+                write_documents(chunk_encoder.add(document, [chunk["text"] for chunk in unique_chunks(chunks, references)]))
+            else:
+                with timed("encode_chunks", collection):
+                    pooled = pool_chunk_embeddings(unit_embeddings, units, chunks) # Nessun passaggio dall'encoder
+                send_to_writer(document, chunks, pooled[[canonical is None for canonical in references]], references, fingerprints)
+
+    def write_documents(encoded_chunks):
+        """Passaggio allo stadio di scrittura dei documenti i cui chunk sono stati codificati."""
+        for document, chunk_embeddings in encoded_chunks:
+            send_to_writer(document, chunks_by_pdf.pop(document[0]), chunk_embeddings, *references_by_pdf.pop(document[0]))
+
+    def send_to_writer(document, chunks, unique_embeddings, references, fingerprints):
+        # L'encoder completa i documenti in ordine di arrivo: i canonici di questa esecuzione sono già codificati
+        pdf, cache_key, collection = document
+        chunk_embeddings = resolve_chunk_embeddings(client, cache_key, chunks, references, unique_embeddings)
+        record_document(os.path.basename(pdf), collection, time() - started.pop(pdf))
+        write_queue.put((document, chunks, chunk_embeddings, references, fingerprints))
+
+    try:
+        # Processi avviati con spawn: un fork copierebbe il processo con il thread di scrittura, il modello e il pool di Redis già attivi
+        # (lock eventualmente presi da altri thread restano bloccati nel figlio); partono anche senza le metriche del processo principale
+        with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")) as executor:
+            remaining = iter(pdf_files)
+            in_flight = {}
+            stopping = False
+            while True:
+                if not stopping and should_stop is not None and should_stop():
+                    logger.info("Tempo a disposizione esaurito: completamento dei PDF già avviati senza avviarne altri")
+                    stopping = True
+                    remaining = iter(())
+                # Riempimento della coda di estrazione fino alla profondità configurata
+                for document in remaining:
+                    started[document[0]] = time()
+                    in_flight[executor.submit(extract_units_worker, document[0])] = document
+                    if len(in_flight) >= EXTRACT_QUEUE_SIZE:
+                        break
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document = in_flight.pop(future)
+                    pdf, _, collection = document
+                    try:
+                        units, timings, samples = future.result()
+                    except Exception as e:
+                        logger.error(f"Errore durante l'estrazione del PDF {pdf}: {e}")
+                        fail(document)
+                        continue
+                    registry.merge(samples)
+                    record_extraction(timings, units, collection)
+                    if not units:
+                        logger.error(f"Nessuna unità trovata nel PDF: {os.path.basename(pdf)}")
+                        fail(document)
+                        continue
+                    units_by_pdf[pdf] = units
+                    chunk_documents(unit_encoder.add(document, units))
+
+        chunk_documents(unit_encoder.flush())
+        write_documents(chunk_encoder.flush())
+    finally:
+        write_queue.put(None)
+        writer.join()
+
+    if DEDUP_ENABLED:
+        dedup_index.log_stats(chunk_encoder.seconds / chunk_encoder.encoded if chunk_encoder.encoded else None)
+    logger.info(f"Elaborazione completata per {', '.join(doc_name for doc_name, _ in documentation)} in {time() - start_time} secondi")
 
 def get_redis_keys_info(client):
     """Recupera il numero totale delle chiavi memorizzate in Redis e l'elenco delle chiavi."""
@@ -291,15 +1014,8 @@ def get_redis_keys_info(client):
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
-@app.route(route="http_trigger_chunking")
-def http_trigger_chunking(req: func.HttpRequest) -> func.HttpResponse:
-    
-    # Connessione a Redis
-    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, ssl=True)
-    
-    # Pulizia della cache di Redis
-    # client.flushdb() -> Pulizia del database Redis
-    
+def chunking_sources():
+    """Cartelle della documentazione da elaborare: coppie (nome della collezione, lista dei PDF)."""
     # Documentazione di Red Hat 8
     directory_relh8_path = r"C:\Users\rdell\OneDrive - Politecnico di Torino\Desktop\Reply9\METIS\Scraping\RedHat8\src\functions\documentsRelH8"
     # Documentazione di Red Hat 9
@@ -314,14 +1030,130 @@ def http_trigger_chunking(req: func.HttpRequest) -> func.HttpResponse:
     # Lista dei PDF Windows Server
     pdf_ws_files = [os.path.join(directory_ws_path, f) for f in os.listdir(directory_ws_path) if f.endswith('.pdf')]
     
-    # Elaborazione di ciascun PDF della documentazione Red Hat 8
-    process_documentation(pdf_relh8_files, client, nlp_en, logger, "Red Hat 8")
+    return [
+        ("Red Hat 8", pdf_relh8_files),
+        ("Red Hat 9", pdf_relh9_files),
+        ("Windows Server", pdf_ws_files)
+    ]
+
+def prepare_chunking(client, logger):
+    """Risoluzione delle chiavi di cache della documentazione e creazione dell'indice vettoriale."""
+    # Chiavi di cache basate sul contenuto (checksum della sonda) e pulizia dei documenti non più presenti
+    documentation = resolve_documents(chunking_sources(), client, logger)
+    
+    # Creazione dell'indice vettoriale sui chunk (richiede il modulo RediSearch)
+    try:
+        create_vector_index(client, get_embedding_model().get_sentence_embedding_dimension())
+    except redis.ResponseError as e:
+        logger.error(f"Impossibile creare l'indice vettoriale (RediSearch non disponibile?): {e}")
+    
+    return documentation
 
-    # Elaborazione di ciascun PDF della documentazione Red Hat 9 (solo dopo Red Hat 8)
-    process_documentation(pdf_relh9_files, client, nlp_en, logger, "Red Hat 9")
+def chunk_documentation(documentation, client, logger, on_done=None, should_stop=None):
+    """Elaborazione della documentazione con la pipeline configurata (vedi `run_chunking_pipeline` per `on_done` e `should_stop`)."""
+    if PIPELINE_MODE == 'sequential':
+        # Impronte dei chunk già salvati, per riconoscere i duplicati tra documenti e collezioni
+        if DEDUP_ENABLED:
+            dedup_index.load(client)
+        # Elaborazione di ciascuna documentazione, un PDF alla volta (Red Hat 8, poi Red Hat 9, poi Windows Server)
+        for doc_name, documents in documentation:
+            process_documentation(documents, client, get_nlp(), logger, doc_name, on_done, should_stop)
+        if DEDUP_ENABLED:
+            dedup_index.log_stats()
+    else:
+        # Elaborazione a stadi di tutte le documentazioni: estrazione parallela, codifica a batch pieni e scrittura asincrona
+        run_chunking_pipeline(documentation, client, logger, on_done, should_stop)
 
-    # Elaborazione di ciascun PDF della documentazione di Windows Server (solo dopo Red Hat 9)
-    process_documentation(pdf_ws_files, client, nlp_en, logger, "Windows Server")
+def finalize_chunking(client, logger):
+    """Operazioni al termine del chunking: statistiche, metriche, centroidi e indice lessicale."""
+    if EMBEDDING_CACHE_ENABLED:
+        get_embedding_model().log_stats()
+    
+    # Riepilogo dei tempi per stadio e invio delle metriche dell'esecuzione al Pushgateway (se configurato)
+    log_summary(logger)
+    push("chunking")
+    
+    # Centroidi per l'instradamento dei documenti salvati prima che venissero calcolati in scrittura
+    try:
+        update_document_centroids(client)
+    except Exception as e:
+        logger.error(f"Errore durante il calcolo dei centroidi dei documenti: {e}")
+    
+    # Ricostruzione dell'indice lessicale BM25 dai chunk salvati (con RediSearch il full-text è già indicizzato)
+    if LEXICAL_BACKEND == 'local':
+        try:
+            build_lexical_index(client)
+        except Exception as e:
+            logger.error(f"Errore durante la costruzione dell'indice lessicale: {e}")
+
+def run_job(client, job_id, logger, budget=JOB_TIME_BUDGET):
+    """Esecuzione (o ripresa) di un job di chunking per al più `budget` secondi, dai documenti senza checkpoint.
+
+    Alla prima esecuzione risolve i documenti e crea l'indice vettoriale (`prepare_chunking`). Allo
+    scadere del budget non vengono avviati altri PDF: il job resta sospeso e viene ripreso dal timer.
+    Documenti rimasti senza checkpoint prima della scadenza (scrittura su Redis non riuscita) contano
+    come un tentativo fallito. Restituisce False se il job è già in esecuzione in un altro processo.
+    """
+    owner = uuid.uuid4().hex
+    if not claim_job(client, job_id, owner):
+        return False
+    
+    start_time = time()
+    update_job(client, job_id, status="running", started=start_time)
+    status, error = "suspended", None
+    try:
+        documentation = pending_documents(client, job_id)
+        if documentation is None:
+            set_documents(client, job_id, prepare_chunking(client, logger))
+            documentation = pending_documents(client, job_id)
+        logger.info(f"Job {job_id}: {sum(len(documents) for _, documents in documentation)} documenti da elaborare")
+        chunk_documentation(documentation, client, logger,
+                            on_done=lambda cache_key, result, chunks: checkpoint(client, job_id, cache_key, result, chunks, owner),
+                            should_stop=lambda: time() - start_time > budget)
+        remaining = pending_documents(client, job_id)
+        if not remaining:
+            finalize_chunking(client, logger)
+            status = "completed"
+        elif time() - start_time <= budget:
+            error = f"{sum(len(documents) for _, documents in remaining)} documenti non salvati su Redis"
+            logger.error(f"Job {job_id}: {error}")
+            status = "failed" if record_attempt(client, job_id) >= JOB_MAX_ATTEMPTS else "suspended"
+    except Exception as e:
+        logger.error(f"Errore durante l'esecuzione del job {job_id}: {e}")
+        status = "failed" if record_attempt(client, job_id) >= JOB_MAX_ATTEMPTS else "suspended"
+        error = str(e)
+    finally:
+        finish_run(client, job_id, time() - start_time, status, error)
+        release_job(client, job_id, owner)
+    
+    logger.info(f"Job {job_id} {status} dopo {time() - start_time} secondi")
+    return True
+
+@app.route(route="http_trigger_chunking")
+def http_trigger_chunking(req: func.HttpRequest) -> func.HttpResponse:
+    """Chunking della documentazione.
+
+    Con `mode=job` la richiesta registra un job e risponde subito (202) con il suo id: la risoluzione
+    dei documenti e l'elaborazione proseguono in un thread del processo e, se interrotte, vengono
+    riprese dal timer dall'ultimo checkpoint (avanzamento su `http_trigger_chunking_status`).
+    Altrimenti l'intera elaborazione avviene nella richiesta.
+    """
+    
+    # Connessione a Redis
+    client = get_redis_client()
+    
+    # Pulizia della cache di Redis
+    # client.flushdb() -> Pulizia del database Redis
+    
+    if req.params.get('mode') == 'job':
+        job_id = create_job(client)
+        threading.Thread(target=run_job, args=(client, job_id, logger), name=f"job-{job_id}", daemon=True).start()
+        logger.info(f"Job di chunking {job_id} avviato")
+        return func.HttpResponse(json.dumps(job_status(client, job_id), indent=4), status_code=202, mimetype="application/json")
+    
+    documentation = prepare_chunking(client, logger)
+    chunk_documentation(documentation, client, logger)
+    finalize_chunking(client, logger)
     
     # Test della connessione
     try:
@@ -334,4 +1166,123 @@ def http_trigger_chunking(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         
         logger.error(f"Errore di connessione: {e}")
-        return func.HttpResponse(f"Errore di connessione: {e}", status_code=500)
\ No newline at end of file
+        return func.HttpResponse(f"Errore di connessione: {e}", status_code=500)
+
+@app.route(route="http_trigger_search")
+def http_trigger_search(req: func.HttpRequest) -> func.HttpResponse:
+    """Ricerca dei top-k chunk più rilevanti per la query (`q`), con filtro opzionale per collezione (`collection`).
+
+    `mode` sceglie tra ricerca ibrida BM25 + vettoriale ('hybrid'), solo vettoriale ('vector') o solo BM25 ('lexical');
+    `route=true` limita la ricerca ai documenti scelti dal router a centroidi.
+    """
+    query = req.params.get('q')
+    if not query:
+        return func.HttpResponse(json.dumps({"error": "Parametro 'q' mancante"}), status_code=400, mimetype="application/json")
+    
+    try:
+        k = int(req.params.get('k', 5))
+        ef_runtime = int(req.params['ef']) if 'ef' in req.params else None
+    except ValueError:
+        return func.HttpResponse(json.dumps({"error": "Parametri 'k' ed 'ef' devono essere interi"}), status_code=400, mimetype="application/json")
+    collections = [c for c in req.params.get('collection', '').split(',') if c]
+    mode = req.params.get('mode', SEARCH_MODE)
+    if mode not in SEARCH_MODES:
+        return func.HttpResponse(json.dumps({"error": f"Modalità '{mode}' non supportata"}), status_code=400, mimetype="application/json")
+    routing = req.params.get('route', str(ROUTING_ENABLED)).lower() == 'true'
+    
+    client = get_redis_client()
+    
+    start_time = time()
+    try:
+        if not QUERY_CACHE_ENABLED:
+            results = search_chunks(client, query, get_embedding_model(), k, collections, ef_runtime, mode, routing)
+            logger.info(f"Ricerca ({mode}) completata in {time() - start_time} secondi: {len(results)} risultati")
+            return func.HttpResponse(json.dumps({"query": query, "mode": mode, "results": results}, indent=4), status_code=200, mimetype="application/json")
+        
+        # Cache semantica: una query simile già risolta con gli stessi parametri evita KNN, BM25 e fusione
+        query_vector = get_embedding_model().encode(query, convert_to_numpy=True)
+        scope = (mode, k, tuple(sorted(collections)), routing, ef_runtime)
+        cached = query_cache.lookup(client, query_vector, scope)
+        if cached is not None:
+            logger.info(f"Ricerca ({mode}) servita dalla cache in {time() - start_time} secondi (similarità {cached['similarity']:.3f})")
+            cache_info = {"hit": True, "similarity": cached["similarity"], "age": cached["age"]}
+            return func.HttpResponse(json.dumps({"query": query, "mode": mode, "cache": cache_info, "results": cached["results"]}, indent=4),
+                                     status_code=200, mimetype="application/json")
+        
+        search_start = time()
+        results = search_chunks(client, query, get_embedding_model(), k, collections, ef_runtime, mode, routing, query_vector)
+        query_cache.store(query_vector, scope, results, time() - search_start)
+        logger.info(f"Ricerca ({mode}) completata in {time() - start_time} secondi: {len(results)} risultati")
+        return func.HttpResponse(json.dumps({"query": query, "mode": mode, "cache": {"hit": False}, "results": results}, indent=4),
+                                 status_code=200, mimetype="application/json")
+    
+    except Exception as e:
+        logger.error(f"Errore durante la ricerca: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
+    finally:
+        observe_request("search", time() - start_time)
+
+@app.route(route="http_trigger_routing")
+def http_trigger_routing(req: func.HttpRequest) -> func.HttpResponse:
+    """Collezioni (`collections`, default ROUTING_TOP_COLLECTIONS) e documenti (`documents`) più vicini alla query (`q`)."""
+    query = req.params.get('q')
+    if not query:
+        return func.HttpResponse(json.dumps({"error": "Parametro 'q' mancante"}), status_code=400, mimetype="application/json")
+    
+    try:
+        top_collections = int(req.params.get('collections', ROUTING_TOP_COLLECTIONS))
+        top_documents = int(req.params.get('documents', ROUTING_TOP_DOCUMENTS))
+    except ValueError:
+        return func.HttpResponse(json.dumps({"error": "Parametri 'collections' e 'documents' devono essere interi"}), status_code=400, mimetype="application/json")
+    collections = [c for c in req.params.get('collection', '').split(',') if c]
+    
+    client = get_redis_client()
+    
+    start_time = time()
+    try:
+        query_vector = get_embedding_model().encode(query, convert_to_numpy=True)
+        routed = route_query(client, query_vector, top_collections, top_documents, collections)
+        logger.info(f"Instradamento completato in {time() - start_time} secondi: {len(routed['documents'])} documenti")
+        return func.HttpResponse(json.dumps(dict(routed, query=query), indent=4), status_code=200, mimetype="application/json")
+    
+    except Exception as e:
+        logger.error(f"Errore durante l'instradamento: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
+    finally:
+        observe_request("routing", time() - start_time)
+
+@app.route(route="http_trigger_search_stats")
+def http_trigger_search_stats(req: func.HttpRequest) -> func.HttpResponse:
+    """Statistiche della cache delle query di questo processo: hit rate e secondi di ricerca risparmiati."""
+    query_cache.log_stats()
+    return func.HttpResponse(json.dumps(query_cache.stats(), indent=4), status_code=200, mimetype="application/json")
+
+@app.route(route="http_trigger_metrics")
+def http_trigger_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """Metriche di questo processo (tempi per stadio e per documento, cache, Redis) nel formato testuale di Prometheus."""
+    return func.HttpResponse(registry.render(), status_code=200, headers={"Content-Type": CONTENT_TYPE})
+
+@app.route(route="http_trigger_chunking_status")
+def http_trigger_chunking_status(req: func.HttpRequest) -> func.HttpResponse:
+    """Avanzamento del job indicato (`job`): documenti completati, throughput e tempo stimato; senza `job` i job più recenti."""
+    client = get_redis_client()
+    job_id = req.params.get('job')
+    if not job_id:
+        return func.HttpResponse(json.dumps(list_jobs(client), indent=4), status_code=200, mimetype="application/json")
+    
+    status = job_status(client, job_id)
+    if status is None:
+        return func.HttpResponse(json.dumps({"error": f"Job '{job_id}' non trovato"}), status_code=404, mimetype="application/json")
+    return func.HttpResponse(json.dumps(status, indent=4), status_code=200, mimetype="application/json")
+
+@app.timer_trigger(schedule=JOB_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def timer_trigger_chunking_jobs(timer: func.TimerRequest) -> None:
+    """Ripresa dall'ultimo checkpoint dei job interrotti (timeout, crash o budget esaurito), nel tempo di una esecuzione."""
+    client = get_redis_client()
+    start_time = time()
+    for job_id in resumable_jobs(client):
+        budget = JOB_TIME_BUDGET - (time() - start_time)
+        if budget <= 0:
+            break
+        logger.info(f"Ripresa del job di chunking {job_id}")
+        run_job(client, job_id, logger, budget)
@@ -0,0 +1,194 @@
+"""Job di chunking asincroni con checkpoint per documento salvati in Redis.
+
+Un aggiornamento completo delle tre collezioni può superare il timeout delle Functions: in modalità
+job la richiesta HTTP registra il job e restituisce subito il suo id, mentre la risoluzione dei
+documenti (alla prima esecuzione) e l'elaborazione procedono a segmenti di al più `JOB_TIME_BUDGET`
+secondi. Chiavi usate:
+- `job:<id>` (hash): stato, documenti (JSON, assente finché non sono risolti), contatori, istanti di
+  creazione e aggiornamento, secondi di elaborazione effettiva, tentativi ed eventuale ultimo errore;
+- `job:<id>:checkpoints` (hash): esito di ogni documento completato ('processed', 'cached' o
+  'failed'), scritto solo dopo che i suoi chunk sono stati salvati;
+- `job:<id>:lease` (stringa con scadenza): il processo che sta eseguendo il job; se il processo
+  termina (timeout o crash) il lease scade e il timer riprende il job dai documenti senza checkpoint;
+- `jobs` (sorted set): id dei job per istante di creazione.
+
+I documenti sono indirizzati per contenuto, quindi un documento scritto ma non ancora registrato
+nei checkpoint viene riconosciuto come già presente alla ripresa e non è rielaborato.
+"""
+import json
+import logging
+import os
+import uuid
+from time import time
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione dei job di chunking
+JOB_KEY_PREFIX = "job"
+JOBS_KEY = "jobs"  # Sorted set degli id dei job per istante di creazione
+JOB_TIME_BUDGET = float(os.getenv('CHUNKING_JOB_TIME_BUDGET', 480))  # Secondi di elaborazione per esecuzione, sotto il timeout delle Functions
+JOB_LEASE_SECONDS = int(os.getenv('CHUNKING_JOB_LEASE', 900))  # Validità del lease senza nuovi checkpoint (maggiore del budget)
+JOB_MAX_ATTEMPTS = int(os.getenv('CHUNKING_JOB_MAX_ATTEMPTS', 5))  # Esecuzioni interrotte da un errore prima di dichiarare fallito il job
+JOB_RETENTION = int(os.getenv('CHUNKING_JOB_RETENTION', 7 * 24 * 3600))  # Secondi di conservazione dei job terminati
+JOB_SCHEDULE = os.getenv('CHUNKING_JOB_SCHEDULE', '0 */5 * * * *')  # Espressione NCRONTAB del timer che riprende i job interrotti
+
+ACTIVE_STATUSES = ("queued", "running", "suspended")  # Stati dei job da completare
+
+def job_key(job_id, suffix=None):
+    return f"{JOB_KEY_PREFIX}:{job_id}" if suffix is None else f"{JOB_KEY_PREFIX}:{job_id}:{suffix}"
+
+def decode_hash(values):
+    return {key.decode('utf-8'): value.decode('utf-8') for key, value in values.items()}
+
+def serialize_documentation(documentation):
+    return json.dumps([[doc_name, [list(document) for document in documents]] for doc_name, documents in documentation])
+
+def create_job(client, documentation=None):
+    """Registrazione di un job per `documentation` (coppie nome della collezione, lista di (PDF, chiave)); restituisce l'id.
+
+    Senza `documentation` i documenti sono registrati in seguito con `set_documents`, dalla prima esecuzione del job.
+    """
+    job_id = uuid.uuid4().hex
+    now = time()
+    fields = {
+        "status": "queued",
+        "total": 0,
+        "processed": 0,
+        "cached": 0,
+        "failed": 0,
+        "chunks": 0,
+        "active_seconds": 0.0,
+        "attempts": 0,
+        "created": now,
+        "updated": now
+    }
+    if documentation is not None:
+        fields.update(documents=serialize_documentation(documentation), total=sum(len(documents) for _, documents in documentation))
+    pipe = client.pipeline(transaction=False)
+    pipe.hset(job_key(job_id), mapping=fields)
+    pipe.zadd(JOBS_KEY, {job_id: now})
+    pipe.execute()
+    return job_id
+
+def set_documents(client, job_id, documentation):
+    """Registrazione dei documenti risolti di un job creato senza `documentation`."""
+    update_job(client, job_id, documents=serialize_documentation(documentation),
+               total=sum(len(documents) for _, documents in documentation))
+
+def claim_job(client, job_id, owner):
+    """Acquisizione del lease del job: False se un altro processo lo sta già eseguendo."""
+    return bool(client.set(job_key(job_id, "lease"), owner, nx=True, ex=JOB_LEASE_SECONDS))
+
+def release_job(client, job_id, owner):
+    """Rilascio del lease, se ancora posseduto da `owner`."""
+    lease = job_key(job_id, "lease")
+    if client.get(lease) == owner.encode('utf-8'):
+        client.delete(lease)
+
+def pending_documents(client, job_id):
+    """Documenti del job ancora senza checkpoint, nello stesso formato di `create_job`; None se non ancora risolti."""
+    raw = client.hget(job_key(job_id), "documents")
+    if raw is None:
+        return None
+    done = {key.decode('utf-8') for key in client.hkeys(job_key(job_id, "checkpoints"))}
+    pending = []
+    for doc_name, documents in json.loads(raw):
+        documents = [(pdf, cache_key) for pdf, cache_key in documents if cache_key not in done]
+        if documents:
+            pending.append((doc_name, documents))
+    return pending
+
+def checkpoint(client, job_id, cache_key, status, chunks=0, owner=None):
+    """Registrazione dell'esito di un documento, aggiornamento dei contatori e rinnovo del lease."""
+    pipe = client.pipeline(transaction=False)
+    pipe.hsetnx(job_key(job_id, "checkpoints"), cache_key, status)
+    pipe.hincrby(job_key(job_id), status, 1)
+    pipe.hincrby(job_key(job_id), "chunks", chunks)
+    pipe.hset(job_key(job_id), "updated", time())
+    if owner is not None:
+        pipe.expire(job_key(job_id, "lease"), JOB_LEASE_SECONDS)
+    first, *_ = pipe.execute()
+    if not first:
+        # Documento già registrato (ad es. da un'esecuzione precedente interrotta dopo il checkpoint): contatori ripristinati
+        pipe = client.pipeline(transaction=False)
+        pipe.hincrby(job_key(job_id), status, -1)
+        pipe.hincrby(job_key(job_id), "chunks", -chunks)
+        pipe.execute()
+
+def update_job(client, job_id, **fields):
+    """Aggiornamento dei campi del job (stato, errore, ...) con l'istante di aggiornamento."""
+    client.hset(job_key(job_id), mapping=dict(fields, updated=time()))
+
+def record_attempt(client, job_id):
+    """Conteggio di un'esecuzione interrotta da un errore; restituisce il numero di tentativi falliti."""
+    return client.hincrby(job_key(job_id), "attempts", 1)
+
+def finish_run(client, job_id, seconds, status, error=None):
+    """Chiusura di un'esecuzione: secondi di elaborazione sommati, nuovo stato ed eventuale errore."""
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrbyfloat(job_key(job_id), "active_seconds", seconds)
+    pipe.hset(job_key(job_id), mapping={"status": status, "updated": time(), "error": error or ""})
+    if status in ("completed", "failed"):
+        pipe.hset(job_key(job_id), "finished", time())
+        for suffix in (None, "checkpoints"):
+            pipe.expire(job_key(job_id, suffix), JOB_RETENTION)
+    pipe.execute()
+
+def job_status(client, job_id):
+    """Stato del job con avanzamento, throughput (documenti al secondo di elaborazione) e tempo stimato al completamento."""
+    job = decode_hash(client.hgetall(job_key(job_id)))
+    if not job:
+        return None
+    total = int(job["total"])
+    processed, cached, failed = int(job["processed"]), int(job["cached"]), int(job["failed"])
+    done = processed + cached + failed
+    running = client.exists(job_key(job_id, "lease")) == 1
+    active_seconds = float(job["active_seconds"])
+    if job["status"] == "running" and running and "started" in job:
+        active_seconds += time() - float(job["started"]) # Esecuzione in corso (senza lease il processo si è interrotto)
+    throughput = (processed + failed) / active_seconds if active_seconds > 0 else 0.0 # I documenti in cache non richiedono elaborazione
+    remaining = total - done
+    return {
+        "job": job_id,
+        "status": job["status"],
+        "total": total,
+        "done": done,
+        "processed": processed,
+        "cached": cached,
+        "failed": failed,
+        "chunks": int(job["chunks"]),
+        "progress": done / total if total else float("documents" in job),
+        "active_seconds": active_seconds,
+        "documents_per_second": throughput,
+        "eta_seconds": remaining / throughput if throughput > 0 else None,
+        "attempts": int(job["attempts"]),
+        "running": running,
+        "error": job.get("error") or None,
+        "created": float(job["created"]),
+        "updated": float(job["updated"])
+    }
+
+def list_jobs(client, limit=20):
+    """Stato dei job più recenti (i job scaduti sono rimossi dall'elenco)."""
+    statuses = []
+    for job_id in client.zrevrange(JOBS_KEY, 0, limit - 1):
+        job_id = job_id.decode('utf-8')
+        status = job_status(client, job_id)
+        if status is None:
+            client.zrem(JOBS_KEY, job_id)
+        else:
+            statuses.append(status)
+    return statuses
+
+def resumable_jobs(client):
+    """Id dei job non terminati e senza un processo che li stia eseguendo (lease scaduto o mai acquisito), dal meno recente."""
+    job_ids = [job_id.decode('utf-8') for job_id in client.zrange(JOBS_KEY, 0, -1)]
+    if not job_ids:
+        return []
+    pipe = client.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hget(job_key(job_id), "status")
+        pipe.exists(job_key(job_id, "lease"))
+    replies = pipe.execute()
+    return [job_id for job_id, status, leased in zip(job_ids, replies[::2], replies[1::2])
+            if status is not None and status.decode('utf-8') in ACTIVE_STATUSES and not leased]
@@ -0,0 +1,248 @@
+"""Indice lessicale BM25 dei chunk, con liste di posting in array NumPy salvati su disco (`.npz`).
+
+Le query tecniche sono piene di token esatti (`dnf`, `sshd_config`, cmdlet PowerShell, numeri KB)
+su cui la sola ricerca vettoriale con MiniLM rende peggio: l'indice lessicale li trova per
+corrispondenza esatta ed è fuso con la ricerca KNN in `retrieval`.
+
+Struttura dell'indice (formato CSR, una riga per termine):
+- `offsets[t]:offsets[t + 1]` delimita le posting del termine `t` in `doc_ids` (int32) e
+  `term_freqs` (uint16), ordinate per documento;
+- `doc_lengths` contiene il numero di token di ciascun chunk, `keys` la sua chiave Redis,
+  `collection_ids` l'indice della sua collezione in `collections` e `document_ids` l'indice del
+  suo documento in `documents` (per i chunk deduplicati l'elenco, separato da virgole, delle
+  collezioni e dei documenti che lo contengono, come i TAG dell'indice RediSearch).
+
+L'indice è ricostruito da Redis (`build_lexical_index`) a fine chunking e ricaricato dai processi
+di ricerca quando il file cambia. In alternativa (`LEXICAL_BACKEND='redisearch'`, vedi
+`retrieval`) si usa il full-text BM25 di RediSearch sul campo `text` dell'indice dei chunk, che
+non richiede un file condiviso tra le istanze.
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from chunk_store import CACHE_KEY_PREFIX, DEDUP_REFS_PREFIX, REDIS_WRITE_BATCH_SIZE, chunk_keys, document_key
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione dell'indice lessicale
+LEXICAL_INDEX_PATH = os.getenv('LEXICAL_INDEX_PATH', os.path.join(tempfile.gettempdir(), 'chunking_lexical_index.npz'))
+BM25_K1 = float(os.getenv('BM25_K1', 1.2))  # Saturazione della frequenza dei termini
+BM25_B = float(os.getenv('BM25_B', 0.75))  # Peso della normalizzazione per lunghezza del chunk
+MAX_TOKEN_LENGTH = 64  # Token più lunghi (hash, base64, ...) non sono indicizzati
+
+# Token tecnici: parti alfanumeriche unite da '.', '_' o '-' (sshd_config, Get-ChildItem, 8.4, kb5005575)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[._\-]")
+
+def tokenize(text):
+    """Token del testo in minuscolo; i token composti sono indicizzati anche per parti (sshd_config -> sshd, config)."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if len(token) > MAX_TOKEN_LENGTH:
+            continue
+        tokens.append(token)
+        if TOKEN_SEPARATORS.search(token):
+            tokens.extend(TOKEN_SEPARATORS.split(token))
+    return tokens
+
+def as_numpy(values, dtype):
+    """Copia di un `array.array` in un array NumPy del tipo indicato (senza passare da oggetti Python)."""
+    return np.frombuffer(values, dtype=dtype).copy() if len(values) else np.empty(0, dtype=dtype)
+
+class LexicalIndex:
+    """Indice invertito BM25 in sola lettura (condivisibile tra thread)."""
+
+    def __init__(self, terms, offsets, doc_ids, term_freqs, doc_lengths, keys, collection_ids, collections,
+                 document_ids=None, documents=None):
+        self.terms = terms
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.keys = keys
+        self.collection_ids = collection_ids
+        self.collections = collections
+
+        # Documenti di ciascun chunk (per il filtro sui documenti scelti da `routing`); negli indici
+        # salvati prima dei chunk deduplicati sono ricavati dalla chiave
+        if document_ids is None:
+            document_names = {}
+            document_ids = np.fromiter((document_names.setdefault(document_key(key), len(document_names)) for key in keys),
+                                       dtype=np.int32, count=len(keys))
+            documents = list(document_names)
+        self.document_ids = document_ids
+        self.documents = documents
+        self.document_groups = {}  # Documento -> indici degli elenchi di documenti che lo contengono
+        for i, name in enumerate(documents):
+            for part in name.split(","):
+                self.document_groups.setdefault(part, []).append(i)
+
+        # Parte del denominatore BM25 che dipende solo dal chunk, calcolata una volta
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        self.length_norms = (BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(average_length, 1.0))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, keys, texts, collections, documents=None):
+        """Costruzione dell'indice da chiavi, testi, collezioni e documenti dei chunk (sequenze allineate; documenti ricavati dalle chiavi se assenti)."""
+        if documents is None:
+            documents = [document_key(key) for key in keys]
+        vocabulary = {}
+        collection_names = {}
+        document_names = {}
+        term_ids, doc_ids, term_freqs = array('i'), array('i'), array('H')
+        doc_lengths, collection_ids, document_ids = array('i'), array('B'), array('i')
+        for doc_id, (text, collection, document) in enumerate(zip(texts, collections, documents)):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            collection_ids.append(collection_names.setdefault(collection, len(collection_names)))
+            document_ids.append(document_names.setdefault(document, len(document_names)))
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(min(count, 65535))
+
+        # Ordinamento stabile per termine: le posting di ogni termine restano in ordine di documento
+        term_ids = as_numpy(term_ids, np.int32)
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            list(vocabulary),
+            offsets,
+            as_numpy(doc_ids, np.int32)[order],
+            as_numpy(term_freqs, np.uint16)[order],
+            as_numpy(doc_lengths, np.int32),
+            list(keys),
+            as_numpy(collection_ids, np.uint8),
+            list(collection_names),
+            as_numpy(document_ids, np.int32),
+            list(document_names)
+        )
+
+    def save(self, path=LEXICAL_INDEX_PATH):
+        """Salvataggio atomico su disco (file temporaneo rinominato), senza oggetti Python serializzati."""
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(self.terms).encode('utf-8'), dtype=np.uint8),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                keys=np.frombuffer("\n".join(self.keys).encode('utf-8'), dtype=np.uint8),
+                collection_ids=self.collection_ids,
+                collections=np.frombuffer("\n".join(self.collections).encode('utf-8'), dtype=np.uint8),
+                document_ids=self.document_ids,
+                documents=np.frombuffer("\n".join(self.documents).encode('utf-8'), dtype=np.uint8)
+            )
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path=LEXICAL_INDEX_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            def strings(name):
+                raw = data[name].tobytes().decode('utf-8')
+                return raw.split("\n") if raw else []
+            has_documents = "document_ids" in data.files
+            return cls(strings("terms"), data["offsets"], data["doc_ids"], data["term_freqs"], data["doc_lengths"],
+                       strings("keys"), data["collection_ids"], strings("collections"),
+                       data["document_ids"] if has_documents else None, strings("documents") if has_documents else None)
+
+    def scores(self, query):
+        """Score BM25 di tutti i chunk per la query (0 per i chunk senza termini in comune)."""
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        n_docs = len(self.keys)
+        for term_id in {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            idf = np.log1p((n_docs - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[docs] += idf * freqs * (BM25_K1 + 1) / (freqs + self.length_norms[docs])
+        return scores
+
+    def search(self, query, k=10, collections=None, documents=None):
+        """Coppie (chiave, score) dei `k` chunk con score BM25 più alto, con filtro opzionale per collezione o per documento."""
+        scores = self.scores(query)
+        if collections:
+            allowed = [i for i, name in enumerate(self.collections) if any(part in collections for part in name.split(","))]
+            scores[~np.isin(self.collection_ids, allowed)] = 0.0
+        if documents:
+            allowed = [i for document in documents for i in self.document_groups.get(document["key"], ())]
+            scores[~np.isin(self.document_ids, allowed)] = 0.0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.keys[i], float(scores[i])) for i in candidates]
+
+def build_lexical_index(client, path=LEXICAL_INDEX_PATH, batch_size=REDIS_WRITE_BATCH_SIZE):
+    """Ricostruzione dell'indice da tutti i documenti salvati per intero in Redis e salvataggio su disco."""
+    cache_keys = [key.decode('utf-8') for key in client.scan_iter(match=f"{CACHE_KEY_PREFIX}:*", count=1000)]
+    pipe = client.pipeline(transaction=False)
+    for cache_key in cache_keys:
+        pipe.hmget(cache_key, "count", "collection")
+
+    all_keys = []
+    for cache_key, document in zip(cache_keys, pipe.execute(raise_on_error=False)):
+        if isinstance(document, Exception) or document[0] is None:
+            continue # Chiave in un formato precedente o documento salvato solo in parte
+        all_keys.extend(chunk_keys(cache_key, int(document[0])))
+
+    # Documenti dei chunk che referenziano ciascun canonico deduplicato
+    referring = {}
+    ref_keys = [key.decode('utf-8') for key in client.scan_iter(match=f"{DEDUP_REFS_PREFIX}:*", count=1000)]
+    pipe = client.pipeline(transaction=False)
+    for ref_key in ref_keys:
+        pipe.smembers(ref_key)
+    for ref_key, members in zip(ref_keys, pipe.execute() if ref_keys else []):
+        referring[ref_key[len(DEDUP_REFS_PREFIX) + 1:]] = sorted({document_key(member.decode('utf-8')) for member in members})
+
+    # Collezione letta dal chunk: per i canonici deduplicati è l'elenco delle collezioni che lo contengono
+    keys, texts, collections, documents = [], [], [], []
+    for i in range(0, len(all_keys), batch_size):
+        batch = all_keys[i:i + batch_size]
+        pipe = client.pipeline(transaction=False)
+        for key in batch:
+            pipe.hmget(key, "text", "collection")
+        for key, (text, collection) in zip(batch, pipe.execute()):
+            if text is None:
+                continue # Riferimento a un chunk canonico (già indicizzato) o chunk eliminato
+            keys.append(key)
+            texts.append(text.decode('utf-8'))
+            collections.append(collection.decode('utf-8') if collection is not None else "")
+            documents.append(",".join([document_key(key)] + referring.get(key, [])))
+
+    index = LexicalIndex.build(keys, texts, collections, documents)
+    index.save(path)
+    logger.info(f"Indice lessicale ricostruito: {len(index)} chunk, {len(index.terms)} termini, {len(index.doc_ids)} posting")
+    return index
+
+_lexical_index = None
+_lexical_index_mtime = None
+_lexical_index_lock = threading.Lock()
+
+def get_lexical_index(path=LEXICAL_INDEX_PATH):
+    """Indice lessicale condiviso, ricaricato se il file su disco è cambiato; None se non è ancora stato costruito."""
+    global _lexical_index, _lexical_index_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lexical_index_lock:
+        if mtime != _lexical_index_mtime:
+            _lexical_index = LexicalIndex.load(path)
+            _lexical_index_mtime = mtime
+            logger.info(f"Indice lessicale caricato: {len(_lexical_index)} chunk, {len(_lexical_index.terms)} termini")
+        return _lexical_index
@@ -0,0 +1,143 @@
+"""Cache semantica dei risultati di ricerca, indicizzata per embedding della query.
+
+Le stesse domande su RHEL e Windows Server tornano con formulazioni leggermente diverse: una
+query è servita dalla cache se un'altra query già risolta con gli stessi parametri (modalità, k,
+collezioni, instradamento) ha similarità coseno almeno `QUERY_CACHE_THRESHOLD`, evitando KNN,
+BM25 e fusione.
+
+La cache è in memoria nel processo: i vettori delle query occupano le righe di una matrice
+preallocata (una ricerca è un solo prodotto matrice-vettore), con eliminazione LRU oltre
+`QUERY_CACHE_ITEMS` voci e scadenza dopo `QUERY_CACHE_TTL` secondi. Ogni voce ricorda i documenti
+dei chunk restituiti; prima di ogni ricerca viene letto da Redis il registro delle modifiche
+(`chunk_store.document_changes_since`) e sono scartate le voci che usano documenti riscritti o
+eliminati dalla pipeline di chunking. I documenti nuovi non invalidano la cache: entrano nei
+risultati alla scadenza delle voci.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from time import time
+
+import numpy as np
+
+from chunk_store import document_changes_since, document_key
+from metrics import record_cache
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione della cache delle query
+QUERY_CACHE_ENABLED = os.getenv('QUERY_CACHE_ENABLED', 'true').lower() == 'true'
+QUERY_CACHE_THRESHOLD = float(os.getenv('QUERY_CACHE_THRESHOLD', 0.95))  # Similarità coseno minima per un hit
+QUERY_CACHE_ITEMS = int(os.getenv('QUERY_CACHE_ITEMS', 2000))  # Query in cache per processo
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', 3600))  # Secondi di validità di una voce
+
+class QueryCache:
+    """Risultati di ricerca per embedding della query, con soglia di similarità, LRU, TTL e invalidazione per documento."""
+
+    def __init__(self, max_items=QUERY_CACHE_ITEMS, ttl=QUERY_CACHE_TTL, threshold=QUERY_CACHE_THRESHOLD):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.threshold = threshold
+        self.vectors = None  # Matrice (max_items, dim) dei vettori normalizzati, allocata al primo inserimento
+        self.entries = {}  # Riga -> voce (parametri, risultati, documenti, istante di inserimento, secondi di calcolo)
+        self.lru = OrderedDict()  # Righe occupate, dalla meno usata di recente
+        self.free = list(range(max_items - 1, -1, -1))
+        self.version = None  # Ultima versione del registro delle modifiche letta
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.invalidated = 0
+        self.expired = 0
+        self.evicted = 0
+        self.saved_seconds = 0.0
+
+    def _remove(self, slot):
+        del self.entries[slot]
+        del self.lru[slot]
+        self.free.append(slot)
+
+    def sync(self, client):
+        """Scarto delle voci che usano documenti modificati dopo l'ultima lettura del registro."""
+        version, changed = document_changes_since(client, self.version)
+        with self.lock:
+            if changed is None:
+                self.invalidated += len(self.entries)
+                for slot in list(self.entries):
+                    self._remove(slot)
+            elif changed:
+                stale = [slot for slot, entry in self.entries.items() if entry["documents"] & changed]
+                self.invalidated += len(stale)
+                for slot in stale:
+                    self._remove(slot)
+            self.version = version
+
+    def lookup(self, client, query_vector, scope):
+        """Risultati della query in cache più simile con gli stessi parametri (`scope`), oppure None."""
+        self.sync(client)
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), np.finfo(np.float32).tiny)
+        with self.lock:
+            self.lookups += 1
+            now = time()
+            for slot in [slot for slot, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+                self._remove(slot)
+                self.expired += 1
+            slots = [slot for slot, entry in self.entries.items() if entry["scope"] == scope]
+            if not slots:
+                record_cache("query", misses=1)
+                return None
+            scores = self.vectors[slots] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                record_cache("query", misses=1)
+                return None
+            slot = slots[best]
+            entry = self.entries[slot]
+            self.lru.move_to_end(slot)
+            self.hits += 1
+            record_cache("query", hits=1)
+            self.saved_seconds += entry["seconds"]
+            return {"results": entry["results"], "similarity": float(scores[best]), "age": now - entry["created"]}
+
+    def store(self, query_vector, scope, results, seconds):
+        """Inserimento dei risultati di una query calcolati in `seconds` secondi (eliminando la voce meno usata se piena)."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), np.finfo(np.float32).tiny)
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_items, len(query)), dtype=np.float32)
+            if not self.free:
+                self._remove(next(iter(self.lru)))
+                self.evicted += 1
+            slot = self.free.pop()
+            self.vectors[slot] = query
+            self.entries[slot] = {
+                "scope": scope,
+                "results": results,
+                "documents": {document_key(result["key"]) for result in results},
+                "created": time(),
+                "seconds": seconds
+            }
+            self.lru[slot] = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "invalidated": self.invalidated,
+                "expired": self.expired,
+                "evicted": self.evicted
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"Cache delle query: {stats['hits']}/{stats['lookups']} hit ({stats['hit_rate']:.1%}), "
+                    f"{stats['saved_seconds']:.2f} secondi risparmiati, {stats['entries']} voci, "
+                    f"{stats['invalidated']} invalidate, {stats['expired']} scadute, {stats['evicted']} eliminate")
+
+query_cache = QueryCache()
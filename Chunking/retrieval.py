@@ -0,0 +1,99 @@
+"""Ricerca ibrida dei chunk: BM25 e KNN vettoriale eseguiti in parallelo e fusi con Reciprocal Rank Fusion.
+
+Ciascun retriever restituisce i primi `HYBRID_DEPTH` chunk; lo score fuso di un chunk è
+sum(1 / (RRF_K + rank)) sulle classifiche in cui compare (RRF_K = 60, come nella formulazione
+originale di Cormack et al.). La fusione usa solo i rank, quindi non serve calibrare gli score
+BM25 (non limitati) rispetto alle similarità coseno.
+
+Il BM25 usa l'indice lessicale su disco (`lexical_index`, default) oppure, con
+`LEXICAL_BACKEND='redisearch'`, il full-text di RediSearch sul campo `text` dei chunk.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from chunk_store import fetch_chunks, knn_search, text_search
+from lexical_index import get_lexical_index, tokenize
+from routing import ROUTING_ENABLED, route_query
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione della ricerca
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'hybrid')  # 'hybrid', 'vector' oppure 'lexical'
+LEXICAL_BACKEND = os.getenv('LEXICAL_BACKEND', 'local')  # 'local' (indice .npz) oppure 'redisearch'
+RRF_K = int(os.getenv('RRF_K', 60))  # Costante di smorzamento dei rank nella fusione
+HYBRID_DEPTH = int(os.getenv('HYBRID_DEPTH', 50))  # Risultati di ciascun retriever considerati nella fusione
+
+SEARCH_MODES = {"hybrid", "vector", "lexical"}
+
+# Thread per la ricerca lessicale, eseguita mentre il thread della richiesta codifica la query e interroga l'indice KNN
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('RETRIEVAL_WORKERS', 4)), thread_name_prefix="retrieval")
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fusione di classifiche di chiavi (dalla più rilevante): coppie (chiave, score RRF) in ordine decrescente."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def lexical_search(client, query, k=5, collections=None, documents=None, backend=LEXICAL_BACKEND):
+    """Primi `k` chunk per score BM25; lista vuota se l'indice lessicale non è ancora stato costruito."""
+    if backend == 'redisearch':
+        return text_search(client, tokenize(query), k, collections, documents=documents)
+    index = get_lexical_index()
+    if index is None:
+        logger.warning("Indice lessicale non disponibile: eseguire il chunking per costruirlo")
+        return []
+    return fetch_chunks(client, index.search(query, k, collections, documents))
+
+def vector_search(client, query, model, k=5, collections=None, ef_runtime=None, documents=None, query_vector=None):
+    """Primi `k` chunk per similarità coseno con l'embedding della query (calcolato qui se non fornito)."""
+    if query_vector is None:
+        query_vector = model.encode(query, convert_to_numpy=True)
+    return knn_search(client, query_vector, k, collections, ef_runtime=ef_runtime, documents=documents)
+
+def hybrid_search(client, query, model, k=5, collections=None, ef_runtime=None, depth=HYBRID_DEPTH, rrf_k=RRF_K,
+                  documents=None, query_vector=None):
+    """BM25 (in un thread del pool) e KNN (nel thread chiamante) in parallelo, fusi con RRF.
+
+    Ogni risultato riporta lo score RRF e i rank ottenuti nelle due classifiche (None se assente).
+    """
+    depth = max(depth, k)
+    lexical = _executor.submit(lexical_search, client, query, depth, collections, documents)
+    vector_hits = vector_search(client, query, model, depth, collections, ef_runtime, documents, query_vector)
+    lexical_hits = lexical.result()
+
+    chunks = {}
+    ranks = {}
+    for name, hits in (("vector", vector_hits), ("lexical", lexical_hits)):
+        for rank, hit in enumerate(hits, start=1):
+            chunks.setdefault(hit["key"], hit)
+            ranks.setdefault(hit["key"], {"vector": None, "lexical": None})[name] = rank
+
+    results = []
+    for key, score in reciprocal_rank_fusion([[hit["key"] for hit in vector_hits], [hit["key"] for hit in lexical_hits]], rrf_k)[:k]:
+        results.append(dict(chunks[key], score=score, ranks=ranks[key]))
+    return results
+
+def search_chunks(client, query, model, k=5, collections=None, ef_runtime=None, mode=SEARCH_MODE, routing=ROUTING_ENABLED,
+                  query_vector=None):
+    """Ricerca nella modalità indicata ('hybrid', 'vector' oppure 'lexical').
+
+    Con `routing` la query è prima instradata alle collezioni e ai documenti più vicini (vedi
+    `routing`) e la ricerca è limitata a questi; senza centroidi disponibili si cerca ovunque.
+    L'embedding della query, se già calcolato (ad es. per la cache delle query), evita una nuova codifica.
+    """
+    documents = None
+    if routing:
+        if query_vector is None:
+            query_vector = model.encode(query, convert_to_numpy=True)
+        documents = route_query(client, query_vector, collections=collections)["documents"] or None
+
+    if mode == 'vector':
+        return vector_search(client, query, model, k, collections, ef_runtime, documents, query_vector)
+    if mode == 'lexical':
+        return lexical_search(client, query, k, collections, documents)
+    if mode == 'hybrid':
+        return hybrid_search(client, query, model, k, collections, ef_runtime, documents=documents, query_vector=query_vector)
+    raise ValueError(f"Modalità di ricerca non supportata: {mode}")
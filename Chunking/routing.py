@@ -0,0 +1,180 @@
+"""Instradamento gerarchico delle query: scelta delle collezioni e dei documenti prima della ricerca KNN.
+
+Il router principale (RHEL 8, RHEL 9 o Windows Server) e i router secondari (tra le centinaia di
+documenti di una collezione) sono sostituiti da un prodotto matrice-vettore sui centroidi
+precalcolati, invece di una chiamata a un LLM per livello:
+- ogni documento ha un piccolo codebook k-means degli embeddings dei suoi chunk, calcolato dalla
+  pipeline di chunking e salvato nel suo hash (`chunk_store.document_centroids`); lo score di un
+  documento è la similarità coseno massima tra la query e i suoi centroidi;
+- il centroide di una collezione è la media pesata dei centroidi dei suoi documenti.
+
+I centroidi sono aggiornati in modo incrementale: i documenti nuovi o modificati portano i propri
+(nuova chiave di cache), quelli eliminati spariscono con il loro hash, e `RoutingIndex.refresh`
+legge da Redis solo gli hash dei documenti non ancora caricati.
+"""
+import logging
+import os
+import threading
+from time import time
+
+import numpy as np
+
+from chunk_store import (CACHE_KEY_PREFIX, EMBEDDING_DTYPE, REDIS_WRITE_BATCH_SIZE, document_centroids, load_chunks,
+                         serialize_embeddings)
+
+logger = logging.getLogger("Chunking")
+
+# Configurazione dell'instradamento
+ROUTING_ENABLED = os.getenv('ROUTING_ENABLED', 'false').lower() == 'true'  # Ricerca limitata ai documenti scelti dal router
+ROUTING_TOP_COLLECTIONS = int(os.getenv('ROUTING_TOP_COLLECTIONS', 1))  # Collezioni scelte per query
+ROUTING_TOP_DOCUMENTS = int(os.getenv('ROUTING_TOP_DOCUMENTS', 10))  # Documenti scelti per query nelle collezioni selezionate
+ROUTING_INDEX_TTL = float(os.getenv('ROUTING_INDEX_TTL', 60))  # Secondi tra due controlli dei documenti presenti in Redis
+
+def normalized(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), np.finfo(np.float32).tiny)
+
+def top_n(scores, n):
+    """Indici dei punteggi più alti (finiti) in ordine decrescente."""
+    n = min(n, int(np.isfinite(scores).sum()))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+class RoutingIndex:
+    """Centroidi delle collezioni e codebook dei documenti in memoria, interrogati con un solo prodotto matriciale."""
+
+    def __init__(self, ttl=ROUTING_INDEX_TTL):
+        self.ttl = ttl
+        self.checked_at = None
+        self.entries = {}  # Chiave del documento -> (collezione, sorgente, centroidi, numero di chunk per centroide)
+        self.lock = threading.Lock()
+        self.state = None  # Matrici costruite da `rebuild`, sostituite in blocco (lettura senza lock)
+
+    def add_document(self, key, collection, source, centroids, counts):
+        self.entries[key] = (collection, source, np.asarray(centroids, dtype=np.float32), np.asarray(counts, dtype=np.float32))
+
+    def remove_document(self, key):
+        self.entries.pop(key, None)
+
+    def rebuild(self):
+        """Matrice unica [centroidi delle collezioni; centroidi dei documenti] e indici di appartenenza delle righe."""
+        keys = sorted(self.entries)
+        collections = sorted({self.entries[key][0] for key in keys})
+        collection_index = {collection: i for i, collection in enumerate(collections)}
+        if not keys:
+            self.state = None
+            return
+
+        dim = self.entries[keys[0]][2].shape[1]
+        collection_sums = np.zeros((len(collections), dim), dtype=np.float32)
+        rows, row_documents = [], []
+        for i, key in enumerate(keys):
+            collection, _, centroids, counts = self.entries[key]
+            collection_sums[collection_index[collection]] += counts @ centroids # Somma dei vettori dei chunk
+            rows.append(centroids)
+            row_documents.extend([i] * len(centroids))
+
+        self.state = {
+            "matrix": normalized(np.concatenate([collection_sums, *rows])).astype(np.float32),
+            "collections": collections,
+            "keys": keys,
+            "sources": [self.entries[key][1] for key in keys],
+            "document_collections": np.array([collection_index[self.entries[key][0]] for key in keys], dtype=np.int32),
+            "row_documents": np.array(row_documents, dtype=np.int32)
+        }
+
+    def refresh(self, client, batch_size=REDIS_WRITE_BATCH_SIZE):
+        """Allineamento incrementale con Redis: caricamento dei soli documenti nuovi, rimozione di quelli eliminati."""
+        if self.checked_at is not None and time() - self.checked_at < self.ttl:
+            return
+        with self.lock:
+            if self.checked_at is not None and time() - self.checked_at < self.ttl:
+                return
+            current = {key.decode('utf-8') for key in client.scan_iter(match=f"{CACHE_KEY_PREFIX}:*", count=1000)}
+            removed = self.entries.keys() - current
+            added = sorted(current - self.entries.keys())
+            for key in removed:
+                self.remove_document(key)
+
+            loaded = 0
+            for i in range(0, len(added), batch_size):
+                batch = added[i:i + batch_size]
+                pipe = client.pipeline(transaction=False)
+                for key in batch:
+                    pipe.hmget(key, "dim", "collection", "source", "centroids", "centroid_counts")
+                for key, document in zip(batch, pipe.execute(raise_on_error=False)):
+                    if isinstance(document, Exception) or document[3] is None:
+                        continue # Documento senza centroidi (salvato prima dell'instradamento): vedi `update_document_centroids`
+                    dim, collection, source, centroids, counts = document
+                    self.add_document(key, collection.decode('utf-8'), source.decode('utf-8'),
+                                      np.frombuffer(centroids, dtype=EMBEDDING_DTYPE).reshape(-1, int(dim)),
+                                      np.frombuffer(counts, dtype='<u4'))
+                    loaded += 1
+
+            if removed or loaded:
+                self.rebuild()
+                logger.info(f"Indice di instradamento aggiornato: {loaded} documenti aggiunti, {len(removed)} rimossi, "
+                            f"{len(self.entries)} in totale")
+            self.checked_at = time()
+
+    def route(self, query_vector, top_collections=ROUTING_TOP_COLLECTIONS, top_documents=ROUTING_TOP_DOCUMENTS, collections=None):
+        """Collezioni e documenti più vicini alla query (score coseno), tra le collezioni indicate se presenti."""
+        state = self.state
+        if state is None:
+            return {"collections": [], "documents": []}
+
+        scores = state["matrix"] @ normalized(np.asarray(query_vector, dtype=np.float32))
+        n_collections = len(state["collections"])
+        collection_scores = scores[:n_collections].copy()
+        if collections:
+            collection_scores[[name not in collections for name in state["collections"]]] = -np.inf
+        chosen = top_n(collection_scores, top_collections)
+
+        # Score del documento: massimo sui suoi centroidi, solo nelle collezioni scelte
+        document_scores = np.full(len(state["keys"]), -np.inf, dtype=np.float32)
+        np.maximum.at(document_scores, state["row_documents"], scores[n_collections:])
+        document_scores[~np.isin(state["document_collections"], chosen)] = -np.inf
+
+        return {
+            "collections": [{"collection": state["collections"][i], "score": float(collection_scores[i])} for i in chosen],
+            "documents": [
+                {
+                    "key": state["keys"][i],
+                    "collection": state["collections"][state["document_collections"][i]],
+                    "source": state["sources"][i],
+                    "score": float(document_scores[i])
+                }
+                for i in top_n(document_scores, top_documents)
+            ]
+        }
+
+routing_index = RoutingIndex()
+
+def route_query(client, query_vector, top_collections=ROUTING_TOP_COLLECTIONS, top_documents=ROUTING_TOP_DOCUMENTS, collections=None):
+    """Instradamento della query con l'indice condiviso del processo, aggiornato da Redis se scaduto."""
+    routing_index.refresh(client)
+    return routing_index.route(query_vector, top_collections, top_documents, collections)
+
+def update_document_centroids(client, batch_size=REDIS_WRITE_BATCH_SIZE):
+    """Calcolo dei centroidi dei documenti salvati che ne sono privi (ad es. in cache da prima dell'instradamento)."""
+    cache_keys = [key.decode('utf-8') for key in client.scan_iter(match=f"{CACHE_KEY_PREFIX}:*", count=1000)]
+    missing = []
+    for i in range(0, len(cache_keys), batch_size):
+        batch = cache_keys[i:i + batch_size]
+        pipe = client.pipeline(transaction=False)
+        for cache_key in batch:
+            pipe.hexists(cache_key, "centroids")
+        missing.extend(cache_key for cache_key, exists in zip(batch, pipe.execute(raise_on_error=False)) if exists is False or exists == 0)
+
+    updated = 0
+    for cache_key in missing:
+        chunks = load_chunks(client, cache_key)
+        if not chunks:
+            continue
+        centroids, counts = document_centroids(np.stack([chunk["embedding"] for chunk in chunks]))
+        client.hset(cache_key, mapping={"centroids": serialize_embeddings(centroids), "centroid_counts": counts.astype('<u4').tobytes()})
+        updated += 1
+    if updated:
+        logger.info(f"Centroidi calcolati per {updated} documenti già salvati")
+    return updated
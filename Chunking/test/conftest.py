@@ -0,0 +1,12 @@
+"""Configurazione dei test del chunking: moduli della Function App importabili e Redis in memoria (fakeredis)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeStrictRedis()
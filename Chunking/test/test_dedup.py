@@ -0,0 +1,139 @@
+"""Deduplicazione dei chunk: classificazione dei duplicati esatti e quasi duplicati e loro salvataggio come riferimenti."""
+import numpy as np
+import pytest
+
+from chunk_store import BulkWriter, delete_documents, fetch_chunks, load_chunks
+from dedup import DedupIndex, exact_fingerprint, minhash_signature, normalize_text
+from lexical_index import build_lexical_index
+
+WORDS = [f"parola{i}" for i in range(200)]
+TEXT = " ".join(WORDS)
+NEAR_TEXT = " ".join(WORDS[:100] + ["diversa"] + WORDS[101:])  # Una parola su 200: 5 shingle diversi
+OTHER_TEXT = " ".join(f"altro{i}" for i in range(200))
+
+def chunk(text, pages=(1, 1)):
+    return {"text": text, "pages": pages}
+
+def test_exact_fingerprint_ignores_case_spacing_and_punctuation():
+    assert exact_fingerprint(normalize_text("Run `dnf update`,\n then  REBOOT.")) == exact_fingerprint(normalize_text("run dnf update then reboot"))
+    assert exact_fingerprint(normalize_text("run dnf update")) != exact_fingerprint(normalize_text("run dnf upgrade"))
+
+def test_minhash_similarity_tracks_jaccard():
+    signature = minhash_signature(normalize_text(TEXT))
+    assert np.mean(signature == minhash_signature(normalize_text(NEAR_TEXT))) >= 0.8
+    assert np.mean(signature == minhash_signature(normalize_text(OTHER_TEXT))) < 0.2
+    assert minhash_signature(["troppo", "corto"]) is None
+
+def test_assign_classifies_exact_and_near_duplicates():
+    index = DedupIndex(threshold=0.8)
+    references, fingerprints = index.assign("chunks:a", [chunk(TEXT), chunk(OTHER_TEXT)])
+    assert references == [None, None]
+    assert all(fingerprint is not None for fingerprint in fingerprints)
+    index.commit("chunks:a")
+
+    references, fingerprints = index.assign("chunks:b", [chunk(TEXT.upper() + "."), chunk(NEAR_TEXT), chunk("breve testo unico")])
+    assert references == ["chunk:a:0", "chunk:a:0", None]
+    assert fingerprints[:2] == [None, None]
+    assert index.stats == {"chunks": 5, "exact": 1, "near": 1}
+
+def test_short_chunks_are_only_exact_duplicates():
+    index = DedupIndex(threshold=0.8)
+    index.assign("chunks:a", [chunk("Note legali")])
+    index.commit("chunks:a")
+    references, _ = index.assign("chunks:b", [chunk("note legali"), chunk("Note legali aggiuntive")])
+    assert references == ["chunk:a:0", None]
+
+def test_vectors_are_bounded_copies():
+    index = DedupIndex(max_vectors=2)
+    embeddings = np.arange(12, dtype=np.float32).reshape(3, 4)
+    index.expand(None, "chunks:a", [chunk("x"), chunk("y"), chunk("z")], [None, None, None], embeddings, encode=None)
+    assert list(index.vectors) == ["chunk:a:1", "chunk:a:2"]
+    assert all(vector.base is None for vector in index.vectors.values())
+
+def write_documents(client, documents):
+    writer = BulkWriter(client, storage='float32')
+    index = DedupIndex(threshold=0.8)
+    index.load(client)
+    for cache_key, source, collection, chunks in documents:
+        references, fingerprints = index.assign(cache_key, chunks)
+        unique = [i for i, canonical in enumerate(references) if canonical is None]
+        embeddings = index.expand(client, cache_key, chunks, references, np.eye(len(chunks), 4, dtype=np.float32)[unique] + 1,
+                                  encode=None)
+        writer.add_document(cache_key, chunks, embeddings, source, collection, references, fingerprints)
+        writer.flush()
+        index.commit(cache_key)
+
+def test_canonicals_wait_for_the_write(client):
+    index = DedupIndex(threshold=0.8)
+    references, _ = index.assign("chunks:a", [chunk(TEXT), chunk(TEXT)])
+    assert references == [None, "chunk:a:0"] # Visibili al documento stesso
+    assert index.assign("chunks:b", [chunk(TEXT)])[0] == [None] # Non agli altri prima della scrittura
+    index.commit("chunks:b")
+    assert index.assign("chunks:c", [chunk(NEAR_TEXT)])[0] == ["chunk:b:0"]
+
+def test_failed_flush_discards_canonicals(client, monkeypatch):
+    writer = BulkWriter(client, storage='float32')
+    index = DedupIndex(threshold=0.8)
+    index.load(client)
+    references, fingerprints = index.assign("chunks:a", [chunk(TEXT)])
+    index.expand(client, "chunks:a", [chunk(TEXT)], references, np.ones((1, 4), dtype=np.float32), encode=None)
+    writer.add_document("chunks:a", [chunk(TEXT)], np.ones((1, 4), dtype=np.float32), "a.pdf", "RHEL8", references, fingerprints)
+    monkeypatch.setattr(client, "pipeline", lambda *args, **kwargs: (_ for _ in ()).throw(ConnectionError("Redis non raggiungibile")))
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    index.discard("chunks:a") # Come fa lo stadio di scrittura
+    monkeypatch.undo()
+    assert not index.exact and not index.signatures and not index.vectors
+
+    # Il duplicato diventa il nuovo canonico invece di un riferimento a un chunk mai scritto
+    write_documents(client, [("chunks:b", "b.pdf", "RHEL9", [chunk(TEXT)])])
+    assert load_chunks(client, "chunks:b")[0]["text"] == TEXT
+    assert client.hget("chunk:b:0", "ref") is None
+
+def test_references_keep_their_own_text(client, tmp_path):
+    write_documents(client, [
+        ("chunks:a", "rhel8.pdf", "RHEL8", [chunk(TEXT), chunk(OTHER_TEXT)]),
+        ("chunks:b", "rhel9.pdf", "RHEL9", [chunk(NEAR_TEXT, (3, 4))])
+    ])
+    canonical, near = load_chunks(client, "chunks:a")[0], load_chunks(client, "chunks:b")[0]
+    assert near["text"] == NEAR_TEXT and near["pages"] == (3, 4)
+    assert np.array_equal(near["embedding"], canonical["embedding"])
+
+    fetched = fetch_chunks(client, [("chunk:b:0", 0.5)])[0]
+    assert (fetched["key"], fetched["text"], fetched["source"], fetched["ref"]) == ("chunk:b:0", NEAR_TEXT, "rhel9.pdf", "chunk:a:0")
+
+    # Tag del canonico estesi al documento che lo referenzia, anche nell'indice lessicale
+    assert client.hmget("chunk:a:0", "source", "collection") == [b"rhel8.pdf,rhel9.pdf", b"RHEL8,RHEL9"]
+    lexical = build_lexical_index(client, path=str(tmp_path / "index.npz"))
+    assert [key for key, _ in lexical.search("parola7", documents=[{"key": "chunks:b"}])] == ["chunk:a:0"]
+    assert lexical.search("altro7", documents=[{"key": "chunks:b"}]) == []
+
+def test_tags_are_rewritten_only_when_they_change(client, monkeypatch):
+    write_documents(client, [("chunks:a", "rhel8.pdf", "RHEL8", [chunk(TEXT)])])
+    commands = []
+    original = client.pipeline
+    def recording_pipeline(*args, **kwargs):
+        pipe = original(*args, **kwargs)
+        hset = pipe.hset
+        pipe.hset = lambda key, *a, **k: (commands.append(key), hset(key, *a, **k))[1]
+        return pipe
+    monkeypatch.setattr(client, "pipeline", recording_pipeline)
+
+    write_documents(client, [("chunks:b", "rhel9.pdf", "RHEL9", [chunk(TEXT)])])
+    assert "chunk:a:0" in commands
+    commands.clear()
+    write_documents(client, [("chunks:c", "rhel9.pdf", "RHEL9", [chunk(TEXT)])]) # Stessa sorgente e collezione
+    assert "chunk:a:0" not in commands
+
+def test_deleting_references_restores_the_tags(client):
+    write_documents(client, [
+        ("chunks:a", "rhel8.pdf", "RHEL8", [chunk(TEXT)]),
+        ("chunks:b", "rhel9.pdf", "RHEL9", [chunk(TEXT)])
+    ])
+    delete_documents(client, ["chunks:b"])
+    assert client.hmget("chunk:a:0", "source", "collection") == [b"rhel8.pdf", b"RHEL8"]
+
+    write_documents(client, [("chunks:b", "rhel9.pdf", "RHEL9", [chunk(TEXT)])])
+    delete_documents(client, ["chunks:a"]) # Canonico mantenuto finché è referenziato
+    assert load_chunks(client, "chunks:b")[0]["text"] == TEXT
+    assert client.hmget("chunk:a:0", "source", "collection") == [b"rhel9.pdf", b"RHEL9"]
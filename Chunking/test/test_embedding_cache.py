@@ -0,0 +1,20 @@
+"""Cache degli embeddings: i vettori in memoria sono copie indipendenti dai batch codificati."""
+import numpy as np
+
+from embedding_cache import CachedEncoder
+
+class FakeModel:
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def encode(self, texts, **kwargs):
+        return np.arange(len(texts) * 4, dtype=np.float32).reshape(len(texts), 4)
+
+def test_memory_keeps_copies(tmp_path):
+    encoder = CachedEncoder(FakeModel(), "fake", path=str(tmp_path / "embeddings.sqlite"))
+    embeddings = encoder.encode(["uno", "due"])
+    assert all(vector.base is None for vector in encoder.memory.values())
+
+    embeddings[:] = 0 # Il chiamante può riutilizzare il risultato senza alterare la cache
+    assert np.array_equal(encoder.encode(["due"]), [[4, 5, 6, 7]])
+    assert encoder.memory_hits == 1
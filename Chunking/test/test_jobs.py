@@ -0,0 +1,57 @@
+"""Job di chunking: lease, checkpoint per documento e ripresa dai documenti senza checkpoint."""
+from jobs import (checkpoint, claim_job, create_job, finish_run, job_status, pending_documents, release_job, resumable_jobs,
+                  set_documents)
+
+DOCUMENTATION = [
+    ("Red Hat 8", [("a.pdf", "chunks:a"), ("b.pdf", "chunks:b")]),
+    ("Windows Server", [("c.pdf", "chunks:c")])
+]
+
+def test_lease_is_exclusive(client):
+    job_id = create_job(client, DOCUMENTATION)
+    assert claim_job(client, job_id, "primo")
+    assert not claim_job(client, job_id, "secondo")
+
+    release_job(client, job_id, "secondo") # Non è il proprietario: il lease resta
+    assert not claim_job(client, job_id, "secondo")
+
+    release_job(client, job_id, "primo")
+    assert claim_job(client, job_id, "secondo")
+
+def test_checkpoint_is_recorded_once(client):
+    job_id = create_job(client, DOCUMENTATION)
+    checkpoint(client, job_id, "chunks:a", "processed", 10)
+    checkpoint(client, job_id, "chunks:a", "processed", 10) # Ripetuto dopo una ripresa
+    checkpoint(client, job_id, "chunks:c", "cached")
+
+    status = job_status(client, job_id)
+    assert (status["processed"], status["cached"], status["failed"], status["chunks"]) == (1, 1, 0, 10)
+    assert status["done"] == 2 and status["total"] == 3
+
+def test_resume_from_pending_documents(client):
+    job_id = create_job(client, DOCUMENTATION)
+    assert claim_job(client, job_id, "primo")
+    checkpoint(client, job_id, "chunks:a", "processed", 4, owner="primo")
+    assert resumable_jobs(client) == [] # In esecuzione
+
+    # Processo interrotto (lease scaduto): il job torna tra quelli da riprendere, dai documenti senza checkpoint
+    client.delete(f"job:{job_id}:lease")
+    assert resumable_jobs(client) == [job_id]
+    assert pending_documents(client, job_id) == [("Red Hat 8", [("b.pdf", "chunks:b")]), ("Windows Server", [("c.pdf", "chunks:c")])]
+
+    for cache_key in ("chunks:b", "chunks:c"):
+        checkpoint(client, job_id, cache_key, "processed", 4)
+    finish_run(client, job_id, 1.0, "completed")
+    assert pending_documents(client, job_id) == []
+    assert resumable_jobs(client) == []
+    assert job_status(client, job_id)["progress"] == 1.0
+
+def test_documents_resolved_by_first_run(client):
+    job_id = create_job(client)
+    assert pending_documents(client, job_id) is None
+    assert job_status(client, job_id)["progress"] == 0.0
+    assert resumable_jobs(client) == [job_id] # Anche un job accodato senza documenti viene ripreso dal timer
+
+    set_documents(client, job_id, DOCUMENTATION)
+    assert pending_documents(client, job_id) == DOCUMENTATION
+    assert job_status(client, job_id)["total"] == 3
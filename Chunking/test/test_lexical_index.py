@@ -0,0 +1,75 @@
+"""Indice lessicale BM25: tokenizzazione, posting CSR, ranking, filtri e ricostruzione da Redis."""
+import numpy as np
+
+from chunk_store import BulkWriter, delete_documents
+from lexical_index import LexicalIndex, build_lexical_index, tokenize
+
+def chunk(text, pages=(1, 1)):
+    return {"text": text, "pages": pages}
+
+def write_document(client, cache_key, texts, collection):
+    writer = BulkWriter(client, storage='float32')
+    writer.add_document(cache_key, [chunk(text) for text in texts], np.ones((len(texts), 4), dtype=np.float32),
+                        f"{cache_key[len('chunks:'):]}.pdf", collection)
+    writer.flush()
+
+def sample_index():
+    return LexicalIndex.build(
+        ["chunk:a:0", "chunk:a:1", "chunk:b:0"],
+        ["dnf update dnf upgrade", "systemctl restart sshd", "dnf install httpd e poi riavvio del servizio httpd"],
+        ["RHEL8", "RHEL8", "RHEL9"]
+    )
+
+def test_tokenize_keeps_technical_tokens():
+    assert tokenize("Modificare /etc/ssh/SSHD_CONFIG e Get-ChildItem (KB5005575)") == [
+        "modificare", "etc", "ssh", "sshd_config", "sshd", "config", "e", "get-childitem", "get", "childitem", "kb5005575"]
+    assert tokenize("versione 8.4 " + "a" * 65) == ["versione", "8.4", "8", "4"]
+
+def test_build_stores_postings_by_term():
+    index = sample_index()
+    start, end = index.offsets[index.vocabulary["dnf"]], index.offsets[index.vocabulary["dnf"] + 1]
+    assert index.doc_ids[start:end].tolist() == [0, 2]
+    assert index.term_freqs[start:end].tolist() == [2, 1]
+    assert index.offsets[-1] == len(index.doc_ids) == len(index.term_freqs)
+    assert index.doc_lengths.tolist() == [4, 3, 9]
+    assert index.documents == ["chunks:a", "chunks:b"]
+
+def test_bm25_ranks_term_frequency_and_rarity():
+    index = sample_index()
+    assert [key for key, _ in index.search("dnf")] == ["chunk:a:0", "chunk:b:0"]
+    assert [key for key, _ in index.search("dnf httpd")] == ["chunk:b:0", "chunk:a:0"]
+    assert index.search("yum") == []
+    assert len(index.search("dnf sshd httpd", k=2)) == 2
+
+def test_search_filters_by_collection_and_document():
+    index = LexicalIndex.build(["chunk:a:0", "chunk:b:0", "chunk:c:0"], ["dnf update"] * 3, ["RHEL8,RHEL9", "RHEL9", "WindowsServer"],
+                               ["chunks:a,chunks:b", "chunks:b", "chunks:c"])
+    assert {key for key, _ in index.search("dnf", collections=["RHEL8"])} == {"chunk:a:0"}
+    assert {key for key, _ in index.search("dnf", collections=["RHEL9"])} == {"chunk:a:0", "chunk:b:0"}
+    assert {key for key, _ in index.search("dnf", documents=[{"key": "chunks:b"}])} == {"chunk:a:0", "chunk:b:0"}
+    assert {key for key, _ in index.search("dnf", documents=[{"key": "chunks:c"}])} == {"chunk:c:0"}
+
+def test_save_and_load_round_trip(tmp_path):
+    index = sample_index()
+    index.save(str(tmp_path / "index.npz"))
+    loaded = LexicalIndex.load(str(tmp_path / "index.npz"))
+    assert loaded.terms == index.terms and loaded.keys == index.keys and loaded.documents == index.documents
+    assert loaded.search("dnf httpd") == index.search("dnf httpd")
+
+def test_rebuild_follows_added_and_deleted_documents(client, tmp_path):
+    path = str(tmp_path / "index.npz")
+    write_document(client, "chunks:a", ["dnf update", "systemctl restart sshd"], "RHEL8")
+    client.hset("chunks:parziale", "collection", "RHEL8") # Documento senza `count`: scrittura non completata
+    index = build_lexical_index(client, path)
+    assert sorted(index.keys) == ["chunk:a:0", "chunk:a:1"]
+    assert index.search("httpd") == []
+
+    write_document(client, "chunks:b", ["dnf install httpd"], "RHEL9")
+    index = build_lexical_index(client, path)
+    assert [key for key, _ in index.search("httpd")] == ["chunk:b:0"]
+    assert [key for key, _ in index.search("dnf", collections=["RHEL8"])] == ["chunk:a:0"]
+
+    delete_documents(client, ["chunks:a"])
+    index = build_lexical_index(client, path)
+    assert index.keys == ["chunk:b:0"]
+    assert [key for key, _ in LexicalIndex.load(path).search("dnf")] == ["chunk:b:0"]
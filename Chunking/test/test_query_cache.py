@@ -0,0 +1,70 @@
+"""Cache delle query: hit per similarità, scadenza (TTL), eliminazione LRU e invalidazione per documento."""
+import numpy as np
+import pytest
+
+import query_cache as query_cache_module
+from chunk_store import record_document_changes
+from query_cache import QueryCache
+
+SCOPE = ("hybrid", 5, None, None)
+RESULTS = [{"key": "chunk:a:0", "text": "..."}, {"key": "chunk:b:3", "text": "..."}]
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache_module, "time", lambda: now[0])
+    return now
+
+def test_similar_query_hits_and_scope_must_match(client):
+    cache = QueryCache(max_items=4, threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], SCOPE, RESULTS, seconds=0.2)
+
+    hit = cache.lookup(client, [0.99, 0.05, 0.0], SCOPE)
+    assert hit is not None and hit["results"] == RESULTS and hit["similarity"] >= 0.95
+    assert cache.lookup(client, [0.0, 1.0, 0.0], SCOPE) is None # Query diversa
+    assert cache.lookup(client, [1.0, 0.0, 0.0], ("vector",) + SCOPE[1:]) is None # Stessa query, altri parametri
+    assert cache.stats()["hits"] == 1 and cache.stats()["saved_seconds"] == pytest.approx(0.2)
+
+def test_entries_expire_after_ttl(client, clock):
+    cache = QueryCache(max_items=4, ttl=60)
+    cache.store([1.0, 0.0], SCOPE, RESULTS, seconds=0.1)
+
+    clock[0] += 59
+    assert cache.lookup(client, [1.0, 0.0], SCOPE)["age"] == pytest.approx(59)
+    clock[0] += 2
+    assert cache.lookup(client, [1.0, 0.0], SCOPE) is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted(client):
+    cache = QueryCache(max_items=2)
+    cache.store([1.0, 0.0, 0.0], SCOPE, RESULTS, seconds=0.1)
+    cache.store([0.0, 1.0, 0.0], SCOPE, RESULTS, seconds=0.1)
+    assert cache.lookup(client, [1.0, 0.0, 0.0], SCOPE) is not None # La prima voce diventa la più recente
+    cache.store([0.0, 0.0, 1.0], SCOPE, RESULTS, seconds=0.1)
+
+    assert cache.lookup(client, [0.0, 1.0, 0.0], SCOPE) is None
+    assert cache.lookup(client, [1.0, 0.0, 0.0], SCOPE) is not None
+    assert cache.stats()["evicted"] == 1
+
+def test_rewritten_documents_invalidate_their_entries(client):
+    cache = QueryCache(max_items=4)
+    cache.lookup(client, [1.0, 0.0, 0.0], SCOPE) # Prima lettura del registro delle modifiche
+    cache.store([1.0, 0.0, 0.0], SCOPE, RESULTS, seconds=0.1)
+    cache.store([0.0, 1.0, 0.0], SCOPE, [{"key": "chunk:c:0", "text": "..."}], seconds=0.1)
+
+    record_document_changes(client, ["chunks:b"])
+    assert cache.lookup(client, [1.0, 0.0, 0.0], SCOPE) is None # Usa un chunk di chunks:b
+    assert cache.lookup(client, [0.0, 1.0, 0.0], SCOPE) is not None
+    assert cache.stats()["invalidated"] == 1
+
+def test_unknown_changes_clear_the_cache(client):
+    cache = QueryCache(max_items=4)
+    for cache_key in ("chunks:x", "chunks:y"):
+        record_document_changes(client, [cache_key])
+    cache.lookup(client, np.array([1.0, 0.0]), SCOPE)
+    cache.store([1.0, 0.0], SCOPE, RESULTS, seconds=0.1)
+
+    client.flushdb() # Registro azzerato: non si può sapere quali documenti siano cambiati
+    record_document_changes(client, ["chunks:z"])
+    assert cache.lookup(client, [1.0, 0.0], SCOPE) is None
+    assert cache.stats()["invalidated"] == 1
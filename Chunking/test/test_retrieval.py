@@ -0,0 +1,77 @@
+"""Ricerca ibrida: fusione delle classifiche (Reciprocal Rank Fusion) e ricerca su Redis in memoria."""
+import numpy as np
+import pytest
+
+import retrieval
+from chunk_store import BulkWriter, fetch_chunks
+from lexical_index import build_lexical_index
+from retrieval import hybrid_search, reciprocal_rank_fusion
+
+def test_scores_are_summed_over_rankings():
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60))
+    assert fused["a"] == pytest.approx(1 / 61)
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["d"] == pytest.approx(1 / 62)
+
+def test_keys_in_both_rankings_come_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "x", "y"]], k=60)
+    assert [key for key, _ in fused][:1] == ["c"]
+    assert [score for _, score in fused] == sorted((score for _, score in fused), reverse=True)
+
+def test_k_dampens_the_rank():
+    # Con k piccolo il primo posto di una sola classifica prevale sul terzo posto in entrambe; con k = 60 no
+    rankings = [["a", "x", "b"], ["c", "y", "b"]]
+    assert reciprocal_rank_fusion(rankings, k=0)[0][0] in ("a", "c")
+    assert reciprocal_rank_fusion(rankings, k=60)[0][0] == "b"
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+
+@pytest.fixture
+def search_client(client, tmp_path, monkeypatch):
+    """Chunk su fakeredis, indice lessicale costruito da Redis e KNN simulato (fakeredis non ha RediSearch); con le chiamate al KNN."""
+    writer = BulkWriter(client, storage='float32')
+    for cache_key, texts, collection in (
+        ("chunks:a", ["aggiornare i pacchetti con dnf update", "riavviare sshd con systemctl"], "RHEL8"),
+        ("chunks:b", ["installare httpd con dnf install", "configurare il firewall"], "RHEL9"),
+    ):
+        writer.add_document(cache_key, [{"text": text, "pages": (1, 1)} for text in texts], np.ones((len(texts), 4), dtype=np.float32),
+                            f"{cache_key}.pdf", collection)
+    writer.flush()
+    index = build_lexical_index(client, str(tmp_path / "index.npz"))
+    monkeypatch.setattr(retrieval, "get_lexical_index", lambda: index)
+
+    calls = []
+    def knn_search(client, query_vector, k=5, collections=None, ef_runtime=None, documents=None):
+        calls.append({"k": k, "collections": collections, "documents": documents})
+        ranking = ["chunk:b:1", "chunk:a:0", "chunk:a:1", "chunk:b:0"]
+        return fetch_chunks(client, [(key, 1.0 - i / 10) for i, key in enumerate(ranking[:k])])
+    monkeypatch.setattr(retrieval, "knn_search", knn_search)
+    return client, calls
+
+def test_hybrid_search_fuses_both_retrievers(search_client):
+    search_client, _ = search_client
+    results = hybrid_search(search_client, "dnf update", None, k=3, query_vector=np.ones(4, dtype=np.float32), rrf_k=60)
+    assert [result["key"] for result in results] == ["chunk:a:0", "chunk:b:0", "chunk:b:1"]
+    assert results[0]["ranks"] == {"vector": 2, "lexical": 1}
+    assert results[2]["ranks"] == {"vector": 1, "lexical": None}
+    assert results[0]["text"] == "aggiornare i pacchetti con dnf update" and results[0]["source"] == "chunks:a.pdf"
+    assert results[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+
+def test_hybrid_search_applies_filters_to_both_retrievers(search_client):
+    search_client, knn_calls = search_client
+    results = hybrid_search(search_client, "dnf", None, k=5, collections=["RHEL9"], query_vector=np.ones(4, dtype=np.float32), depth=10)
+    assert knn_calls == [{"k": 10, "collections": ["RHEL9"], "documents": None}]
+    assert [result["key"] for result in results if result["ranks"]["lexical"] is not None] == ["chunk:b:0"]
+
+    results = hybrid_search(search_client, "dnf", None, k=5, documents=[{"key": "chunks:a"}], query_vector=np.ones(4, dtype=np.float32))
+    assert knn_calls[-1]["documents"] == [{"key": "chunks:a"}]
+    assert [result["key"] for result in results if result["ranks"]["lexical"] is not None] == ["chunk:a:0"]
+
+def test_hybrid_search_without_lexical_index(search_client, monkeypatch):
+    search_client, _ = search_client
+    monkeypatch.setattr(retrieval, "get_lexical_index", lambda: None)
+    results = hybrid_search(search_client, "dnf", None, k=2, query_vector=np.ones(4, dtype=np.float32))
+    assert [result["key"] for result in results] == ["chunk:b:1", "chunk:a:0"]
+    assert all(result["ranks"]["lexical"] is None for result in results)
@@ -0,0 +1,34 @@
+"""Unità di testo: finestre di frasi con passo configurabile, senza perdere le frasi finali."""
+import logging
+
+import numpy as np
+import pytest
+
+function_app = pytest.importorskip("function_app")
+TextUnits = function_app.TextUnits
+
+def sentences(count):
+    return [(i, f"Frase {i}.", 1 + i // 2) for i in range(count)]
+
+def test_units_slide_over_sentences():
+    units = TextUnits.from_sentences(sentences(5), unit_size=3, stride=1)
+    assert units[:] == ["Frase 0. Frase 1. Frase 2.", "Frase 1. Frase 2. Frase 3.", "Frase 2. Frase 3. Frase 4."]
+    assert units.span_text(0, len(units)) == "Frase 0. Frase 1. Frase 2. Frase 3. Frase 4."
+
+def test_stride_keeps_the_tail():
+    units = TextUnits.from_sentences(sentences(8), unit_size=3, stride=2)
+    assert units.unit_starts.tolist() == [0, 2, 4, 5]
+    assert units[-1] == "Frase 5. Frase 6. Frase 7."
+    assert units.span_pages(len(units) - 1, len(units)) == (3, 4)
+
+def test_short_documents_get_one_unit():
+    units = TextUnits.from_sentences(sentences(2), unit_size=3, stride=2)
+    assert units[:] == ["Frase 0. Frase 1."]
+    assert units.unit_lengths().tolist() == [len("Frase 0. Frase 1.")]
+    assert len(TextUnits.from_sentences([], unit_size=3, stride=2)) == 0
+
+def test_single_unit_is_one_chunk():
+    units = TextUnits.from_sentences(sentences(2), unit_size=3, stride=1)
+    distances = function_app.calculate_distance(np.ones((len(units), 4), dtype=np.float32))
+    chunks = function_app.create_chunks_based_on_distances(units, distances, "breve.pdf", logging.getLogger("test"))
+    assert [(chunk["text"], chunk["units"], chunk["pages"]) for chunk in chunks] == [("Frase 0. Frase 1.", (0, 1), (1, 1))]
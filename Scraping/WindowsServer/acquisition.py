@@ -0,0 +1,250 @@
+"""Acquisizione concorrente dei documenti elencati nel registro delle sorgenti (`sources.json`).
+
+Ogni sorgente del registro indica nome, collezione, cartella di output, file dei checksum, regola di
+suddivisione ("articles" per i PDF di Microsoft Learn da dividere in articoli, "none" per i PDF
+salvati così come sono) e la lista dei documenti (URL e nome del file locale).
+
+Tutti i documenti sono scaricati con un unico `httpx.AsyncClient` (pool di connessioni condiviso),
+con un limite di richieste contemporanee per host, nuovi tentativi con attesa esponenziale sugli
+errori transitori e un budget di tempo complessivo, scaduto il quale i download ancora in corso
+vengono annullati (i file `.part` restano per la ripresa successiva). I download sono condizionali
+(ETag / Last-Modified), in streaming e con l'SHA-256 calcolato durante la scrittura.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import httpx
+
+from metrics import observe_stage, record_cache, record_error, record_items
+
+logger = logging.getLogger("PDFExtractor")
+
+# Configurazione del download
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 1024 * 1024))  # Byte letti e scritti per volta (memoria costante)
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', 60))  # Timeout (secondi) di connessione e lettura
+
+# Configurazione dell'acquisizione concorrente
+SOURCES_FILE = os.getenv('SOURCES_FILE', 'sources.json')  # Registro delle sorgenti
+ACQUISITION_MAX_CONNECTIONS = int(os.getenv('ACQUISITION_MAX_CONNECTIONS', 32))  # Connessioni del pool condiviso
+ACQUISITION_PER_HOST = int(os.getenv('ACQUISITION_PER_HOST', 4))  # Download contemporanei per host
+ACQUISITION_MAX_RETRIES = int(os.getenv('ACQUISITION_MAX_RETRIES', 3))  # Tentativi aggiuntivi su errori transitori
+ACQUISITION_RETRY_BACKOFF = float(os.getenv('ACQUISITION_RETRY_BACKOFF', 1.0))  # Attesa iniziale (secondi), raddoppiata a ogni tentativo
+ACQUISITION_BUDGET = float(os.getenv('ACQUISITION_BUDGET', 540))  # Tempo massimo (secondi) dell'intera acquisizione
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}  # Risposte per cui ripetere la richiesta
+
+SPLIT_RULES = {"articles", "none"}
+
+def load_sources(sources_file: str = SOURCES_FILE) -> list:
+    """Lettura e validazione del registro delle sorgenti; i percorsi relativi sono risolti rispetto al registro."""
+    with open(sources_file, "r", encoding="utf-8") as f:
+        sources = json.load(f)["sources"]
+
+    base_directory = os.path.dirname(os.path.abspath(sources_file))
+    for source in sources:
+        missing = {"name", "output_directory", "checksum_file", "documents"} - source.keys()
+        if missing:
+            raise ValueError(f"Sorgente {source.get('name', '?')}: campi mancanti {', '.join(sorted(missing))}")
+        source.setdefault("split", "none")
+        if source["split"] not in SPLIT_RULES:
+            raise ValueError(f"Sorgente {source['name']}: regola di suddivisione sconosciuta '{source['split']}'")
+        if source["split"] == "articles" and (len(source["documents"]) != 1 or "diff_file" not in source):
+            raise ValueError(f"Sorgente {source['name']}: la suddivisione in articoli richiede un solo documento e 'diff_file'")
+        for field in ("output_directory", "checksum_file", "diff_file", "download_directory"):
+            if field in source:
+                source[field] = os.path.join(base_directory, source[field])
+        source.setdefault("download_directory", base_directory if source["split"] == "articles" else source["output_directory"])
+    return sources
+
+def load_partial_download(part_file: str) -> tuple:
+    """Byte già scaricati, hash SHA-256 parziale e validatore (ETag o Last-Modified) di un download interrotto."""
+    meta_file = part_file + ".json"
+    if not (os.path.exists(part_file) and os.path.exists(meta_file)):
+        return 0, hashlib.sha256(), None
+    try:
+        with open(meta_file, "r") as f:
+            validator = json.load(f).get("validator")
+    except (OSError, json.JSONDecodeError):
+        validator = None
+    if not validator:
+        return 0, hashlib.sha256(), None
+
+    # Ricalcolo dell'hash sui byte già presenti, a blocchi
+    sha256_hash = hashlib.sha256()
+    size = 0
+    with open(part_file, "rb") as f:
+        for byte_block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            sha256_hash.update(byte_block)
+            size += len(byte_block)
+    return size, sha256_hash, validator
+
+def conditional_headers(etag: str, last_modified: str, offset: int, validator: str) -> dict:
+    """Intestazioni della richiesta: condizionale sui validatori salvati e, se c'è un download parziale, Range/If-Range.
+
+    Il contenuto è richiesto senza compressione: httpx decomprime `gzip` in lettura, per cui i byte
+    scritti non corrisponderebbero a Content-Length né agli offset dei Range, calcolati sul file sul server.
+    """
+    headers = {"Accept-Encoding": "identity"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    return headers
+
+def write_block(f, sha256_hash, byte_block: bytes):
+    """Scrittura di un blocco nel file parziale e aggiornamento dell'hash (eseguita fuori dall'event loop)."""
+    f.write(byte_block)
+    sha256_hash.update(byte_block)
+
+async def download_document(client: httpx.AsyncClient, url: str, output_file: str, etag: str = None, last_modified: str = None,
+                            resume: bool = True) -> dict:
+    """Download condizionale e riprendibile di un documento, in streaming su `<output_file>.part`.
+
+    Con `etag`/`last_modified` la richiesta è condizionale (304 se il documento non è cambiato). Se
+    un download precedente si è interrotto, riprende dalla stessa posizione con una richiesta Range
+    (If-Range sul validatore del file parziale, così un documento cambiato viene riscaricato per
+    intero); se il server rifiuta l'intervallo (416) il file parziale è scartato e il documento
+    riscaricato per intero una sola volta (`resume` False). Scrittura e hash dei blocchi avvengono
+    in un thread, per non bloccare gli altri download.
+
+    Restituisce lo stato ("not_modified" oppure "downloaded"), i byte ricevuti e, se scaricato,
+    checksum, ETag e Last-Modified.
+    """
+    part_file = output_file + ".part"
+    meta_file = part_file + ".json"
+    if resume:
+        offset, sha256_hash, validator = await asyncio.to_thread(load_partial_download, part_file)
+    else:
+        offset, sha256_hash, validator = 0, hashlib.sha256(), None
+
+    async with client.stream("GET", url, headers=conditional_headers(etag, last_modified, offset, validator)) as response:
+        if response.status_code == 304:
+            return {"status": "not_modified", "bytes": 0}
+
+        # Intervallo non valido (file parziale non coerente con il documento): nuovo download completo, a risposta chiusa
+        range_rejected = response.status_code == 416 and offset > 0
+        if not range_rejected:
+            response.raise_for_status()  # Solleva un'eccezione se la richiesta non ha successo
+
+            if response.status_code == 206:
+                mode = "ab"
+            else:
+                offset, sha256_hash, mode = 0, hashlib.sha256(), "wb"
+
+            new_etag = response.headers.get("ETag")
+            new_last_modified = response.headers.get("Last-Modified")
+            with open(meta_file, "w") as f:
+                json.dump({"validator": new_etag or new_last_modified}, f)
+
+            expected_size = response.headers.get("Content-Length")
+            received = 0
+            with open(part_file, mode) as f:
+                async for byte_block in response.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(write_block, f, sha256_hash, byte_block)
+                    received += len(byte_block)
+
+            # Content-Length conta i byte trasferiti, non quelli decompressi
+            if expected_size is not None and response.num_bytes_downloaded != int(expected_size):
+                raise httpx.ReadError(f"Ricevuti {received} byte su {expected_size}", request=response.request)
+
+    if range_rejected:
+        for path in (part_file, meta_file):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        return await download_document(client, url, output_file, etag, last_modified, resume=False)
+
+    os.replace(part_file, output_file)
+    os.remove(meta_file)
+    return {"status": "downloaded", "bytes": received, "checksum": sha256_hash.hexdigest(),
+            "etag": new_etag, "last_modified": new_last_modified}
+
+def is_transient(error: Exception) -> bool:
+    """Errori per cui ha senso ripetere la richiesta: di rete/timeout o risposte 429 e 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+async def fetch_with_retries(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, document: dict, deadline: float,
+                             max_retries: int = ACQUISITION_MAX_RETRIES, backoff: float = ACQUISITION_RETRY_BACKOFF) -> dict:
+    """Download di un documento nel limite di concorrenza del suo host, con nuovi tentativi entro la scadenza."""
+    collection = document.get("collection", "")
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
+                start = perf_counter()
+                result = await download_document(client, document["url"], document["path"], document.get("etag"), document.get("last_modified"))
+                observe_stage("download", perf_counter() - start, collection)
+                record_cache("http", hits=int(result["status"] == "not_modified"), misses=int(result["status"] == "downloaded"))
+                record_items("bytes", result["bytes"], collection)
+                return result
+        except httpx.HTTPError as e:
+            delay = backoff * 2 ** attempt
+            if attempt == max_retries or not is_transient(e) or perf_counter() + delay >= deadline:
+                record_error("download", collection)
+                raise
+            logger.warning(f"Errore nel download di {document['url']}, nuovo tentativo tra {delay} secondi: {e}")
+            await asyncio.sleep(delay)
+
+async def fetch_documents(documents: list, per_host: int = ACQUISITION_PER_HOST, max_connections: int = ACQUISITION_MAX_CONNECTIONS,
+                          budget: float = ACQUISITION_BUDGET, max_retries: int = ACQUISITION_MAX_RETRIES,
+                          backoff: float = ACQUISITION_RETRY_BACKOFF) -> dict:
+    """Download concorrente di una lista di documenti (`url`, `path`, validatori opzionali).
+
+    Restituisce l'esito di ciascun documento (nello stesso ordine) e le statistiche complessive.
+    """
+    start_time = perf_counter()
+    if not documents:
+        return {"results": [], "stats": {"documents": 0, "downloaded": 0, "not_modified": 0, "failed": 0, "bytes": 0,
+                                         "seconds": 0.0, "bytes_per_second": 0.0, "documents_per_second": 0.0}}
+    deadline = start_time + budget
+    semaphores = {}
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+    async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT, limits=limits, follow_redirects=True) as client:
+        tasks = []
+        for document in documents:
+            host = urlsplit(document["url"]).netloc
+            semaphore = semaphores.setdefault(host, asyncio.Semaphore(per_host))
+            tasks.append(asyncio.create_task(fetch_with_retries(client, semaphore, document, deadline, max_retries, backoff)))
+
+        _, pending = await asyncio.wait(tasks, timeout=budget)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for document, task in zip(documents, tasks):
+        if task.cancelled():
+            logger.error(f"Budget di tempo esaurito durante il download di {document['url']}")
+            results.append({"status": "timeout", "bytes": 0})
+        elif task.exception() is not None:
+            logger.error(f"Errore durante il download di {document['url']}: {task.exception()}")
+            results.append({"status": "failed", "bytes": 0, "error": str(task.exception())})
+        else:
+            results.append(task.result())
+
+    elapsed = perf_counter() - start_time
+    total_bytes = sum(result["bytes"] for result in results)
+    completed = sum(1 for result in results if result["status"] in ("downloaded", "not_modified"))
+    stats = {
+        "documents": len(documents),
+        "downloaded": sum(1 for result in results if result["status"] == "downloaded"),
+        "not_modified": sum(1 for result in results if result["status"] == "not_modified"),
+        "failed": len(documents) - completed,
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "bytes_per_second": total_bytes / elapsed if elapsed else 0.0,
+        "documents_per_second": completed / elapsed if elapsed else 0.0
+    }
+    logger.info(f"Acquisizione: {stats['downloaded']} scaricati, {stats['not_modified']} invariati, {stats['failed']} falliti, "
+                f"{total_bytes} byte in {elapsed:.2f} secondi ({stats['bytes_per_second'] / 2**20:.2f} MiB/s, "
+                f"{stats['documents_per_second']:.2f} documenti/s)")
+    return {"results": results, "stats": stats}
@@ -0,0 +1,134 @@
+"""Server HTTP locale di prova e benchmark dell'acquisizione concorrente (`acquisition.fetch_documents`).
+
+Il server espone i PDF di una cartella (di default `documentsWinServer`) con ETag, Last-Modified,
+risposte 304 alle richieste condizionali e Range/If-Range; può simulare latenza e errori 503
+transitori. Il benchmark scarica tutti i PDF in una cartella temporanea due volte: la prima a
+freddo, la seconda con i validatori ottenuti (tutte risposte 304), riportando byte/s e documenti/s.
+
+Utilizzo (dalla cartella Scraping/WindowsServer):
+    python -m benchmarks.acquisition --latency 0.05 --fail-rate 0.1 --per-host 4
+    python -m benchmarks.acquisition --serve --port 8765   # solo server, ad es. per un registro di prova
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+
+from acquisition import fetch_documents
+
+class StubHandler(BaseHTTPRequestHandler):
+    """GET dei file della cartella servita, con richieste condizionali e a intervalli."""
+    directory = "."
+    latency = 0.0
+    fail_rate = 0.0
+    validators = {}  # Nome del file -> (ETag, Last-Modified)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        sleep(self.latency)
+        name = os.path.basename(self.path.split("?")[0])
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        if random.random() < self.fail_rate:
+            self.send_error(503)
+            return
+
+        etag, last_modified = self.validators[name]
+        if self.headers.get("If-None-Match") == etag or (not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since") == last_modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        size = os.path.getsize(path)
+        start = 0
+        requested_range = self.headers.get("Range")
+        if requested_range and self.headers.get("If-Range") in (etag, last_modified):
+            start = int(requested_range.split("=")[1].split("-")[0])
+            if start >= size:
+                self.send_error(416)
+                return
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(size - start))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            while block := f.read(1024 * 1024):
+                self.wfile.write(block)
+
+def start_server(directory, port, latency, fail_rate):
+    """Avvio del server in un thread; ETag e Last-Modified sono calcolati una volta per file."""
+    validators = {}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                validators[name] = (f'"{hashlib.sha256(f.read()).hexdigest()[:16]}"', formatdate(os.path.getmtime(path), usegmt=True))
+    handler = type("Handler", (StubHandler,), {"directory": directory, "latency": latency, "fail_rate": fail_rate, "validators": validators})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--directory", default="documentsWinServer", help="Cartella dei PDF da servire")
+    parser.add_argument("--port", type=int, default=0, help="Porta del server (0 = libera)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latenza simulata per richiesta (secondi)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Frazione di richieste con risposta 503")
+    parser.add_argument("--per-host", type=int, default=4, help="Download contemporanei per host")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.1)
+    parser.add_argument("--budget", type=float, default=120.0, help="Budget di tempo complessivo (secondi)")
+    parser.add_argument("--serve", action="store_true", help="Avvia solo il server")
+    parser.add_argument("--json", action="store_true", help="Output in formato JSON")
+    args = parser.parse_args()
+
+    server = start_server(args.directory, args.port, args.latency, args.fail_rate)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.serve:
+        print(f"Server in ascolto su {base_url} (Ctrl+C per terminare)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    names = sorted(name for name in os.listdir(args.directory) if name.endswith(".pdf"))
+    with tempfile.TemporaryDirectory() as output_directory:
+        documents = [{"url": f"{base_url}/{name}", "path": os.path.join(output_directory, name)} for name in names]
+        options = {"per_host": args.per_host, "max_retries": args.retries, "backoff": args.backoff, "budget": args.budget}
+
+        cold = asyncio.run(fetch_documents(documents, **options))
+        for document, result in zip(documents, cold["results"]):
+            document["etag"] = result.get("etag")
+            document["last_modified"] = result.get("last_modified")
+        conditional = asyncio.run(fetch_documents(documents, **options))
+    server.shutdown()
+
+    results = [dict(cold["stats"], run="cold"), dict(conditional["stats"], run="conditional")]
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f"{'run':>12} {'doc':>5} {'scaricati':>9} {'304':>5} {'falliti':>7} {'MiB':>8} {'secondi':>8} {'MiB/s':>8} {'doc/s':>8}")
+    for r in results:
+        print(f"{r['run']:>12} {r['documents']:>5} {r['downloaded']:>9} {r['not_modified']:>5} {r['failed']:>7} "
+              f"{r['bytes'] / 2**20:>8.2f} {r['seconds']:>8.2f} {r['bytes_per_second'] / 2**20:>8.2f} {r['documents_per_second']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
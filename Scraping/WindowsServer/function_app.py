@@ -5,8 +5,19 @@ import re  # Espressioni regolari
 import os  # Gestione delle cartelle
 import hashlib  # Per calcolare SHA-256
 import json  # Per creare il file JSON
-import httpx  # Per scaricare il PDF da un URL
+import asyncio  # Per l'acquisizione concorrente delle sorgenti
+from concurrent.futures import ProcessPoolExecutor  # Per scrivere gli articoli in parallelo
 from datetime import datetime  # Per ottenere il timestamp
+from time import perf_counter  # Per il tempo di risposta delle route
+from acquisition import fetch_documents, load_sources
+from metrics import CONTENT_TYPE, ErrorCounter, log_summary, observe_request, push, record_cache, record_items, registry, timed
+
+# Configurazione della suddivisione in articoli
+SPLIT_WORKERS = int(os.getenv('SPLIT_WORKERS', os.cpu_count() or 1))  # Processi che scrivono gli articoli
+ARTICLE_PATTERN = re.compile(r"Article\s+•\s+\d{1,2}/\d{1,2}/\d{4}")  # "Article •" seguito da una data
+ARTICLE_PREFIX = "Windows_Server_"  # Prefisso dei file degli articoli
+COLLECTION = "WindowsServer"  # Collezione dei documenti nelle metriche (come nel chunking)
+MAX_SLUG_LENGTH = 80  # Lunghezza massima dello slug nel nome del file
 
 # Configurazione del logger di Windows Server
 def configure_logger():
@@ -33,6 +44,7 @@ def configure_logger():
         logger.addHandler(info_handler)
         logger.addHandler(error_handler)
         logger.addHandler(console_handler)
+        logger.addHandler(ErrorCounter())  # Conteggio degli errori nelle metriche
 
     return logger
 
@@ -41,59 +53,233 @@ app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 # Inizializzazione del logger
 logger = configure_logger()
 
-def calculate_sha256(file_path: str) -> str:
-    """Calcola l'hash SHA-256 di un file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(65536), b""):  # Blocchi più grandi per file grandi
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+def article_bytes(doc: fitz.Document, start_page: int, end_page: int) -> bytes:
+    """Contenuto di un nuovo PDF con le pagine [start_page, end_page), copiate con un unico inserimento.
 
-def download_pdf(url: str, output_file: str):
-    """Scarica il PDF da un URL e lo salva localmente."""
-    try:
-        # Utilizzo di httpx per scaricare il PDF
-        with httpx.Client() as client:
-            response = client.get(url)
-            response.raise_for_status()  # Solleva un'eccezione se la richiesta non ha successo
-
-            with open(output_file, 'wb') as f:
-                f.write(response.content)
-        
-    except httpx.RequestError as e:
-        logger.error(f"Errore durante il download del PDF: {e}")
-        raise
-
-def save_pages_to_new_pdf(doc: fitz.Document, start_page: int, end_page: int, output_pdf: str):
-    """Salva un intervallo di pagine da un documento PDF esistente in un nuovo PDF."""
+    Senza un nuovo identificativo del file il contenuto è deterministico, quindi il checksum
+    cambia solo se cambiano le pagine dell'articolo.
+    """
+    new_doc = fitz.open()
     try:
-        new_doc = fitz.open()
-
-        for page_num in range(start_page, end_page):
-            new_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-        
-        new_doc.save(output_pdf)
-    except fitz.FitzError as e:
-        logger.error(f"Errore di Fitz nel salvataggio del nuovo PDF: {e}")
-    except Exception as e:
-        logger.error(f"Errore nel salvare le pagine nel nuovo PDF: {e}")
+        new_doc.insert_pdf(doc, from_page=start_page, to_page=end_page - 1)
+        return new_doc.tobytes(garbage=3, deflate=True, no_new_id=True)
     finally:
-        if 'new_doc' in locals():
-            new_doc.close()
+        new_doc.close()
 
-def load_previous_checksum(json_file: str, pdf_document: str) -> str:
-    """Carica il checksum precedente dal file JSON, se esiste."""
+def load_previous_document(json_file: str, pdf_document: str) -> dict:
+    """Carica la voce del documento (checksum, ETag, Last-Modified) dal file JSON, se esiste."""
     if os.path.exists(json_file):
         try:
             with open(json_file, "r") as f:
                 data = json.load(f)
                 for document in data["documents"]:
                     if document["file_name"] == os.path.basename(pdf_document):
-                        return document["checksum"]
+                        return document
         except (json.JSONDecodeError, KeyError) as e:
             logger.error(f"Errore nel caricamento del checksum precedente: {e}")
     return None
 
+def upsert_document(json_file: str, entry: dict):
+    """Aggiunge o aggiorna (unendo i campi) la voce di un documento nel file JSON, lasciando invariato il resto."""
+    data = {"total_documents": 0, "documents": []}
+    if os.path.exists(json_file):
+        with open(json_file, "r") as f:
+            data = json.load(f)
+    for document in data["documents"]:
+        if document["file_name"] == entry["file_name"]:
+            document.update(entry)
+            break
+    else:
+        data["documents"].append(entry)
+    data["total_documents"] = len(data["documents"])
+    with open(json_file, "w") as f:
+        json.dump(data, f, indent=4)
+
+def update_validators(json_file: str, pdf_document: str, etag: str, last_modified: str):
+    """Aggiorna ETag e Last-Modified del documento nel file JSON, lasciando invariato il resto."""
+    upsert_document(json_file, {"file_name": os.path.basename(pdf_document), "etag": etag, "last_modified": last_modified})
+
+def slugify(title: str) -> str:
+    """Identificativo stabile di un articolo a partire dal titolo (minuscolo, solo lettere, cifre e trattini)."""
+    slug = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+    return slug[:MAX_SLUG_LENGTH].rstrip("-") or "article"
+
+def find_articles_from_toc(doc: fitz.Document) -> list:
+    """Inizio degli articoli dal sommario (outline) del PDF: coppie (titolo, pagina iniziale, base 0).
+
+    Le voci di sezione puntano alla pagina del loro primo articolo: a parità di pagina vale
+    l'ultima voce, cioè la più interna.
+    """
+    starts = {}
+    for _, title, page in doc.get_toc(simple=True):
+        if 1 <= page <= doc.page_count and title.strip():
+            starts[page - 1] = title.strip()
+    return sorted(((title, page) for page, title in starts.items()), key=lambda article: article[1])
+
+def find_articles_from_text(doc: fitz.Document) -> list:
+    """Inizio degli articoli dal testo (riga "Article • data"), in un'unica passata sulle pagine.
+
+    Il titolo è formato dalle righe con il carattere più grande che precedono la data (anche
+    se va a capo), escludendo così il banner iniziale del PDF.
+    """
+    articles = []
+    for page_num in range(doc.page_count):
+        try:
+            blocks = doc.load_page(page_num).get_text("dict")["blocks"]
+        except Exception as e:
+            logger.error(f"Errore nel caricare la pagina {page_num + 1}: {e}")
+            continue
+        lines = [(max(span["size"] for span in line["spans"]), "".join(span["text"] for span in line["spans"]).strip())
+                 for block in blocks for line in block.get("lines", []) if line["spans"]]
+        for i, (_, text) in enumerate(lines):
+            if ARTICLE_PATTERN.search(text):
+                heading = [line for line in lines[:i] if line[1]]
+                size = max((line[0] for line in heading), default=0)
+                title = " ".join(text for line_size, text in heading if line_size == size)
+                articles.append((title or f"article-{page_num + 1}", page_num))
+                break
+    return articles
+
+def find_articles(doc: fitz.Document) -> list:
+    """Articoli del PDF con titolo, slug univoco e intervallo di pagine [start, end) (sommario, altrimenti testo)."""
+    starts = find_articles_from_toc(doc)
+    if starts:
+        logger.info(f"Trovati {len(starts)} articoli nel sommario del PDF")
+    else:
+        starts = find_articles_from_text(doc)
+        logger.info(f"Sommario assente: trovati {len(starts)} articoli nel testo del PDF")
+
+    articles = []
+    seen = {}
+    for i, (title, start_page) in enumerate(starts):
+        slug = slugify(title)
+        seen[slug] = seen.get(slug, 0) + 1
+        if seen[slug] > 1:
+            slug = f"{slug}-{seen[slug]}"  # Titoli ripetuti: suffisso in ordine di apparizione
+        end_page = starts[i + 1][1] if i + 1 < len(starts) else doc.page_count
+        articles.append({
+            "title": title,
+            "file_name": f"{ARTICLE_PREFIX}{slug}.pdf",
+            "start": start_page,
+            "end": end_page
+        })
+    return articles
+
+def write_articles(pdf_document: str, output_directory: str, articles: list, previous_checksums: dict) -> list:
+    """Scrittura di un gruppo di articoli (eseguita in un processo separato): il PDF sorgente è aperto una volta.
+
+    Un articolo viene riscritto solo se il suo checksum è cambiato o il file non esiste.
+    Restituisce, per ogni articolo, il nome del file e il checksum.
+    """
+    results = []
+    doc = fitz.open(pdf_document)
+    try:
+        for article in articles:
+            content = article_bytes(doc, article["start"], article["end"])
+            checksum = hashlib.sha256(content).hexdigest()
+            output_pdf = os.path.join(output_directory, article["file_name"])
+            if checksum != previous_checksums.get(article["file_name"]) or not os.path.exists(output_pdf):
+                with open(output_pdf, "wb") as f:
+                    f.write(content)
+            results.append((article["file_name"], checksum))
+    finally:
+        doc.close()
+    return results
+
+def split_articles(pdf_document: str, output_directory: str, articles: list, previous_checksums: dict) -> dict:
+    """Scrittura in parallelo degli articoli, a gruppi alternati per processo; restituisce i checksum per file."""
+    workers = max(1, min(SPLIT_WORKERS, len(articles)))
+    groups = [articles[i::workers] for i in range(workers)]
+    checksums = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_articles, pdf_document, output_directory, group, previous_checksums) for group in groups if group]
+        for future in futures:
+            checksums.update(future.result())
+    return checksums
+
+def diff_articles(previous_checksums: dict, current_checksums: dict) -> dict:
+    """Articoli aggiunti, modificati e rimossi rispetto all'esecuzione precedente."""
+    return {
+        "added": sorted(name for name in current_checksums if name not in previous_checksums),
+        "changed": sorted(name for name, checksum in current_checksums.items()
+                          if name in previous_checksums and previous_checksums[name] != checksum),
+        "removed": sorted(name for name in previous_checksums if name not in current_checksums),
+        "unchanged": sum(1 for name, checksum in current_checksums.items() if previous_checksums.get(name) == checksum)
+    }
+
+def update_articles(pdf_document: str, output_directory: str, json_output_file: str, diff_output_file: str,
+                    current_checksum: str, etag: str, last_modified: str, collection: str = COLLECTION) -> tuple:
+    """Suddivisione del PDF in articoli, eliminazione di quelli rimossi e scrittura del file JSON e del manifest delle differenze.
+
+    Restituisce le differenze rispetto all'esecuzione precedente e il numero di articoli.
+    """
+    # Checksum e timestamp degli articoli dell'esecuzione precedente
+    previous_documents = {}
+    if os.path.exists(json_output_file):
+        try:
+            with open(json_output_file, "r") as f:
+                previous_documents = {d["file_name"]: d for d in json.load(f)["documents"] if d["file_name"] != os.path.basename(pdf_document)}
+        except (json.JSONDecodeError, KeyError) as e:
+            logger.error(f"Errore nel caricamento del checksum precedente: {e}")
+    previous_checksums = {name: d.get("checksum") for name, d in previous_documents.items()}
+
+    with timed("find_articles", collection):
+        try:
+            doc = fitz.open(pdf_document)
+            articles = find_articles(doc)
+        finally:
+            if 'doc' in locals():
+                doc.close()
+
+    # Copia di ciascun articolo con un unico inserimento di pagine, in parallelo
+    with timed("split", collection):
+        current_checksums = split_articles(pdf_document, output_directory, articles, previous_checksums)
+    diff = diff_articles(previous_checksums, current_checksums)
+    record_items("articles", len(articles), collection)
+    record_cache("articles", hits=diff["unchanged"], misses=len(diff["added"]) + len(diff["changed"]))
+
+    # Eliminazione degli articoli non più presenti
+    for file_name in diff["removed"]:
+        removed_pdf = os.path.join(output_directory, file_name)
+        if os.path.exists(removed_pdf):
+            os.remove(removed_pdf)
+
+    # Dati per il file JSON
+    timestamp = get_current_timestamp()
+    json_data = {
+        "total_documents": 0,
+        "documents": [{
+            "file_name": os.path.basename(pdf_document),
+            "checksum": current_checksum,
+            "timestamp": timestamp,
+            "etag": etag,
+            "last_modified": last_modified
+        }]
+    }
+    for article in articles:
+        checksum = current_checksums[article["file_name"]]
+        previous = previous_documents.get(article["file_name"], {})
+        json_data["documents"].append({
+            "file_name": article["file_name"],
+            "title": article["title"],
+            "pages": [article["start"] + 1, article["end"]],
+            "checksum": checksum,
+            "timestamp": previous.get("timestamp", timestamp) if previous.get("checksum") == checksum else timestamp
+        })
+
+    # Aggiornamento del conteggio totale dei documenti
+    json_data["total_documents"] = len(json_data["documents"])
+
+    # Scrittura del file JSON e del manifest delle differenze nella cartella di root
+    with open(json_output_file, "w") as json_file:
+        json.dump(json_data, json_file, indent=4)
+    with open(diff_output_file, "w") as diff_file:
+        json.dump(dict(diff, timestamp=timestamp), diff_file, indent=4)
+
+    logger.info(f"Articoli di {os.path.basename(pdf_document)}: {len(diff['added'])} aggiunti, {len(diff['changed'])} modificati, "
+                f"{len(diff['removed'])} rimossi, {diff['unchanged']} invariati")
+    return diff, len(articles)
+
 def get_current_timestamp() -> str:
     """Ritorna il timestamp corrente in formato ISO 8601."""
     return datetime.now().isoformat()
@@ -101,28 +287,58 @@ def get_current_timestamp() -> str:
 @app.route(route="http_trigger_windows_server")
 def http_trigger_windows_server(req: func.HttpRequest) -> func.HttpResponse:
     """Funzione trigger HTTP per elaborare il PDF."""
+    start_time = perf_counter()
+    try:
+        return process_windows_server()
+    finally:
+        observe_request("windows_server", perf_counter() - start_time)
+        log_summary(logger)
+        push("scraping")
+
+def process_windows_server() -> func.HttpResponse:
+    """Download condizionale del PDF di Windows Server e suddivisione in articoli se è cambiato."""
     logger.info('Inizio dell\'estrazione del testo da un PDF e suddivisione in parti basate su "Article" e data...')
     
     # URL del PDF da scaricare
     pdf_url = "https://learn.microsoft.com/pdf?url=https%3A%2F%2Flearn.microsoft.com%2Fen-us%2Fwindows-server%2Fget-started%2Ftoc.json"
     pdf_document = "windows-server-get-started.pdf"  # Nome del file locale in cui salvare il PDF scaricato
     json_output_file = "checksum_pdfWindowsServer.json"  # Salva nella root
+    diff_output_file = "diff_pdfWindowsServer.json"  # Articoli aggiunti, modificati e rimossi nell'ultima esecuzione
     output_directory = "documentsWinServer"
     
     os.makedirs(output_directory, exist_ok=True)
 
-    # Caricamento del checksum precedente
-    previous_checksum = load_previous_checksum(json_output_file, pdf_document)
-
-    # Download del PDF dal link
-    download_pdf(pdf_url, pdf_document)
-
-    # Calcolo del checksum del PDF scaricato
-    current_checksum = calculate_sha256(pdf_document)
+    # Caricamento del checksum precedente e dei validatori HTTP (ETag, Last-Modified)
+    previous_document = load_previous_document(json_output_file, pdf_document) or {}
+    previous_checksum = previous_document.get("checksum")
+
+    # Download condizionale del PDF dal link (304 se non è cambiato), con checksum calcolato durante lo streaming
+    outcome = asyncio.run(fetch_documents([{
+        "url": pdf_url,
+        "path": pdf_document,
+        "etag": previous_document.get("etag"),
+        "last_modified": previous_document.get("last_modified"),
+        "collection": COLLECTION
+    }]))
+    result = outcome["results"][0]
+    if result["status"] not in ("downloaded", "not_modified"):
+        return func.HttpResponse(
+            json.dumps({"error": result.get("error", "Budget di tempo esaurito durante il download del PDF")}),
+            status_code=500,
+            mimetype="application/json"
+        )
+    if result["status"] == "not_modified":
+        logger.info("Il PDF non è cambiato (304 Not Modified). Nessun aggiornamento necessario.")
+        return func.HttpResponse(
+            "Il file PDF non è cambiato. Nessun aggiornamento eseguito.",
+            status_code=200
+        )
+    current_checksum, etag, last_modified = result["checksum"], result["etag"], result["last_modified"]
 
     # Controllo del checksum
     if previous_checksum == current_checksum:
         logger.info("Il PDF non è cambiato. Nessun aggiornamento necessario.")
+        update_validators(json_output_file, pdf_document, etag, last_modified)  # Le prossime richieste saranno condizionali
         return func.HttpResponse(
             "Il file PDF non è cambiato. Nessun aggiornamento eseguito.",
             status_code=200
@@ -130,87 +346,88 @@ def http_trigger_windows_server(req: func.HttpRequest) -> func.HttpResponse:
     else:
         logger.info("Il checksum del PDF è cambiato. Aggiornamento necessario.")
 
-    output_files = []
-    start_page = None
-    current_page = 0
+    diff, total_articles = update_articles(pdf_document, output_directory, json_output_file, diff_output_file,
+                                           current_checksum, etag, last_modified)
+    logger.info('Fine dell\'estrazione del testo da un PDF e suddivisione in parti basate su "Article" e data...')
+    
+    return func.HttpResponse(
+        json.dumps(dict(diff, total_articles=total_articles, checksum_file=json_output_file, diff_file=diff_output_file), indent=4),
+        status_code=200,
+        mimetype="application/json"
+    )
 
+@app.route(route="http_trigger_acquisition")
+def http_trigger_acquisition(req: func.HttpRequest) -> func.HttpResponse:
+    """Acquisizione concorrente di tutte le sorgenti del registro e aggiornamento dei documenti cambiati."""
+    start_time = perf_counter()
     try:
-        doc = fitz.open(pdf_document)
-        num_pages = doc.page_count
-
-        # Regex per trovare "Article •" seguito da una data
-        date_pattern = re.compile(r"Article\s+•\s+\d{1,2}/\d{1,2}/\d{4}")
-
-        # Dati per il file JSON
-        json_data = {
-            "total_documents": 0,
-            "documents": []
-        }
-
-        json_data["documents"].append({
-            "file_name": os.path.basename(pdf_document),
-            "checksum": current_checksum,
-            "timestamp": get_current_timestamp()
-        })
+        return acquire_sources()
+    finally:
+        observe_request("acquisition", perf_counter() - start_time)
+        log_summary(logger)
+        push("scraping")
 
-        while current_page < num_pages:
-            try:
-                page = doc.load_page(current_page)
-                text = page.get_text()
-
-                if date_pattern.search(text):
-                    if start_page is None:
-                        start_page = current_page
-                    else:
-                        output_pdf = os.path.join(output_directory, f"Windows_Server_{len(output_files) + 1}.pdf")
-                        save_pages_to_new_pdf(doc, start_page, current_page, output_pdf)
-                        output_files.append(output_pdf)
-
-                        # Calcolo del checksum per il nuovo PDF
-                        pdf_checksum = calculate_sha256(output_pdf)
-                        json_data["documents"].append({
-                            "file_name": os.path.basename(output_pdf),
-                            "checksum": pdf_checksum,
-                            "timestamp": get_current_timestamp()
-                        })
-                        
-                        start_page = current_page
-
-            except fitz.FitzError as e:
-                logger.error(f"Errore di Fitz nel caricare la pagina {current_page + 1}: {e}")
-            except Exception as e:
-                logger.error(f"Errore sconosciuto nella pagina {current_page + 1}: {e}")
-
-            current_page += 1
-
-        # Salvataggio delle pagine rimanenti, se necessario
-        if start_page is not None:
-            output_pdf = os.path.join(output_directory, f"Windows_Server_{len(output_files) + 1}.pdf")
-            save_pages_to_new_pdf(doc, start_page, num_pages, output_pdf)
-            output_files.append(output_pdf)
-
-            # Calcolo del checksum per l'ultimo PDF
-            pdf_checksum = calculate_sha256(output_pdf)
-            json_data["documents"].append({
-                "file_name": os.path.basename(output_pdf),
-                "checksum": pdf_checksum,
-                "timestamp": get_current_timestamp()
+def acquire_sources() -> func.HttpResponse:
+    """Download delle sorgenti del registro e aggiornamento dei checksum e degli articoli."""
+    try:
+        sources = load_sources()
+    except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+        logger.error(f"Errore nella lettura del registro delle sorgenti: {e}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
+
+    # Richieste di download con i validatori e i checksum dell'esecuzione precedente
+    requests = []
+    for source in sources:
+        os.makedirs(source["output_directory"], exist_ok=True)
+        os.makedirs(source["download_directory"], exist_ok=True)
+        for document in source["documents"]:
+            path = os.path.join(source["download_directory"], document["file_name"])
+            previous = load_previous_document(source["checksum_file"], path) or {}
+            requests.append((source, {
+                "url": document["url"],
+                "path": path,
+                "etag": previous.get("etag"),
+                "last_modified": previous.get("last_modified"),
+                "checksum": previous.get("checksum"),
+                "collection": source.get("collection", source["name"])
+            }))
+
+    outcome = asyncio.run(fetch_documents([request for _, request in requests]))
+
+    report = {source["name"]: {"not_modified": [], "unchanged": [], "updated": [], "failed": []} for source in sources}
+    for (source, request), result in zip(requests, outcome["results"]):
+        file_name = os.path.basename(request["path"])
+        source_report = report[source["name"]]
+        if result["status"] == "not_modified":
+            source_report["not_modified"].append(file_name)
+        elif result["status"] != "downloaded":
+            source_report["failed"].append(file_name)
+        elif result["checksum"] == request["checksum"]:
+            update_validators(source["checksum_file"], request["path"], result["etag"], result["last_modified"])
+            source_report["unchanged"].append(file_name)
+        elif source["split"] == "articles":
+            diff, total_articles = update_articles(request["path"], source["output_directory"], source["checksum_file"],
+                                                   source["diff_file"], result["checksum"], result["etag"], result["last_modified"],
+                                                   request["collection"])
+            source_report["updated"].append(dict(diff, file_name=file_name, total_articles=total_articles))
+        else:
+            upsert_document(source["checksum_file"], {
+                "file_name": file_name,
+                "checksum": result["checksum"],
+                "timestamp": get_current_timestamp(),
+                "etag": result["etag"],
+                "last_modified": result["last_modified"]
             })
+            source_report["updated"].append({"file_name": file_name})
 
-        # Aggiornamento del conteggio totale dei documenti
-        json_data["total_documents"] = len(json_data["documents"])
-
-        # Scrittura del file JSON nella cartella di root
-        with open(json_output_file, "w") as json_file:
-            json.dump(json_data, json_file, indent=4)
-        
-    finally:
-        if 'doc' in locals():
-            doc.close()
-
-    logger.info('Fine dell\'estrazione del testo da un PDF e suddivisione in parti basate su "Article" e data...')
-    
+    status_code = 200 if outcome["stats"]["failed"] == 0 else 207
     return func.HttpResponse(
-        f"Creati {len(output_files)} file PDF: {', '.join([os.path.basename(f) for f in output_files])}. File JSON creato: {json_output_file}",
-        status_code=200
+        json.dumps({"sources": report, "stats": outcome["stats"]}, indent=4),
+        status_code=status_code,
+        mimetype="application/json"
     )
+
+@app.route(route="http_trigger_metrics")
+def http_trigger_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """Metriche di questo processo (tempi di download e suddivisione, cache HTTP, errori) nel formato testuale di Prometheus."""
+    return func.HttpResponse(registry.render(), status_code=200, headers={"Content-Type": CONTENT_TYPE})
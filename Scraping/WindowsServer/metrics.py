@@ -0,0 +1,205 @@
+"""Strumentazione leggera della Function App di scraping: contatori e istogrammi in memoria esportati nel formato di Prometheus.
+
+Metriche (prefisso `METRICS_NAMESPACE`, stessi nomi ed etichette di quelle del chunking):
+- `stage_duration_seconds{stage, collection}`: durata degli stadi (download, find_articles, split),
+  con `stage_errors_total` per gli errori;
+- `items_total{kind, collection}`: articoli e byte scaricati;
+- `cache_requests_total{cache, result}`: hit e miss dei download condizionali (http) e degli
+  articoli invariati (articles);
+- `request_duration_seconds{route}`: tempo di risposta delle route HTTP;
+- `log_errors_total{logger}`: record di log di livello ERROR (oltre a `error.log`).
+
+Le metriche sono esposte dalla route `http_trigger_metrics` (lette da Prometheus o dal receiver
+`prometheus` di un OpenTelemetry Collector) e inviate a fine run a un Pushgateway se
+`METRICS_PUSHGATEWAY_URL` è impostato. I valori sono per processo worker di Azure Functions.
+
+È un sottoinsieme di `Chunking/metrics.py` (le due Function App sono distribuite separatamente):
+senza le metriche per documento, i round-trip Redis e lo scambio dei campioni tra processi.
+"""
+import logging
+import os
+import threading
+import urllib.request
+from contextlib import contextmanager
+from time import perf_counter
+
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'metis')
+METRICS_PUSHGATEWAY_URL = os.getenv('METRICS_PUSHGATEWAY_URL')  # Es. http://pushgateway:9091 (vuoto = nessun invio)
+
+# Limiti superiori (secondi) dei bucket degli istogrammi: dalle route più rapide ai PDF più lunghi
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Contatore monotono con etichette."""
+
+    kind = "counter"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = {}  # Valori delle etichette -> totale
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return dict(self.values)
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}")
+        return lines
+
+class Histogram:
+    """Istogramma cumulativo con etichette (conteggi per bucket, somma e numero di osservazioni)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # Valori delle etichette -> [conteggi per bucket (non cumulativi), somma, numero]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            counts, total, count = self.values.get(key) or [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[index] += 1
+            self.values[key] = [counts, total + value, count + 1]
+
+    def samples(self):
+        with self.lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self.values.items()}
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self.samples().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {repr(float(total))}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {count}")
+        return lines
+
+class Registry:
+    """Insieme delle metriche del processo, con esportazione testuale."""
+
+    def __init__(self, namespace=METRICS_NAMESPACE):
+        self.namespace = namespace
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, description, label_names, **kwargs):
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self.lock:
+            if full_name not in self.metrics:
+                self.metrics[full_name] = cls(full_name, description, label_names, **kwargs)
+            return self.metrics[full_name]
+
+    def counter(self, name, description, label_names=()):
+        return self._register(Counter, name, description, label_names)
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, description, label_names, buckets=buckets)
+
+    def render(self):
+        """Tutte le metriche nel formato testuale di esposizione di Prometheus (0.0.4)."""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("stage_duration_seconds", "Durata degli stadi di elaborazione", ("stage", "collection"))
+STAGE_ERRORS = registry.counter("stage_errors_total", "Errori per stadio di elaborazione", ("stage", "collection"))
+ITEMS = registry.counter("items_total", "Elementi elaborati (articoli, byte)", ("kind", "collection"))
+CACHE_REQUESTS = registry.counter("cache_requests_total", "Accessi alle cache per esito", ("cache", "result"))
+REQUEST_SECONDS = registry.histogram("request_duration_seconds", "Tempo di risposta delle route HTTP", ("route",))
+LOG_ERRORS = registry.counter("log_errors_total", "Record di log di livello ERROR", ("logger",))
+
+@contextmanager
+def timed(stage, collection=""):
+    """Durata di un blocco come stadio (l'errore eventuale è contato e rilanciato)."""
+    start = perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage, collection=collection)
+        raise
+    finally:
+        STAGE_SECONDS.observe(perf_counter() - start, stage=stage, collection=collection)
+
+def observe_stage(stage, seconds, collection=""):
+    STAGE_SECONDS.observe(seconds, stage=stage, collection=collection)
+
+def record_error(stage, collection=""):
+    STAGE_ERRORS.inc(stage=stage, collection=collection)
+
+def record_items(kind, count, collection=""):
+    ITEMS.inc(count, kind=kind, collection=collection)
+
+def record_cache(cache, hits=0, misses=0):
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result="miss")
+
+def observe_request(route, seconds):
+    REQUEST_SECONDS.observe(seconds, route=route)
+
+class ErrorCounter(logging.Handler):
+    """Handler di logging che conta i record di livello ERROR per logger."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record):
+        LOG_ERRORS.inc(logger=record.name)
+
+def log_summary(logger):
+    """Riepilogo nel log: tempo totale e medio per stadio."""
+    for (stage, collection), (_, total, count) in sorted(STAGE_SECONDS.samples().items()):
+        logger.info(f"Stadio {stage}{f' ({collection})' if collection else ''}: {count} esecuzioni, {total:.2f} secondi totali, "
+                    f"{total / count:.3f} secondi in media")
+
+def push(job, url=METRICS_PUSHGATEWAY_URL, timeout=10):
+    """Invio di tutte le metriche a un Pushgateway (sostituisce quelle del `job`); nessuna azione senza URL."""
+    if not url:
+        return False
+    request = urllib.request.Request(f"{url.rstrip('/')}/metrics/job/{job}", data=registry.render().encode('utf-8'),
+                                     method="PUT", headers={"Content-Type": CONTENT_TYPE})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout):
+            return True
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"Invio delle metriche al Pushgateway non riuscito: {e}")
+        return False